@@ -5,10 +5,9 @@ sys.path.append("..")
 import ipython_glmol
 
 
-pdb_lines = urllib2.urlopen("http://www.rcsb.org/pdb/files/1sfc.pdb").readlines()
-pdb_lines = [l.strip() for l in pdb_lines if l.startswith("ATOM")]
+from ipython_glmol.pdb_reader import read_embed
 
-full_embed = full_embed = ipython_glmol.PDBEmbed("\n".join(pdb_lines + [""]))
+full_embed = read_embed(urllib2.urlopen("http://www.rcsb.org/pdb/files/1sfc.pdb"), record_types = ("ATOM",))
 full_embed.repr_entries["sphere"].append("all; bb")
 full_embed.repr_entries["line"].append("all")
 
@@ -1,7 +1,10 @@
-from .glmol_embed import (PDBEmbed, glmol_source_library)
+from .glmol_embed import (PDBEmbed, glmol_library_url, glmol_source_library)
 from .display_hooks import setup_display_hooks
 from .test_data import (test_repr_data, test_pdb_data)
-from .glmol_repr import Sphere, Line, Ribbon, Stick, ResidueSpectrum, Color
+from .glmol_repr import Sphere, Line, Ribbon, Stick, ResidueSpectrum, Color, PropertyColor
+from .trajectory import TrajectoryEmbed
+from .embed_grid import EmbedGrid
+from .repr_plan import ReprPlan, repr_plan
 
 import glmol_embed
 setup_display_hooks()
@@ -0,0 +1,253 @@
+import logging
+logger = logging.getLogger("ipython_glmol.atom_table")
+
+import numpy
+
+atom_dtype = numpy.dtype([
+    ("serial", numpy.int32),
+    ("name", "S4"),
+    ("altloc", "S1"),
+    ("resn", "S3"),
+    ("chain", "S1"),
+    ("resi", numpy.int32),
+    ("icode", "S1"),
+    ("xyz", numpy.float32, 3),
+    ("occupancy", numpy.float32),
+    ("b", numpy.float32),
+    ("elem", "S2"),
+    ("hetflag", numpy.bool_),
+    ("residue_number", numpy.int32),
+    ("chain_number", numpy.int32),
+    ])
+
+ss_record_dtype = numpy.dtype([
+    ("type", "S1"),
+    ("chain", "S1"),
+    ("start", numpy.int32),
+    ("end", numpy.int32),
+    ])
+
+# (field, start column, end column) of PDB ATOM/HETATM records, zero-indexed
+pdb_atom_columns = [
+    ("serial", 6, 11),
+    ("name", 12, 16),
+    ("altloc", 16, 17),
+    ("resn", 17, 20),
+    ("chain", 21, 22),
+    ("resi", 22, 26),
+    ("icode", 26, 27),
+    ("x", 30, 38),
+    ("y", 38, 46),
+    ("z", 46, 54),
+    ("occupancy", 54, 60),
+    ("b", 60, 66),
+    ("elem", 76, 78),
+    ]
+
+def _record_lines(pdb_string, record_types):
+    if isinstance(pdb_string, unicode):
+        pdb_string = pdb_string.encode("ascii")
+
+    return [l for l in pdb_string.splitlines() if l.startswith(record_types)]
+
+def _column_chars(lines, width = 80):
+    """Fixed width character array, shape (len(lines), width), of the given lines."""
+    if not lines:
+        return numpy.zeros((0, width), dtype="S1")
+
+    return numpy.array(lines, dtype="S%i" % width).view("S1").reshape((len(lines), width))
+
+def _column(chars, start, end):
+    """Extract column chars[:, start:end] as fixed width string array."""
+    return numpy.ascontiguousarray(chars[:, start:end]).view("S%i" % (end - start)).ravel()
+
+def _column_float(column, default = 0.0):
+    column = numpy.char.strip(column)
+    result = numpy.empty(len(column), dtype=numpy.float32)
+    blank = column == ""
+    result[blank] = default
+    result[~blank] = column[~blank].astype(numpy.float32)
+    return result
+
+_hybrid36_upper = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_hybrid36_lower = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def hybrid36_int(value):
+    """Integer value of a decimal or hybrid-36 encoded fixed width field.
+
+    Hybrid-36 fields, written by PDB writers past 99999 atoms or 9999
+    residues, continue with upper case base 36 values starting at 'A000...'
+    followed by lower case values starting at 'a000...'.
+    """
+    value = value.strip()
+    if not value or value.lstrip("-").isdigit():
+        return int(value)
+
+    width = len(value)
+    if value[0] in _hybrid36_upper[10:] and all(c in _hybrid36_upper for c in value):
+        return int(value, 36) - 10 * 36 ** (width - 1) + 10 ** width
+    if value[0] in _hybrid36_lower[10:] and all(c in _hybrid36_lower for c in value):
+        return int(value, 36) - 10 * 36 ** (width - 1) + 10 ** width + 26 * 36 ** (width - 1)
+
+    raise ValueError("Invalid hybrid-36 value: %r" % value)
+
+def _column_int(column, default = 0):
+    column = numpy.char.strip(column)
+    result = numpy.empty(len(column), dtype=numpy.int32)
+    blank = column == ""
+    result[blank] = default
+
+    try:
+        result[~blank] = column[~blank].astype(numpy.int32)
+    except ValueError:
+        # Hybrid-36 values, decoded once per distinct value
+        values, inverse = numpy.unique(column[~blank], return_inverse = True)
+        result[~blank] = numpy.array([hybrid36_int(v) for v in values.tolist()], dtype=numpy.int32)[inverse]
+
+    return result
+
+def _change_index(*columns):
+    """Running index, incremented at each change in any of the given columns."""
+    if len(columns[0]) == 0:
+        return numpy.zeros(0, dtype=numpy.int32)
+
+    changes = numpy.zeros(len(columns[0]), dtype=bool)
+    for c in columns:
+        changes[1:] |= c[1:] != c[:-1]
+
+    return numpy.cumsum(changes, dtype=numpy.int32)
+
+def atom_table_from_lines(lines):
+    """Build atom table from iterable of PDB ATOM/HETATM record lines."""
+    lines = list(lines)
+    chars = _column_chars([l.rstrip("\r\n") for l in lines])
+    columns = dict((f, _column(chars, start, end)) for f, start, end in pdb_atom_columns)
+
+    atoms = numpy.zeros(len(lines), dtype=atom_dtype)
+
+    atoms["serial"] = _column_int(columns["serial"])
+    atoms["name"] = numpy.char.strip(columns["name"])
+    atoms["altloc"] = columns["altloc"]
+    atoms["resn"] = numpy.char.strip(columns["resn"])
+    atoms["chain"] = columns["chain"]
+    atoms["resi"] = _column_int(columns["resi"])
+    atoms["icode"] = columns["icode"]
+    atoms["xyz"][:, 0] = _column_float(columns["x"])
+    atoms["xyz"][:, 1] = _column_float(columns["y"])
+    atoms["xyz"][:, 2] = _column_float(columns["z"])
+    atoms["occupancy"] = _column_float(columns["occupancy"], 1.0)
+    atoms["b"] = _column_float(columns["b"])
+    atoms["hetflag"] = _column(chars, 0, 6) == "HETATM"
+
+    # Infer missing elements from atom name, as in GLmol
+    elem = numpy.char.strip(columns["elem"])
+    missing_elem = elem == ""
+    elem[missing_elem] = numpy.char.strip(_column(chars, 12, 14)[missing_elem])
+    atoms["elem"] = elem
+
+    atoms["residue_number"] = _change_index(atoms["chain"], atoms["resi"], atoms["icode"])
+    atoms["chain_number"] = _change_index(atoms["chain"])
+
+    return atoms
+
+def parse_pdb_atoms(pdb_string):
+    """Parse ATOM and HETATM records of the given pdb string.
+
+    returns - Atom structured array:
+            array(num_atoms, atom_dtype)
+    """
+    return atom_table_from_lines(_record_lines(pdb_string, ("ATOM", "HETATM")))
+
+def parse_pdb_secondary_structure(pdb_string):
+    """Parse HELIX and SHEET records of the given pdb string.
+
+    returns - Secondary structure record structured array:
+            array(num_records, [("type", "chain", "start", "end")])
+    """
+
+    records = []
+    for l in _record_lines(pdb_string, ("HELIX", "SHEET")):
+        if l.startswith("HELIX"):
+            records.append(("h", l[19:20], hybrid36_int(l[21:25]), hybrid36_int(l[33:37])))
+        else:
+            records.append(("s", l[21:22], hybrid36_int(l[22:26]), hybrid36_int(l[33:37])))
+
+    return numpy.array(records, dtype=ss_record_dtype)
+
+def _residue_keys(chain_codes, resi, resi_min, resi_span):
+    return chain_codes.astype(numpy.int64) * resi_span + (resi.astype(numpy.int64) - resi_min)
+
+def assign_secondary_structure(atoms, ss_records):
+    """Per-atom secondary structure assignment from the given ss records.
+
+    Atoms are sorted by (chain, resi) key and each record is located by
+    binary search, assigning the contiguous range of atoms it spans.
+
+    returns - (ss, ssbegin, ssend), ss is "c", "h" or "s" per atom.
+    """
+
+    ss = numpy.empty(len(atoms), dtype="S1")
+    ss[:] = "c"
+    ssbegin = numpy.zeros(len(atoms), dtype=bool)
+    ssend = numpy.zeros(len(atoms), dtype=bool)
+
+    if not len(atoms) or not len(ss_records):
+        return ss, ssbegin, ssend
+
+    chains, atom_chains = numpy.unique(atoms["chain"], return_inverse=True)
+    record_chains = numpy.minimum(numpy.searchsorted(chains, ss_records["chain"]), len(chains) - 1)
+    known_chain = chains[record_chains] == ss_records["chain"]
+    records = ss_records[known_chain]
+    record_chains = record_chains[known_chain]
+    if not len(records):
+        return ss, ssbegin, ssend
+
+    resi_min = min(atoms["resi"].min(), records["start"].min(), records["end"].min())
+    resi_max = max(atoms["resi"].max(), records["start"].max(), records["end"].max())
+    resi_span = int(resi_max) - int(resi_min) + 1
+
+    keys = _residue_keys(atom_chains, atoms["resi"], resi_min, resi_span)
+    order = numpy.argsort(keys, kind="mergesort")
+    sorted_keys = keys[order]
+
+    start_keys = _residue_keys(record_chains, records["start"], resi_min, resi_span)
+    end_keys = _residue_keys(record_chains, records["end"], resi_min, resi_span)
+    starts = numpy.searchsorted(sorted_keys, start_keys, "left")
+    start_ends = numpy.searchsorted(sorted_keys, start_keys, "right")
+    end_starts = numpy.searchsorted(sorted_keys, end_keys, "left")
+    ends = numpy.searchsorted(sorted_keys, end_keys, "right")
+
+    sorted_ss = ss[order]
+    sorted_begin = ssbegin[order]
+    sorted_end = ssend[order]
+
+    # Sheets then helices, matching GLmol precedence.
+    for ss_type in ("s", "h"):
+        for i in numpy.flatnonzero(records["type"] == ss_type):
+            sorted_ss[starts[i]:ends[i]] = ss_type
+            sorted_begin[starts[i]:start_ends[i]] = True
+            sorted_end[end_starts[i]:ends[i]] = True
+
+    ss[order] = sorted_ss
+    ssbegin[order] = sorted_begin
+    ssend[order] = sorted_end
+
+    return ss, ssbegin, ssend
+
+_pdb_atom_format = "%-6s%5i %-4s%1s%3s %1s%4i%1s   %8.3f%8.3f%8.3f%6.2f%6.2f          %2s"
+
+def format_pdb_atoms(atoms):
+    """Format atom table as pdb ATOM/HETATM records."""
+
+    names = [
+        " %-3s" % n if len(n) < 4 and len(e) == 1 else n
+        for n, e in zip(atoms["name"].tolist(), atoms["elem"].tolist())]
+    records = numpy.where(atoms["hetflag"], "HETATM", "ATOM").tolist()
+    xyz = atoms["xyz"].tolist()
+
+    return "\n".join(
+        _pdb_atom_format % (r, serial % 100000, n, altloc, resn, chain, resi % 10000, icode, x, y, z, occupancy, b, elem)
+        for r, serial, n, altloc, resn, chain, resi, icode, (x, y, z), occupancy, b, elem in zip(
+            records, atoms["serial"].tolist(), names, atoms["altloc"].tolist(), atoms["resn"].tolist(),
+            atoms["chain"].tolist(), atoms["resi"].tolist(), atoms["icode"].tolist(), xyz,
+            atoms["occupancy"].tolist(), atoms["b"].tolist(), atoms["elem"].tolist()))
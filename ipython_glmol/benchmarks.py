@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+"""Microbenchmarks of embed generation components.
+
+Benchmarks run on synthetic structures at several scales, reporting
+timings, payload sizes and the scaling exponent of each timing.
+
+    python -m ipython_glmol.benchmarks [--sizes 1000 10000] [--output results.jsonl] [benchmarks]
+"""
+import logging
+logger = logging.getLogger("ipython_glmol.benchmarks")
+
+import sys
+import time
+import json
+import timeit
+import platform
+import argparse
+
+import numpy
+
+default_sizes = (1000, 10000, 100000, 1000000)
+
+synthetic_atom_names = ("N", "CA", "C", "O", "CB", "CG", "CD", "CE")
+synthetic_residues_per_chain = 1000
+synthetic_chain_spacing = 50.0
+
+# Library url used in place of the installed library, benchmarks do not
+# measure library installation.
+benchmark_library_url = "GLmol.js"
+
+def _reference_extract_character_spans(string):
+    """Initial list-based extract_character_spans, retained as benchmark baseline."""
+    string = numpy.fromstring(string, "S1")
+    char_edges = list(numpy.flatnonzero(string[1:] != string[:-1]) + 1)
+
+    return numpy.array([(string[start], start, end) for start, end in zip([0] + char_edges, char_edges + [len(string)])], dtype=[("type", "S1"), ("start", int), ("end", int)])
+
+def random_ss_sequence(length, mean_span = 8, seed = 0):
+    """Random secondary structure sequence with geometrically distributed span lengths."""
+    random = numpy.random.RandomState(seed)
+    span_lengths = random.geometric(1.0 / mean_span, size = length // mean_span * 2 + 1)
+    span_types = random.choice(numpy.array(list("HEL")), size = len(span_lengths))
+
+    return "".join(numpy.repeat(span_types, span_lengths))[:length]
+
+_synthetic_structures = {}
+
+def synthetic_structure(n_atoms, seed = 0):
+    """Synthetic protein-like pdb string of n_atoms atoms.
+
+    Chains of synthetic_residues_per_chain residues with len(synthetic_atom_names)
+    atoms each follow a random walk, with HELIX and SHEET records from
+    random_ss_sequence. Structures are cached by size and seed.
+
+    returns - (pdb_string, ss_sequence), ss_sequence has one character per residue.
+    """
+    from .atom_table import atom_dtype, format_pdb_atoms
+    from .display_hooks import extract_character_spans
+
+    if (n_atoms, seed) in _synthetic_structures:
+        return _synthetic_structures[(n_atoms, seed)]
+
+    random = numpy.random.RandomState(seed)
+    atoms_per_residue = len(synthetic_atom_names)
+    index = numpy.arange(n_atoms)
+    residue_number = index // atoms_per_residue
+    chain_number = residue_number // synthetic_residues_per_chain
+    n_residues = residue_number[-1] + 1 if n_atoms else 0
+
+    atoms = numpy.zeros(n_atoms, dtype=atom_dtype)
+    # Wrap serials to the 5 column PDB field, as PDB writers do past 99999 atoms
+    atoms["serial"] = index % 99999 + 1
+    atoms["name"] = numpy.array(synthetic_atom_names)[index % atoms_per_residue]
+    atoms["elem"] = numpy.char.ljust(atoms["name"], 1).astype("S1")
+    atoms["resn"] = "ALA"
+    atoms["chain"] = numpy.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))[chain_number % 26]
+    atoms["resi"] = residue_number % synthetic_residues_per_chain + 1
+    atoms["altloc"] = " "
+    atoms["icode"] = " "
+    atoms["occupancy"] = 1.0
+    atoms["b"] = random.uniform(0, 100, n_atoms)
+    # Random walk per chain, chains on a cubic lattice keeping coordinates within the PDB columns
+    xyz = numpy.cumsum(random.normal(0, .9, (n_atoms, 3)), axis=0)
+    xyz -= xyz[numpy.searchsorted(chain_number, chain_number)]
+    n_chains = chain_number[-1] + 1 if n_atoms else 0
+    lattice_size = int(numpy.ceil(n_chains ** (1. / 3))) if n_atoms else 1
+    xyz += numpy.stack(numpy.unravel_index(chain_number, (lattice_size,) * 3), axis=1) * synthetic_chain_spacing
+    atoms["xyz"] = xyz
+
+    ss_sequence = random_ss_sequence(n_residues, seed = seed)
+
+    ss_records = []
+    for chain in range(chain_number[-1] + 1 if n_atoms else 0):
+        chain_id = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[chain % 26]
+        chain_start = chain * synthetic_residues_per_chain
+        chain_ss = ss_sequence[chain_start:chain_start + synthetic_residues_per_chain]
+        for ss_type, start, end in extract_character_spans(chain_ss):
+            if ss_type == "H":
+                ss_records.append("HELIX  %3i %3i ALA %1s %4i  ALA %1s %4i" % (
+                    len(ss_records) % 1000, len(ss_records) % 1000, chain_id, start + 1, chain_id, end))
+            elif ss_type == "E":
+                ss_records.append("SHEET  %3i %3s%2i ALA %1s%4i  ALA %1s%4i" % (
+                    1, "A", 1, chain_id, start + 1, chain_id, end))
+
+    pdb_string = "\n".join(ss_records + [format_pdb_atoms(atoms)])
+    _synthetic_structures[(n_atoms, seed)] = pdb_string, ss_sequence
+
+    return pdb_string, ss_sequence
+
+def best_time(function, repeat = 3, number = None):
+    """Best per-call time in seconds of function, as in timeit."""
+    timer = timeit.Timer(function)
+    if number is None:
+        number = 1
+        while timer.timeit(number) < .05:
+            number *= 4
+
+    return min(timer.repeat(repeat = repeat, number = number)) / number
+
+def benchmark_ss_spans(sizes = default_sizes):
+    """Time span extraction and ss repr generation against the reference implementation.
+
+    sizes - Atom counts, ss sequences have one character per synthetic residue.
+    """
+    from .display_hooks import extract_character_spans, ss_repr_entries
+
+    results = []
+    for size in sizes:
+        ss_sequence = random_ss_sequence(max(size // len(synthetic_atom_names), 1))
+        results.append(dict(
+            name = "ss_spans",
+            size = size,
+            reference_spans = best_time(lambda: _reference_extract_character_spans(ss_sequence)),
+            extract_character_spans = best_time(lambda: extract_character_spans(ss_sequence)),
+            ss_repr_entries = best_time(lambda: [r.selector.glmol_selection_string for r in ss_repr_entries(ss_sequence)]),
+            ss_repr_entries_combined = best_time(lambda: [r.selector.glmol_selection_string for r in ss_repr_entries(ss_sequence, combined = True)]),
+            ))
+
+    return results
+
+def benchmark_embed(sizes = default_sizes):
+    """Time embed construction, repr and payload generation, and record payload sizes.
+
+    pack_atom_table times the binary payload, including secondary structure
+    assignment of the synthetic HELIX and SHEET records.
+    """
+    from .glmol_embed import PDBEmbed, notebook_js
+    from .transport import pack_atom_table
+    from .glmol_repr import Ribbon, Stick
+    from .glmol_selectors import Chain, Heavyatom
+    from .display_hooks import ss_repr_entries
+
+    results = []
+    for size in sizes:
+        pdb_string, ss_sequence = synthetic_structure(size)
+        modifiers = [Ribbon(), Stick(Chain["A"] + Heavyatom())] + ss_repr_entries(ss_sequence)
+
+        def build_embed(transport = "text"):
+            embed = PDBEmbed(pdb_string, transport = transport)
+            embed += modifiers
+            return embed
+
+        text_embed = build_embed()
+        text_embed.atom_table
+        binary_embed = build_embed("binary")
+        binary_embed.atom_table
+
+        repr_javascript = lambda embed: notebook_js(embed.embed_js("glmol_benchmark"), benchmark_library_url)
+        dump_html = lambda embed: embed.dump_html(benchmark_library_url)
+
+        results.append(dict(
+            name = "embed",
+            size = size,
+            construct = best_time(build_embed),
+            parse_atom_table = best_time(lambda: PDBEmbed(pdb_string).atom_table),
+            repr_string = best_time(lambda: text_embed.repr_string),
+            repr_javascript_text = best_time(lambda: repr_javascript(text_embed)),
+            repr_javascript_binary = best_time(lambda: repr_javascript(binary_embed)),
+            pack_atom_table = best_time(lambda: pack_atom_table(binary_embed.atom_table, ss_records = binary_embed.ss_records)),
+            dump_html = best_time(lambda: dump_html(text_embed)),
+            pdb_string_bytes = len(pdb_string),
+            repr_string_bytes = len(text_embed.repr_string),
+            repr_javascript_text_bytes = len(repr_javascript(text_embed)),
+            repr_javascript_binary_bytes = len(repr_javascript(binary_embed)),
+            dump_html_bytes = len(dump_html(text_embed)),
+            ))
+
+    return results
+
+def benchmark_repr(sizes = default_sizes):
+    """Time ResidueSpectrum coloring, selector composition, and modifier stacks applied directly and as ReprPlan."""
+    from .glmol_embed import PDBEmbed
+    from .glmol_repr import ResidueSpectrum, Ribbon, Stick
+    from .glmol_selectors import ResidueNumber, Carbon, Backbone, Chain, Heavyatom
+    from .display_hooks import ss_repr_entries
+    from .repr_plan import ReprPlan, repr_plan
+
+    results = []
+    for size in sizes:
+        pdb_string, ss_sequence = synthetic_structure(size)
+        n_residues = len(ss_sequence)
+
+        random = numpy.random.RandomState(0)
+        score = random.normal(size = n_residues)
+        score[random.uniform(size = n_residues) < .01] = numpy.nan
+        residue_properties = dict(score = score, smooth_score = numpy.convolve(score, numpy.ones(25) / 25, "same"))
+
+        ranges = [slice(start, start + 4) for start in range(0, n_residues, 8)]
+
+        def compose_selectors():
+            selector = ResidueNumber[ranges] + Carbon()
+            return (selector + Backbone()).glmol_selection_string
+
+        static_stack = [Ribbon(), Stick(Chain["A"] + Heavyatom())] + ss_repr_entries(ss_sequence)
+        static_plan = ReprPlan(static_stack)
+
+        def apply_stack(stack):
+            embed = PDBEmbed(pdb_string, residue_properties)
+            embed += stack
+            return embed.repr_string
+
+        results.append(dict(
+            name = "repr",
+            size = size,
+            residue_spectrum = best_time(lambda: ResidueSpectrum("score").apply_to_embed(PDBEmbed(pdb_string, residue_properties))),
+            residue_spectrum_smooth = best_time(lambda: ResidueSpectrum("smooth_score").apply_to_embed(PDBEmbed(pdb_string, residue_properties))),
+            compose_selectors = best_time(compose_selectors),
+            modifier_stack = best_time(lambda: apply_stack(static_stack)),
+            repr_plan = best_time(lambda: apply_stack(static_plan)),
+            repr_plan_cached = best_time(lambda: apply_stack(repr_plan(static_stack))),
+            ))
+
+    return results
+
+def benchmark_spatial(sizes = default_sizes):
+    """Time spatial index construction and uncached Within and Interface selection."""
+    from .glmol_embed import PDBEmbed
+    from .selection_engine import SelectionEngine
+    from .spatial_index import CellList
+    from .glmol_selectors import Within, Interface, ResidueNumber
+
+    results = []
+    for size in sizes:
+        atoms = PDBEmbed(synthetic_structure(size)[0]).atom_table
+        chains = numpy.unique(atoms["chain"])
+
+        def select(selector):
+            return SelectionEngine(atoms).mask(selector)
+
+        result = dict(
+            name = "spatial",
+            size = size,
+            cell_list = best_time(lambda: CellList(atoms["xyz"])),
+            within = best_time(lambda: select(Within(5.0, ResidueNumber[0:7]))),
+            )
+        if len(chains) > 1:
+            result["interface"] = best_time(lambda: select(Interface(chains[0], chains[1])))
+        results.append(result)
+
+    return results
+
+benchmarks = dict(
+    embed = benchmark_embed,
+    repr = benchmark_repr,
+    ss_spans = benchmark_ss_spans,
+    spatial = benchmark_spatial,
+)
+
+def _is_size_key(key):
+    return key.endswith("_bytes")
+
+def scaling_exponents(results):
+    """Log-log slope of each timing and payload size against benchmark size.
+
+    Exponents near 1 indicate linear scaling, near 2 quadratic scaling.
+    """
+    sizes = numpy.log([r["size"] for r in results])
+    if len(results) < 2 or numpy.all(sizes == sizes[0]):
+        return {}
+
+    keys = [k for k in results[0] if not k in ("name", "size")]
+    return dict(
+        (k, numpy.polyfit(sizes, numpy.log([max(r[k], 1e-12) for r in results]), 1)[0]) for k in keys)
+
+def format_results(results):
+    """Format benchmark result dicts as text table, times in milliseconds."""
+    def format_value(k, v):
+        return "%s=%iB" % (k, v) if _is_size_key(k) else "%s=%.3fms" % (k, v * 1e3)
+
+    lines = []
+    for r in results:
+        timings = " ".join(format_value(k, v) for k, v in sorted(r.items()) if k not in ("name", "size"))
+        lines.append("%-16s %8i %s" % (r["name"], r["size"], timings))
+
+    exponents = scaling_exponents(results)
+    if exponents:
+        lines.append("%-16s %8s %s" % (results[0]["name"], "scaling", " ".join("%s=%.2f" % (k, v) for k, v in sorted(exponents.items()))))
+
+    return "\n".join(lines)
+
+def results_record(results):
+    """Json-serializable benchmark record, for tracking results over time."""
+    return dict(
+        time = time.time(),
+        host = platform.node(),
+        python = platform.python_version(),
+        numpy = numpy.__version__,
+        argv = sys.argv[1:],
+        results = results)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
+
+    parser = argparse.ArgumentParser(description='Run ipython_glmol microbenchmarks.')
+    parser.add_argument('benchmarks', type=str, nargs="*", help="Benchmarks to run, one of: %s." % ", ".join(sorted(benchmarks)))
+    parser.add_argument('--sizes', type=int, nargs="+", default=default_sizes, help="Structure sizes, in atoms.")
+    parser.add_argument('--output', type=str, default=None, help="Append json results record to output file.")
+    args = parser.parse_args()
+
+    for b in args.benchmarks:
+        if not b in benchmarks:
+            parser.error("Unknown benchmark: %s" % b)
+
+    results = []
+    for b in args.benchmarks if args.benchmarks else sorted(benchmarks):
+        logger.info("Running %s: %s", b, args.sizes)
+        benchmark_results = benchmarks[b](args.sizes)
+        print format_results(benchmark_results)
+        results.extend(benchmark_results)
+
+    if args.output:
+        with open(args.output, "a") as output:
+            output.write(json.dumps(results_record(results)) + "\n")
@@ -7,16 +7,50 @@ import numpy
 from .glmol_embed import PDBEmbed
 from .glmol_repr import Ribbon, Helix, Sheet
 from .glmol_selectors import ResidueNumber
+from . import pdb_fetch
+from . import pdb_reader
 
-import urllib2
-import tempfile
+def pdb_display(pdb_id, fetcher = None, format = "pdb", **filters):
+    """Fetch and embed pdb, see pdb_fetch.PDBFetcher and pdb_reader.filter_pdb_records."""
+    if fetcher is None:
+        fetcher = pdb_fetch.default_fetcher
 
-def pdb_display(pdb_id):
-    """Download and embed pdb."""
-    d = urllib2.urlopen("http://www.pdb.org/pdb/files/%s.pdb"% pdb_id)
-    pdb_lines = [l for l in d.readlines() if l.startswith(("ATOM", "TER", "HELIX", "SHEET"))]
+    filters.setdefault("record_types", ("ATOM", "TER", "HELIX", "SHEET"))
 
-    return PDBEmbed("\n".join(pdb_lines))
+    entry = fetcher.open(pdb_id, format)
+    try:
+        pdb_string = pdb_reader.read_pdb_string(entry, format, **filters)
+    finally:
+        entry.close()
+
+    return PDBEmbed(pdb_string)
+
+def pdb_grid_display(pdb_ids, fetcher = None, format = "pdb", connections = 8, modifier = None, columns = 3, viewer_height = "3in", **filters):
+    """Fetch entries concurrently and display as an embed grid, see pdb_display and embed_grid.EmbedGrid.
+
+    Entries failing to fetch or parse are displayed as error cells.
+
+    connections - Maximum concurrent downloads, see pdb_fetch.PDBFetcher.read_many.
+    modifier - Repr modifier applied to each embed.
+    """
+    from .embed_grid import EmbedGrid
+
+    if fetcher is None:
+        fetcher = pdb_fetch.default_fetcher
+
+    filters.setdefault("record_types", ("ATOM", "TER", "HELIX", "SHEET"))
+
+    def read_embed(entry):
+        embed = PDBEmbed(pdb_reader.read_pdb_string(entry, format, **filters))
+        if modifier is not None:
+            embed += modifier
+        return embed
+
+    results = fetcher.read_many(list(pdb_ids), read_embed, format, connections)
+
+    return EmbedGrid.from_results(results, columns = columns, viewer_height = viewer_height)
+
+span_dtype = numpy.dtype([("type", "S1"), ("start", int), ("end", int)])
 
 def extract_character_spans(string):
     """Extract all contiguous character spans from given string.
@@ -25,45 +59,40 @@ def extract_character_spans(string):
             array(num_spans, [("type", "start", "end")])
     """
 
-    if isinstance(string, basestring):
-        string = numpy.fromstring(string, "S1")
+    if isinstance(string, unicode):
+        string = string.encode("ascii")
+
+    if isinstance(string, str):
+        string = numpy.frombuffer(string, "S1")
     elif isinstance(string, numpy.ndarray) and string.dtype == numpy.dtype("S1"):
         pass
     else:
         raise ValueError("Unable to process input string: %r" % string)
 
-    char_edges = list(numpy.flatnonzero(string[1:] != string[:-1]) + 1)
+    starts = numpy.flatnonzero(numpy.diff(string.view(numpy.uint8))) + 1
+    starts = numpy.r_[0, starts] if len(string) else starts
 
-    return numpy.array([(string[start], start, end) for start, end in zip([0] + char_edges, char_edges + [len(string)])], dtype=[("type", "S1"), ("start", int), ("end", int)])
+    spans = numpy.empty(len(starts), dtype=span_dtype)
+    spans["type"] = string[starts]
+    spans["start"] = starts
+    spans["end"][:-1] = starts[1:]
+    spans["end"][-1:] = len(string)
 
-def pose_display(pose, **repr_entries):
-    """Setup embed display for rosetta.core.pose object with sensible default representation."""
-    import re
-    import cStringIO as StringIO
-    from rosetta.utility import ostream
-    import rosetta.core.scoring.dssp
+    return spans
 
-    logger.debug("pose_display\n%s\nrepr_entries\n%r", pose, repr_entries)
-    
-    sio = StringIO.StringIO()
-    pose.dump_pdb(ostream(sio))
-    pdb_string = sio.getvalue()
+def pose_display(pose, **repr_entries):
+    """Setup embed display for rosetta.core.pose object with sensible default representation.
 
-    residue_properties = {}
-    residue_properties["residue_number"] = range(pose.n_residue())
+    Pose atom table and secondary structure are memoized by pose conformation,
+    see rosetta_pose.pose_embed_data, and sent with binary transport.
+    """
+    from . import rosetta_pose
 
-    if pose.energies().energies_updated() and hasattr( pose.energies(), "residue_total_energies_array"):
-        residue_energies = pose.energies().residue_total_energies_array()
-        for n in residue_energies.dtype.names:
-            residue_properties[n] = list(residue_energies[n])
+    logger.debug("pose_display\n%s\nrepr_entries\n%r", pose, repr_entries)
 
-    embed = PDBEmbed(pdb_string, residue_properties)
+    atoms, ss_string = rosetta_pose.pose_embed_data(pose)
 
-    ss_string = pose.secstruct()
-    # Missing pose secondary structure assignment, recalculate
-    if not re.search("[^L]", ss_string):
-        logger.debug("Performing DSSP.")
-        ss_string = rosetta.core.scoring.dssp.Dssp(pose).get_dssp_secstruct()
+    embed = PDBEmbed.from_atom_table(atoms, rosetta_pose.pose_residue_properties(pose), transport = "binary")
 
     embed += ss_repr_entries( ss_string )
 
@@ -72,19 +101,34 @@ def pose_display(pose, **repr_entries):
 
     return embed
 
-def ss_repr_entries(ss_sequence):
-    """Generate repr objects for the given secondary structure sequence."""
+ss_repr_types = (("H", Helix), ("E", Sheet))
+
+def ss_repr_entries(ss_sequence, combined = False):
+    """Generate repr objects for the given secondary structure sequence.
+
+    combined - Generate a single repr object per secondary structure type,
+        selecting all spans of the type, rather than one object per span.
+    """
 
     logger.debug("ss_sequence: %s", ss_sequence)
 
     ss_spans = extract_character_spans(ss_sequence)
 
+    if combined:
+        repr_entries = []
+        for ss_type, repr_type in ss_repr_types:
+            type_spans = ss_spans[ss_spans["type"] == ss_type]
+            if len(type_spans):
+                repr_entries.append(repr_type(ResidueNumber[map(slice, type_spans["start"].tolist(), (type_spans["end"] - 1).tolist())]))
+        return repr_entries
+
+    # Span ends are exclusive, selector ranges inclusive
     repr_entries = []
     for s, start, end in ss_spans:
         if s == "H":
-            repr_entries.append( Helix(ResidueNumber[start:end]) )
+            repr_entries.append( Helix(ResidueNumber[start:end - 1]) )
         elif s == "E":
-            repr_entries.append( Sheet(ResidueNumber[start:end]) )
+            repr_entries.append( Sheet(ResidueNumber[start:end - 1]) )
 
     return repr_entries
 
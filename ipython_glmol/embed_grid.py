@@ -0,0 +1,142 @@
+"""Tiled display of several embeds in a single output, sharing one GLmol library load."""
+import logging
+logger = logging.getLogger("ipython_glmol.embed_grid")
+
+import json
+
+from IPython.display import Javascript
+
+from .glmol_embed import PDBEmbed, glmol_library_url, notebook_js
+from . import structure_registry
+from .live import LiveEmbed
+from . import live
+from . import payload_policy
+
+class EmbedGrid(object):
+    """Grid of embed viewers displayed in one output cell.
+
+    Viewers are laid out in rows of columns cells, each labeled and sized to
+    viewer_height. Failed entries, given as error message strings rather than
+    embeds, are displayed as error cells.
+
+    Embeds are copied on grid creation, adding a modifier returns a new grid
+    with the modifier applied to each embed.
+    """
+
+    def __init__(self, embeds, labels = None, columns = 3, viewer_height = "3in"):
+        embeds = list(embeds)
+        if labels is None:
+            labels = [str(i) for i in range(len(embeds))]
+        labels = list(labels)
+        if len(labels) != len(embeds):
+            raise ValueError("Invalid label count: %i for %i embeds" % (len(labels), len(embeds)))
+
+        self.labels = labels
+        self.columns = columns
+        self.viewer_height = viewer_height
+
+        self.embeds = []
+        for embed in embeds:
+            if isinstance(embed, PDBEmbed):
+                embed = embed.copy()
+                embed.viewer_height = viewer_height
+            elif not isinstance(embed, basestring):
+                raise ValueError("Invalid grid entry: %r, expected PDBEmbed or error message." % (embed,))
+            self.embeds.append(embed)
+
+    @classmethod
+    def from_results(cls, results, **kwargs):
+        """Init from pdb_fetch.PDBFetcher.read_many results of embeds, labeled by pdb id."""
+        return cls(
+            [r["error"] if r["error"] else r["result"] for r in results],
+            [r["pdb_id"] for r in results],
+            **kwargs)
+
+    def __len__(self):
+        return len(self.embeds)
+
+    @property
+    def errors(self):
+        """Failed entries, as dict of label : error message."""
+        return dict((l, e) for l, e in zip(self.labels, self.embeds) if isinstance(e, basestring))
+
+    def __add__(self, modifier):
+        """Copy of grid with modifier applied to each embed."""
+        return self.__class__(
+            [e + modifier if isinstance(e, PDBEmbed) else e for e in self.embeds],
+            self.labels, self.columns, self.viewer_height)
+
+    def generate_ids(self):
+        return [e.generate_id() if isinstance(e, PDBEmbed) else None for e in self.embeds]
+
+    def embed_js(self, embed_ids, registry = None, defer_lod = False, encode_payload = False):
+        """Javascript creating the grid and a viewer per embed, see PDBEmbed.embed_js."""
+        cells_js = []
+        for label, embed, embed_id in zip(self.labels, self.embeds, embed_ids):
+            if isinstance(embed, PDBEmbed):
+                cell_js = embed.embed_js(embed_id, registry = registry, defer_lod = defer_lod, encode_payload = encode_payload)
+            else:
+                cell_js = _error_cell_js_template % dict(error_json = json.dumps(embed))
+
+            cells_js.append(_cell_js_template % dict(label_json = json.dumps(label), cell_js = cell_js))
+
+        return _grid_js_template % dict(
+            cell_width = "%.4f%%" % (100.0 / self.columns),
+            cells_js = "".join(cells_js))
+
+    def notebook_embed_js(self, embed_ids):
+        """Notebook output javascript, loading the library once for all viewers."""
+        in_kernel = live.register_kernel_target()
+        for embed, embed_id in zip(self.embeds, embed_ids):
+            if embed_id is not None:
+                live.displayed_embeds[embed_id] = embed
+
+        output_js = notebook_js(self.embed_js(embed_ids,
+            registry = structure_registry.default_registry, defer_lod = in_kernel, encode_payload = True), glmol_library_url())
+        payload_policy.default_policy.record_output(",".join(i for i in embed_ids if i is not None), len(output_js))
+
+        return output_js
+
+    def _repr_javascript_(self):
+        return self.notebook_embed_js(self.generate_ids())
+
+    def display(self):
+        """Display grid, returning LiveEmbed handles of the viewers, None for error cells."""
+        from IPython.display import display
+
+        embed_ids = self.generate_ids()
+        display(Javascript(self.notebook_embed_js(embed_ids)))
+
+        return [LiveEmbed(e, i) if i is not None else None for e, i in zip(self.embeds, embed_ids)]
+
+    def __repr__(self):
+        return "%s(embeds = %i, errors = %i, columns = %i)" % (
+            self.__class__.__name__, len(self), len(self.errors), self.columns)
+
+_grid_js_template = """
+    var grid = $('<div style="width: 100%%; font-size: small;"></div>');
+    element.append(grid);
+    container.show();
+
+    var grid_cell = function (label)
+    {
+        var cell = $('<div style="display: inline-block; vertical-align: top; box-sizing: border-box; padding: 2px; width: %(cell_width)s;"></div>');
+        cell.append($('<div></div>').text(label));
+        var viewer_element = $('<div></div>');
+        cell.append(viewer_element);
+        grid.append(cell);
+        return viewer_element;
+    };
+    %(cells_js)s
+"""
+
+_cell_js_template = """
+    (function (element)
+    {
+    %(cell_js)s
+    })(grid_cell(%(label_json)s));
+"""
+
+_error_cell_js_template = """
+    element.append($('<pre style="color: red; white-space: pre-wrap;"></pre>').text(%(error_json)s));
+"""
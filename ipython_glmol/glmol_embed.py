@@ -1,16 +1,96 @@
 from collections import defaultdict, Iterable
+import copy
+
+import numpy
 
 import IPython
 from IPython.display import Javascript
 import uuid
 
 from .setup_js import install_ipython_js, render_js
+from .atom_table import parse_pdb_atoms, format_pdb_atoms, parse_pdb_secondary_structure, ss_record_dtype
+from .selection_engine import SelectionEngine
+from . import transport
+from . import lod
+from .lod import LevelOfDetail
+from .live import LiveEmbed
+from . import structure_registry
+from .structure_registry import structure_key
+from . import payload_policy
+from . import picking
+from .instrumentation import EmbedProfile
+from .property_colors import pack_property_colors, _property_colors_load_js_template
+from . import live
 import json
 
-glmol_source_library = install_ipython_js()
+_glmol_source_library = None
+
+def glmol_library_url():
+    """Script url of the GLmol library, installing the library on first call."""
+    global _glmol_source_library
+
+    if _glmol_source_library is None:
+        library_url = install_ipython_js()
+        if IPython.version_info[0] >= 2:
+            library_url = "/" + library_url
+        _glmol_source_library = library_url
+
+    return _glmol_source_library
+
+def glmol_source_library():
+    """Deprecated alias of glmol_library_url.
+
+    Formerly a module-level url string, installing the library on import.
+    """
+    return glmol_library_url()
+
+_library_loader_js = """
+    window.ipython_glmol = window.ipython_glmol || {viewers: {}, comms: {}};
+    if (ipython_glmol.with_library === undefined)
+    {
+        // Load the library once per page, queueing callbacks until loaded.
+        ipython_glmol.with_library = function (library_url, callback)
+        {
+            var library = ipython_glmol.library;
+            if (library && library.url == library_url)
+            {
+                if (library.loaded) { callback(); } else { library.callbacks.push(callback); }
+                return;
+            }
+
+            library = ipython_glmol.library = {url: library_url, loaded: false, callbacks: [callback]};
+            $.getScript(library_url, function ()
+            {
+                library.loaded = true;
+                var callbacks = library.callbacks;
+                library.callbacks = [];
+                for (var i = 0; i < callbacks.length; i++)
+                {
+                    try { callbacks[i](); } catch (e) { console.error(e); }
+                }
+            });
+        };
+    }
+"""
+
+_notebook_js_template = """
+    ipython_glmol.with_library(%(library_url_json)s, function ()
+    {
+    %(embed_js)s
+    });
+"""
+
+def notebook_js(embed_js, library_url = None):
+    """Wrap embed javascript for notebook display, loading the library once per page.
+
+    library_url - GLmol library url, defaults to glmol_library_url().
+    """
+    if library_url is None:
+        library_url = glmol_library_url()
 
-if IPython.version_info[0] >= 2:
-    glmol_source_library = "/" + glmol_source_library
+    return _library_loader_js + _notebook_js_template % dict(
+        library_url_json = json.dumps(library_url),
+        embed_js = embed_js)
 
 _repr_textarea_template = """
 <textarea  wrap='off' id='%(embed_id)s_rep' style='display:none;'>
@@ -30,9 +110,7 @@ _dump_html_template = """
     <body>
 
     <script src="http://code.jquery.com/jquery-1.7.2.min.js" type="text/javascript"></script>
-    <script>
-    %(glmol_library)s
-    </script>
+    %(glmol_library_script)s
 
     <div id="element"></div>
 
@@ -48,44 +126,430 @@ _dump_html_template = """
     </body>
 """
 
-_data_js_template = """
+_inline_library_script_template = """<script>
+    %(glmol_library)s
+    </script>"""
+
+_library_url_script_template = """<script src="%(library_url)s" type="text/javascript"></script>"""
+
+_encoded_payload_data_js_template = """
+    var %(embed_id)s_encoded_payload = %(payload_json)s;
+"""
+
+_pdb_data_js_template = """
     var pdb_textarea_json = %(pdb_textarea_json)s;
     element.append(pdb_textarea_json);
+"""
 
+_repr_data_js_template = """
     var repr_textarea_json = %(repr_textarea_json)s;
     element.append(repr_textarea_json);
 """
 
+_pdb_load_js_template = """
+        %(embed_id)s.loadMolecule(true);
+"""
+
+_cached_pdb_load_js_template = """
+        %(embed_id)s.loadMoleculeStr(true, %(source_js)s);
+"""
+
+_viewer_support_js = """
+    window.ipython_glmol = window.ipython_glmol || {viewers: {}, comms: {}};
+    if (ipython_glmol.define_representation === undefined)
+    {
+        // Repr types modifying atom properties, rather than drawing geometry.
+        ipython_glmol.attribute_types = ['color', 'helix', 'sheet', 'bgcolor'];
+
+        ipython_glmol.decode = function (data, type)
+        {
+            var raw = atob(data), bytes = new Uint8Array(raw.length);
+            for (var i = 0; i < raw.length; i++) { bytes[i] = raw.charCodeAt(i); }
+            return new type(bytes.buffer);
+        };
+
+        ipython_glmol.parse_repr = function (repr_string)
+        {
+            var entries = {}, lines = repr_string.split('\\n');
+            for (var i = 0; i < lines.length; i++)
+            {
+                var line = $.trim(lines[i]);
+                if (!line) { continue; }
+                var repr_type = line.split(':')[0];
+                (entries[repr_type] = entries[repr_type] || []).push(line);
+            }
+            return entries;
+        };
+
+        ipython_glmol.is_attribute = function (repr_type)
+        {
+            return $.inArray(repr_type, ipython_glmol.attribute_types) >= 0;
+        };
+
+        // Level of the coarse level-of-detail atoms shown by viewer, null once
+        // full detail is loaded. Repr and color updates are drawn on full detail.
+        ipython_glmol.coarse_level = function (viewer)
+        {
+            return viewer.lod && !viewer.lod.refined ? viewer.lod.level : null;
+        };
+
+        ipython_glmol.define_attributes = function (viewer)
+        {
+            var all = viewer.getAllAtoms(), lines = [];
+
+            // Restore source secondary structure before applying helix/sheet entries.
+            for (var i = 0; i < all.length; i++)
+            {
+                var atom = viewer.atoms[all[i]];
+                if (atom.source_ss === undefined)
+                {
+                    atom.source_ss = [atom.ss, atom.ssbegin, atom.ssend];
+                }
+                else
+                {
+                    atom.ss = atom.source_ss[0]; atom.ssbegin = atom.source_ss[1]; atom.ssend = atom.source_ss[2];
+                }
+            }
+
+            viewer.colorByChain(all, true);
+            viewer.colorByAtom(viewer.atoms.filter(viewer.propertyIsnt("elem", "C")), {});
+            if (viewer.property_colors) { ipython_glmol.apply_property_colors(viewer); }
+            if (viewer.atom_colors) { ipython_glmol.apply_atom_colors(viewer); }
+
+            for (var i = 0; i < ipython_glmol.attribute_types.length; i++)
+            {
+                lines = lines.concat(viewer.repr_entries[ipython_glmol.attribute_types[i]] || []);
+            }
+            viewer.parseRep(new THREE.Object3D(), lines.join('\\n'));
+        };
+
+        ipython_glmol.define_group = function (viewer, repr_type)
+        {
+            if (viewer.repr_groups[repr_type])
+            {
+                viewer.modelGroup.remove(viewer.repr_groups[repr_type]);
+                delete viewer.repr_groups[repr_type];
+            }
+
+            var group = new THREE.Object3D();
+            if (repr_type == 'hetatm')
+            {
+                var hetatm = viewer.getHetatms(viewer.getAllAtoms()).filter(viewer.isNotSolvent);
+                viewer.drawAtomsAsSphere(group, hetatm, viewer.sphereRadius);
+            }
+            else if (viewer.repr_entries[repr_type] && viewer.repr_entries[repr_type].length)
+            {
+                viewer.parseRep(group, viewer.repr_entries[repr_type].join('\\n'));
+            }
+
+            viewer.modelGroup.add(group);
+            viewer.repr_groups[repr_type] = group;
+        };
+
+        ipython_glmol.define_representation = function (viewer)
+        {
+            var time = new Date();
+
+            viewer.repr_groups = {};
+            ipython_glmol.define_attributes(viewer);
+
+            var geometry_time = new Date();
+            for (var repr_type in viewer.repr_entries)
+            {
+                if (!ipython_glmol.is_attribute(repr_type)) { ipython_glmol.define_group(viewer, repr_type); }
+            }
+            ipython_glmol.define_group(viewer, 'hetatm');
+
+            ipython_glmol.add_timing(viewer, 'attributes', geometry_time - time);
+            ipython_glmol.add_timing(viewer, 'geometry', new Date() - geometry_time);
+        };
+
+        ipython_glmol.rebuild_groups = function (viewer)
+        {
+            for (var repr_type in viewer.repr_groups) { ipython_glmol.define_group(viewer, repr_type); }
+        };
+
+        // Replace the given repr types, rebuilding only the affected groups.
+        ipython_glmol.update_repr = function (viewer, entries)
+        {
+            var time = new Date(), attributes_changed = false;
+
+            for (var repr_type in entries)
+            {
+                viewer.repr_entries[repr_type] = entries[repr_type];
+                attributes_changed = attributes_changed || ipython_glmol.is_attribute(repr_type);
+            }
+            if (ipython_glmol.coarse_level(viewer)) { return; }
+
+            if (attributes_changed)
+            {
+                ipython_glmol.define_attributes(viewer);
+                ipython_glmol.rebuild_groups(viewer);
+            }
+            for (var repr_type in entries)
+            {
+                if (!ipython_glmol.is_attribute(repr_type)) { ipython_glmol.define_group(viewer, repr_type); }
+            }
+
+            console.log("Updated repr in " + (new Date() - time) + "ms");
+            viewer.show();
+        };
+
+        // Color atoms from quantized property codes through the color table,
+        // codes past the table are left uncolored.
+        ipython_glmol.apply_property_colors = function (viewer)
+        {
+            var colors = viewer.property_colors, serial = colors.serial, codes = colors.codes, table = colors.table;
+            for (var i = 0; i < serial.length; i++)
+            {
+                var atom = viewer.atoms[serial[i]];
+                if (atom && codes[i] < table.length) { atom.color = table[codes[i]]; }
+            }
+        };
+
+        ipython_glmol.set_property_colors = function (viewer, data, redraw)
+        {
+            var time = new Date();
+
+            if (data)
+            {
+                var code_types = {uint8: Uint8Array, uint16: Uint16Array},
+                    serial = data.serial ? ipython_glmol.decode(data.serial, Int32Array) : viewer.property_colors.serial;
+                viewer.property_colors = {
+                    serial: serial,
+                    codes: ipython_glmol.decode(data.codes, code_types[data.code_type]),
+                    table: ipython_glmol.decode(data.table, Uint32Array)};
+            }
+            else if (viewer.property_colors)
+            {
+                // Retain serial numbers for later property colors.
+                viewer.property_colors = {serial: viewer.property_colors.serial, codes: [], table: []};
+            }
+
+            if (redraw && !ipython_glmol.coarse_level(viewer))
+            {
+                ipython_glmol.define_attributes(viewer);
+                ipython_glmol.rebuild_groups(viewer);
+                console.log("Updated property colors in " + (new Date() - time) + "ms");
+                viewer.show();
+            }
+        };
+
+        ipython_glmol.apply_atom_colors = function (viewer)
+        {
+            var serial = viewer.atom_colors.serial, colors = viewer.atom_colors.colors;
+            for (var i = 0; i < serial.length; i++)
+            {
+                if (viewer.atoms[serial[i]]) { viewer.atoms[serial[i]].color = colors[i]; }
+            }
+        };
+
+        ipython_glmol.update_atom_colors = function (viewer, serial, colors)
+        {
+            var time = new Date();
+
+            viewer.atom_colors = {serial: serial, colors: colors};
+            if (ipython_glmol.coarse_level(viewer)) { return; }
+
+            ipython_glmol.define_attributes(viewer);
+            ipython_glmol.rebuild_groups(viewer);
+
+            console.log("Updated atom colors in " + (new Date() - time) + "ms");
+            viewer.show();
+        };
+
+        // Accumulate load timings, until the viewer reports its timings.
+        ipython_glmol.add_timing = function (viewer, name, ms)
+        {
+            if (viewer.timings && !viewer.timings_posted) { viewer.timings[name] = (viewer.timings[name] || 0) + ms; }
+        };
+
+        ipython_glmol.instrument = function (viewer, start)
+        {
+            viewer.timings = {};
+            viewer.timings_posted = false;
+
+            var show = viewer.show;
+            viewer.show = function ()
+            {
+                var time = new Date(), result = show.apply(this, arguments);
+                ipython_glmol.add_timing(viewer, 'render', new Date() - time);
+                if (viewer.timings.first_frame === undefined) { viewer.timings.first_frame = new Date() - start; }
+                return result;
+            };
+        };
+
+        ipython_glmol.post_timings = function (viewer)
+        {
+            viewer.timings_posted = true;
+            console.log("Timings " + viewer.id + ": " + JSON.stringify(viewer.timings));
+
+            var data = {type: 'timings', embed_id: viewer.id, timings: viewer.timings};
+            if (ipython_glmol.comms[viewer.id])
+            {
+                ipython_glmol.comms[viewer.id].send(data);
+            }
+            else if (window.IPython && IPython.notebook && IPython.notebook.kernel)
+            {
+                IPython.notebook.kernel.comm_manager.new_comm('ipython_glmol', data);
+            }
+        };
+
+        ipython_glmol.finish_load = function (viewer, start)
+        {
+            var timings = viewer.timings;
+            timings.load = new Date() - start;
+            timings.parse = Math.max(timings.load - (timings.scene || 0) - (timings.render || 0), 0);
+            ipython_glmol.post_timings(viewer);
+        };
+
+        ipython_glmol.handlers = {
+            repr : function (viewer, data)
+            {
+                ipython_glmol.update_repr(viewer, data.entries);
+            },
+            property_colors : function (viewer, data)
+            {
+                ipython_glmol.set_property_colors(viewer, data.property_colors, true);
+            },
+            atom_colors : function (viewer, data)
+            {
+                ipython_glmol.update_atom_colors(viewer,
+                    ipython_glmol.decode(data.serial, Int32Array), ipython_glmol.decode(data.colors, Uint32Array));
+            }
+        };
+
+        ipython_glmol.show_error = function (viewer, error)
+        {
+            console.error(error);
+            $('#' + viewer.id).after(
+                $('<pre style="color: red; white-space: pre-wrap;"></pre>').text('Unable to load structure: ' + (error.message || error)));
+        };
+
+        ipython_glmol.handle_message = function (msg)
+        {
+            var data = msg.content.data, viewer = ipython_glmol.viewers[data.embed_id];
+            if (viewer && ipython_glmol.handlers[data.type]) { ipython_glmol.handlers[data.type](viewer, data); }
+        };
+
+        // Register comm of viewer id, forgetting the comm and failing its pending
+        // requests once closed by the kernel.
+        ipython_glmol.add_comm = function (embed_id, comm)
+        {
+            ipython_glmol.comms[embed_id] = comm;
+            comm.on_msg(ipython_glmol.handle_message);
+            comm.on_close(function ()
+            {
+                if (ipython_glmol.comms[embed_id] !== comm) { return; }
+                delete ipython_glmol.comms[embed_id];
+
+                var viewer = ipython_glmol.viewers[embed_id];
+                if (viewer && viewer.picking) { viewer.picking.in_flight = null; }
+                if (viewer && viewer.structure_request)
+                {
+                    var request = viewer.structure_request;
+                    delete viewer.structure_request;
+                    request.failed('The kernel closed the viewer connection, display the embed again.');
+                }
+            });
+            return comm;
+        };
+
+        // Comm for viewer requests, opened on first request if the kernel did not open one.
+        ipython_glmol.viewer_comm = function (viewer)
+        {
+            var comm = ipython_glmol.comms[viewer.id];
+            if (!comm && window.IPython && IPython.notebook && IPython.notebook.kernel)
+            {
+                comm = ipython_glmol.add_comm(viewer.id, IPython.notebook.kernel.comm_manager.new_comm(
+                    'ipython_glmol', {type: 'open', embed_id: viewer.id}));
+            }
+            return comm;
+        };
+
+        // Request the structure payload from the kernel, calling failed with
+        // an error message if no kernel is available.
+        ipython_glmol.request_structure = function (viewer, callback, failed)
+        {
+            var comm = ipython_glmol.viewer_comm(viewer);
+            if (!comm) { failed('Loading the structure requires a running kernel.'); return; }
+
+            viewer.structure_request = {callback: callback, failed: failed};
+            comm.send({type: 'structure', embed_id: viewer.id});
+        };
+
+        ipython_glmol.handlers.structure = function (viewer, data)
+        {
+            var request = viewer.structure_request;
+            delete viewer.structure_request;
+            if (!request) { return; }
+
+            if (data.error) { request.failed(data.error); } else { request.callback(data.payload); }
+        };
+
+        // Requests the kernel can not serve, such as requests for embeds it no
+        // longer holds. Fails the pending structure request and stops kernel picking.
+        ipython_glmol.handlers.error = function (viewer, data)
+        {
+            console.warn('Kernel ' + data.request + ' request failed for ' + viewer.id + ': ' + data.error);
+            if (viewer.picking)
+            {
+                viewer.picking.offline = true;
+                viewer.picking.in_flight = null;
+                viewer.picking.queue = [];
+            }
+
+            var request = viewer.structure_request;
+            delete viewer.structure_request;
+            if (request) { request.failed(data.error); }
+        };
+
+        if (window.IPython && IPython.notebook && IPython.notebook.kernel)
+        {
+            IPython.notebook.kernel.comm_manager.register_target('ipython_glmol', function (comm, msg)
+            {
+                ipython_glmol.add_comm(msg.content.data.embed_id, comm);
+            });
+        }
+    }
+"""
+
+_finish_load_js_template = """
+        ipython_glmol.finish_load(%(embed_id)s, %(embed_id)s_load_start);
+"""
+
+_show_error_js_template = """function (error) { ipython_glmol.show_error(%(embed_id)s, error); }"""
+
 _display_js_template = """
-        element.append('<div id="%(embed_id)s" style="width: auto; height:8in"></div>');
+        element.append('<div id="%(embed_id)s" style="width: auto; height:%(viewer_height)s"></div>');
 
         console.log("Created elements.");
         container.show();
 
+        var %(embed_id)s_start = new Date();
         var %(embed_id)s = new GLmol('%(embed_id)s', true);
+        ipython_glmol.instrument(%(embed_id)s, %(embed_id)s_start);
 
         console.log("Loaded GLmol as id: %(embed_id)s.");
 
         function parseAndDefineRepresentation()
           {
-              var all = this.getAllAtoms(),
-                  hetatm = this.getHetatms(all).filter(this.isNotSolvent);
-
-              this.colorByChain(all, true);
-              this.colorByAtom(this.atoms.filter(this.propertyIsnt("elem", "C")), {});
-
-              this.parseRep(this.modelGroup, $('#%(embed_id)s_rep').val());
-
-              this.drawAtomsAsSphere(this.modelGroup, hetatm, this.sphereRadius);
+              ipython_glmol.define_representation(this);
           }
 
+        %(embed_id)s.repr_entries = ipython_glmol.parse_repr($('#%(embed_id)s_rep').val());
+        ipython_glmol.viewers['%(embed_id)s'] = %(embed_id)s;
+
         %(embed_id)s.rebuildScene = function (repressDraw)
           {
               var time = new Date();
 
               this.initializeScene();
+              var define_time = new Date();
               this.defineRepresentation();
 
+              ipython_glmol.add_timing(this, 'define_representation', new Date() - define_time);
+              ipython_glmol.add_timing(this, 'scene', new Date() - time);
               console.log("Built scene in " + (new Date() - time) + "ms");
               
               if (repressDraw)
@@ -99,39 +563,241 @@ _display_js_template = """
           };
 
         %(embed_id)s.defineRepresentation = parseAndDefineRepresentation;
-        %(embed_id)s.loadMolecule(true);
+
+        var %(embed_id)s_load_start = new Date();
+        %(load_js)s
 
         $.data(element.children()[0], "glmol", %(embed_id)s);
         document.getElementById("%(embed_id)s").scrollIntoViewIfNeeded();
         
         """
     
+class ReprEntryList(list):
+    """Repr entries of one repr type, counting modifications in version."""
+
+    version = 0
+
+    def _modifier(name):
+        method = getattr(list, name)
+
+        def modify(self, *args):
+            self.version += 1
+            return method(self, *args)
+
+        modify.__name__ = name
+        return modify
+
+    for _name in ("__setitem__", "__delitem__", "__setslice__", "__delslice__", "__iadd__", "__imul__",
+            "append", "extend", "insert", "pop", "remove", "reverse", "sort"):
+        locals()[_name] = _modifier(_name)
+    del _name, _modifier
+
+class ReprEntries(defaultdict):
+    """Repr entries by repr type, storing entries as ReprEntryList.
+
+    Assigned entries are copied, later changes to the assigned list are not
+    reflected in the embed.
+    """
+
+    def __init__(self, entries = ()):
+        defaultdict.__init__(self, ReprEntryList)
+        self.update(entries)
+
+    def __setitem__(self, repr_type, entries):
+        defaultdict.__setitem__(self, repr_type, ReprEntryList(entries))
+
+    def __missing__(self, repr_type):
+        self[repr_type] = self.default_factory()
+        return self[repr_type]
+
+    def update(self, *args, **kwargs):
+        for repr_type, entries in dict(*args, **kwargs).items():
+            self[repr_type] = entries
+
+    def setdefault(self, repr_type, entries = ()):
+        if not repr_type in self:
+            self[repr_type] = entries
+        return self[repr_type]
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
 class PDBEmbed(object):
-    """Embeds pdb and repr as GLmol canvas."""
+    """Embeds pdb and repr as GLmol canvas.
 
-    def __init__(self, pdb_string, residue_properties = None):
+    transport - Coordinate transport to the viewer:
+        "text" - PDB text, parsed by GLmol in the browser.
+        "binary" - Atom table parsed in python and sent as packed typed arrays.
+    lod - Level-of-detail policy, a lod.LevelOfDetail or coarse level name.
+        Large structures are first displayed at the coarse level.
+    atom_properties - Per-atom property arrays, in atom table order.
+
+    Residue and atom properties are stored as numpy arrays, residue properties
+    are indexed by atom table residue_number. See glmol_repr.PropertyColor.
+
+    Stage timings, payload sizes and browser timings of displayed viewers are
+    recorded in profile, see timing_report.
+
+    Adding modifiers returns a new embed sharing the pdb string, residue
+    properties and parsed atom table, only repr entries are copied. In-place
+    addition modifies the embed.
+    """
+
+    transports = ("text", "binary")
+
+    # CSS height of the viewer element
+    viewer_height = "8in"
+
+    # PayloadPolicy encoding the structure payload in notebook output,
+    # defaults to payload_policy.default_policy
+    payload_policy = None
+
+    # Show atom info on hover and click, requesting atom and residue
+    # properties from the kernel, see picking.pick_response
+    picking = True
+
+    def __init__(self, pdb_string, residue_properties = None, transport = "text", lod = None, atom_properties = None):
         """Init from given pdb and residue properties."""
-        self.pdb_string = pdb_string
-        self.repr_entries = defaultdict(list)
+        # Lazily computed structure data, shared by copies
+        self._structure = {}
+        if pdb_string is not None:
+            self._structure["pdb_string"] = pdb_string
+
+        self.repr_entries = ReprEntries()
         self.residue_properties = {}
         if not residue_properties is None:
-            self.residue_properties.update( residue_properties )
+            self.residue_properties.update( (k, numpy.asarray(v)) for k, v in residue_properties.items() )
+        self.atom_properties = {}
+        if not atom_properties is None:
+            self.atom_properties.update( (k, numpy.asarray(v)) for k, v in atom_properties.items() )
+
+        # Quantized property colors, see glmol_repr.PropertyColor
+        self.property_colors = None
+
+        if not transport in self.transports:
+            raise ValueError("Invalid PDBEmbed transport: %r Available transports: %s" % (transport, self.transports))
+        self.transport = transport
+
+        if isinstance(lod, basestring):
+            lod = LevelOfDetail(lod)
+        self.lod = lod
+
+        # Serialized repr lines by repr type, as (entries, entries.version, lines)
+        self._repr_lines = {}
+
+        self.profile = EmbedProfile()
+
+    @classmethod
+    def from_atom_table(cls, atoms, residue_properties = None, pdb_string = None, **kwargs):
+        """Init from atom table, see atom_table.atom_dtype.
+
+        pdb_string - Pdb string of atoms. If None, the pdb string is formatted
+            from atoms when first used, binary transport displays do not use it.
+        """
+        embed = cls(pdb_string, residue_properties, **kwargs)
+        embed._structure["atom_table"] = atoms
+
+        return embed
+
+    @property
+    def repr_entries(self):
+        """Repr entries by repr type, see ReprEntries."""
+        return self._repr_entries
+
+    @repr_entries.setter
+    def repr_entries(self, repr_entries):
+        if not isinstance(repr_entries, ReprEntries):
+            repr_entries = ReprEntries(repr_entries)
+        self._repr_entries = repr_entries
+
+    @property
+    def pdb_string(self):
+        """Pdb string of the structure, formatted from atom_table for embeds created from an atom table."""
+        if not "pdb_string" in self._structure:
+            with self.profile.stage("format"):
+                self._structure["pdb_string"] = format_pdb_atoms(self.atom_table)
+        return self._structure["pdb_string"]
+
+    @pdb_string.setter
+    def pdb_string(self, pdb_string):
+        self._structure = dict(pdb_string = pdb_string)
+
+    @property
+    def ss_records(self):
+        """HELIX and SHEET records of the source pdb string, see atom_table.parse_pdb_secondary_structure."""
+        if not "ss_records" in self._structure:
+            if "pdb_string" in self._structure:
+                self._structure["ss_records"] = parse_pdb_secondary_structure(self._structure["pdb_string"])
+            else:
+                self._structure["ss_records"] = numpy.zeros(0, dtype=ss_record_dtype)
+        return self._structure["ss_records"]
+
+    @property
+    def atom_table(self):
+        """Atom structured array parsed from pdb_string, see atom_table.atom_dtype."""
+        if not "atom_table" in self._structure:
+            with self.profile.stage("parse"):
+                self._structure["atom_table"] = parse_pdb_atoms(self.pdb_string)
+        return self._structure["atom_table"]
+
+    @property
+    def selection_engine(self):
+        """SelectionEngine over atom_table."""
+        if not "selection_engine" in self._structure:
+            self._structure["selection_engine"] = SelectionEngine(self.atom_table)
+        return self._structure["selection_engine"]
+
+    @property
+    def atom_lookup(self):
+        """picking.AtomLookup over atom_table."""
+        if not "atom_lookup" in self._structure:
+            self._structure["atom_lookup"] = picking.AtomLookup(self.atom_table)
+        return self._structure["atom_lookup"]
+
+    def count(self, selection):
+        """Number of atoms selected by selector or selection string."""
+        return self.selection_engine.count(selection)
+
+    def validate_repr_entries(self):
+        """Repr entries selecting no atoms, as list of (repr_type, selection)."""
+        return self.selection_engine.validate_repr_entries(self.repr_entries)
+
+    def payload_sizes(self):
+        """Byte size of the coordinate payload under each transport."""
+        return transport.payload_sizes(self)
+
+    def copy(self):
+        """Copy of embed with copied repr entries, sharing structure data."""
+        embed = copy.copy(self)
+
+        embed.repr_entries = ReprEntries(self.repr_entries)
+        embed._repr_lines = {}
+        for repr_type, entries in embed.repr_entries.items():
+            lines = self._cached_repr_lines(repr_type)
+            if lines is not None:
+                embed._repr_lines[repr_type] = (entries, entries.version, lines)
+
+        embed.profile = EmbedProfile()
+
+        return embed
 
     def __add__(self, modifier):
-        ## TODO should implement correct shallow-copy semantics for embed object to suppoort
-        # immutable add
-        if isinstance(modifier, EmbedReprModifier):
-            modifier.apply_to_embed(self)
-        elif isinstance(modifier, Iterable):
-            for m in modifier:
-                m.apply_to_embed(self)
-        else:
-            raise ValueError("Invalid PDBEmbed modifier: %s", modifier)
-        
-        return self
+        """Copy of embed with modifier, or iterable of modifiers, applied."""
+        embed = self.copy()
+        embed += modifier
+        return embed
 
     def __iadd__(self, modifier):
-        return self.__add__(modifier)
+        with self.profile.stage("modifiers"):
+            if isinstance(modifier, EmbedReprModifier):
+                modifier.apply_to_embed(self)
+            elif isinstance(modifier, Iterable):
+                for m in modifier:
+                    m.apply_to_embed(self)
+            else:
+                raise ValueError("Invalid PDBEmbed modifier: %s", modifier)
+
+        return self
 
     def add_repr_entry(self, repr_type, selection):
         if isinstance(selection, basestring):
@@ -139,59 +805,264 @@ class PDBEmbed(object):
         elif selection:
             self.repr_entries[repr_type].extend(selection)
 
+    def set_repr_entries(self, repr_type, selections):
+        """Replace repr entries of the given type."""
+        self.repr_entries[repr_type] = selections
+
+    def add_repr_lines(self, repr_type, selections, lines, replace = False):
+        """Add or replace repr entries of the given type with their serialized repr lines.
+
+        lines - Repr lines of selections, as serialized by repr_string.
+        """
+        entries = self.repr_entries.get(repr_type)
+        if replace or not entries:
+            self.repr_entries[repr_type] = selections
+            entries = self.repr_entries[repr_type]
+        else:
+            cached = self._cached_repr_lines(repr_type)
+            entries.extend(selections)
+            if cached is None:
+                return
+            lines = "\n".join(l for l in (cached, lines) if l)
+
+        self._repr_lines[repr_type] = (entries, entries.version, lines)
+
+    def _cached_repr_lines(self, repr_type):
+        """Cached repr lines of repr_type, None if entries were replaced or modified since cached."""
+        entries = self.repr_entries.get(repr_type)
+        cached = self._repr_lines.get(repr_type)
+        if entries is not None and cached is not None and cached[0] is entries and cached[1] == entries.version:
+            return cached[2]
+        return None
+
     @property
     def repr_string(self):
-        repr_lines = ["%s:%s" % (repr_type, selection) for repr_type in self.repr_entries for selection in self.repr_entries[repr_type]]
-        return "\n".join(repr_lines)
+        """Repr lines of all repr entries.
+
+        Lines are cached per repr type, only repr types changed since the last
+        call are serialized.
+        """
+        with self.profile.stage("repr_serialization"):
+            repr_lines = []
+            for repr_type, entries in self.repr_entries.items():
+                lines = self._cached_repr_lines(repr_type)
+                if lines is None:
+                    lines = "\n".join("%s:%s" % (repr_type, selection) for selection in entries)
+                    self._repr_lines[repr_type] = (entries, entries.version, lines)
+                if lines:
+                    repr_lines.append(lines)
+
+            return "\n".join(repr_lines)
 
     def generate_id(self):
         return "glmol_%i" % uuid.uuid4()
 
-    def _repr_javascript_(self):
-        """docstring for _repr_javascript"""
+    def structure_payload(self):
+        """Json-serializable coordinate payload under the embed transport."""
+        if self.transport == "binary":
+            return transport.pack_atom_table(self.atom_table, ss_records = self.ss_records)
+        else:
+            return self.pdb_string
 
-        embed_id = self.generate_id()
+    def structure_payload_json(self):
+        """Json coordinate payload under the embed transport."""
+        payload = self.structure_payload()
+
+        with self.profile.stage("json_encode"):
+            payload_json = json.dumps(payload)
+
+        self.profile.record_payload("structure", len(payload_json))
+        return payload_json
+
+    def embed_js(self, embed_id, registry = None, defer_lod = False, encode_payload = False):
+        """Javascript creating data elements and viewer for the given embed id.
+
+        registry - StructureRegistry caching the structure payload in the
+            frontend, the payload is inlined if None.
+        defer_lod - Omit the full detail structure of coarse level-of-detail
+            displays, the viewer requests it from the kernel when refined.
+        encode_payload - Encode the inlined structure payload by payload_policy,
+            see PayloadPolicy.encode. Registry payloads are always encoded.
+        """
+
+        repr_string = self.repr_string
+        self.profile.record_payload("repr", len(repr_string))
 
-        pdb_textarea_json = json.dumps(
-                _pdb_textarea_template % dict(embed_id = embed_id, pdb_string = self.pdb_string))
+        with self.profile.stage("json_encode"):
+            repr_textarea_json = json.dumps(
+                    _repr_textarea_template % dict(embed_id = embed_id, repr_string = repr_string))
+        repr_data_js = _repr_data_js_template % dict(repr_textarea_json = repr_textarea_json)
 
-        repr_textarea_json = json.dumps(
-                _repr_textarea_template % dict(embed_id = embed_id, repr_string = self.repr_string))
+        coarse = self.lod is not None and self.lod.is_coarse(self.atom_table)
 
-        display_js = \
-            _data_js_template % dict(
+        # Structure load javascript is wrapped by payload_template if the
+        # payload, bound to payload_js, is resolved asynchronously.
+        payload_js = "%s_payload" % embed_id
+        payload_template = None
+        source_js = None
+
+        if coarse and defer_lod:
+            data_js = repr_data_js
+            payload_template = lod._lod_deferred_payload_js_template
+        elif registry is not None or encode_payload:
+            key = structure_key(self)
+            policy = self.payload_policy if self.payload_policy is not None else payload_policy.default_policy
+
+            def encoded_payload_json():
+                encoded = policy.encode(key, self.structure_payload_json())
+                self.profile.record_payload("structure_output", len(encoded))
+                return encoded
+
+            if registry is not None:
+                structure_js, source_js = registry.structure_js(key, encoded_payload_json)
+            else:
+                structure_js = _encoded_payload_data_js_template % dict(
+                    embed_id = embed_id, payload_json = encoded_payload_json())
+                source_js = "%s_encoded_payload" % embed_id
+            data_js = payload_policy._payload_support_js + structure_js + repr_data_js
+            payload_template = payload_policy._payload_load_js_template
+        elif self.transport == "binary":
+            data_js = \
+                transport._atom_table_data_js_template % dict(
+                    embed_id = embed_id,
+                    atom_table_json = self.structure_payload_json()) + \
+                repr_data_js
+        else:
+            with self.profile.stage("json_encode"):
+                pdb_textarea_json = json.dumps(
+                        _pdb_textarea_template % dict(embed_id = embed_id, pdb_string = self.pdb_string))
+            self.profile.record_payload("structure", len(pdb_textarea_json))
+
+            data_js = \
+                _pdb_data_js_template % dict(
+                    pdb_textarea_json = pdb_textarea_json) + \
+                repr_data_js
+
+        if self.transport == "binary" or coarse:
+            data_js = transport._atom_table_loader_js + data_js
+
+        if self.transport == "binary":
+            load_js = transport._atom_table_load_js_template % dict(
                 embed_id = embed_id,
-                pdb_textarea_json = pdb_textarea_json,
-                repr_textarea_json = repr_textarea_json) + \
-            _display_js_template % dict(embed_id = embed_id)
+                table_js = payload_js if payload_template else "%s_atom_table" % embed_id)
+        elif payload_template:
+            load_js = _cached_pdb_load_js_template % dict(embed_id = embed_id, source_js = payload_js)
+        else:
+            load_js = _pdb_load_js_template % dict(embed_id = embed_id)
 
-        return Javascript(display_js, lib = glmol_source_library)._repr_javascript_()
 
-    def dump_html(self):
-        """Create minimal html page for the given representation."""
+        # Timings are posted once the initial display, the coarse level of
+        # coarse displays, is loaded.
+        finish_load_js = _finish_load_js_template % dict(embed_id = embed_id)
 
-        embed_id = "glmol"
+        if coarse:
+            load_js = lod._lod_loaded_js_template % dict(load_js = load_js)
+        else:
+            load_js += finish_load_js
 
-        pdb_textarea_json = json.dumps(
-                _pdb_textarea_template % dict(embed_id = embed_id, pdb_string = self.pdb_string))
+        if payload_template:
+            load_js = payload_template % dict(embed_id = embed_id, source_js = source_js, load_js = load_js,
+                failed_js = "failed" if coarse else _show_error_js_template % dict(embed_id = embed_id))
 
-        repr_textarea_json = json.dumps(
-                _repr_textarea_template % dict(embed_id = embed_id, repr_string = self.repr_string))
+        if coarse:
+            lod_data = self.lod.lod_data(self.atom_table)
+            with self.profile.stage("json_encode"):
+                lod_json = json.dumps(lod_data)
+            self.profile.record_payload("lod", len(lod_json))
 
-        embed_js = \
-            _data_js_template % dict(
+            data_js = lod._lod_support_js + data_js
+            load_js = lod._lod_load_js_template % dict(
                 embed_id = embed_id,
-                pdb_textarea_json = pdb_textarea_json,
-                repr_textarea_json = repr_textarea_json) + \
-            _display_js_template % dict(embed_id = embed_id)
+                lod_json = lod_json,
+                full_load_js = load_js) + finish_load_js
+
+        # Property colors are set once on display, ahead of coarse and
+        # asynchronous loads, and applied when the full structure is drawn.
+        if self.property_colors is not None:
+            with self.profile.stage("json_encode"):
+                property_colors_json = json.dumps(pack_property_colors(self.property_colors, self.atom_table))
+            self.profile.record_payload("property_colors", len(property_colors_json))
+
+            load_js = _property_colors_load_js_template % dict(
+                embed_id = embed_id, property_colors_json = property_colors_json) + load_js
+
+        if self.picking:
+            data_js = picking._picking_support_js + data_js
+            load_js = picking._enable_picking_js_template % dict(embed_id = embed_id) + load_js
+
+        return _viewer_support_js + data_js + _display_js_template % dict(
+            embed_id = embed_id, load_js = load_js, viewer_height = self.viewer_height)
 
-        glmol_library = render_js()
+    def notebook_embed_js(self, embed_id, **embed_js_kwargs):
+        """Notebook output javascript for the given embed id, see notebook_js.
+
+        Registers the embed to receive browser timings from the displayed viewer.
+        Full detail of coarse level-of-detail displays is served by the kernel,
+        if running in a kernel.
+
+        The structure payload is inlined in the output, encoded by payload_policy,
+        unless structure_registry.default_registry is set.
+        """
+        in_kernel = live.register_kernel_target()
+        live.displayed_embeds[embed_id] = self
+        embed_js_kwargs.setdefault("defer_lod", in_kernel)
+
+        with self.profile.stage("library_install"):
+            library_url = glmol_library_url()
+
+        with self.profile.stage("embed_js"):
+            output_js = notebook_js(self.embed_js(embed_id,
+                registry = structure_registry.default_registry, encode_payload = True, **embed_js_kwargs), library_url)
+
+        self.profile.record_payload("javascript", len(output_js))
+        policy = self.payload_policy if self.payload_policy is not None else payload_policy.default_policy
+        policy.record_output(embed_id, len(output_js))
+
+        return output_js
+
+    def timing_report(self):
+        """Structured report of stage timings and payload sizes, see EmbedProfile.report."""
+        return self.profile.report()
+
+    def _repr_javascript_(self):
+        """docstring for _repr_javascript"""
+
+        embed_id = self.generate_id()
+
+        return self.notebook_embed_js(embed_id)
+
+    def display(self):
+        """Display embed, returning a LiveEmbed handle to update the displayed viewer."""
+        from IPython.display import display
+
+        embed_id = self.generate_id()
+        display(Javascript(self.notebook_embed_js(embed_id)))
+
+        return LiveEmbed(self, embed_id)
+
+    def dump_html(self, library_url = None):
+        """Create minimal html page for the given representation.
+
+        library_url - Url of a shared GLmol library script, see
+            html_export.write_library_asset. The library is inlined if None.
+        """
+
+        embed_js = self.embed_js("glmol")
+
+        if library_url is None:
+            glmol_library_script = _inline_library_script_template % dict(glmol_library = render_js())
+        else:
+            glmol_library_script = _library_url_script_template % dict(library_url = library_url)
     
         return _dump_html_template % dict(
                 embed_js = embed_js,
-                glmol_library=glmol_library)
+                glmol_library_script = glmol_library_script)
     
 class EmbedReprModifier(object):
+    # True if the repr entries added by the modifier do not depend on the embed
+    # structure or properties, see repr_plan.ReprPlan
+    structure_invariant = False
+
     def __add__(self, modifier):
         assert isinstance(modifier, EmbedReprModifier)
         return CompositeReprModifier([self, modifier])
@@ -1,16 +1,21 @@
 from abc import abstractproperty, ABCMeta
 
+import numpy
+
 from .glmol_embed import EmbedReprModifier
-from .glmol_selectors import GLMolSelector, GLMolSubSelector, All, ResidueNumber
+from .glmol_selectors import GLMolSelector, GLMolSubSelector, SpatialSelector, All, ResidueNumber
+from .property_colors import resolve_colormap, colormap_table, atom_codes
 
 class Clear(EmbedReprModifier):
     clear_types = ("ribbon", "stick", "line", "sphere")
+    structure_invariant = True
+
     def __init__(self):
         pass
 
     def apply_to_embed(self, embed):
         for t in self.clear_types:
-            embed.repr_entries[t] = []
+            embed.set_repr_entries(t, [])
 
 class SimpleReprModifier(EmbedReprModifier):
     def __init__(self, selector = All() ):
@@ -20,11 +25,15 @@ class SimpleReprModifier(EmbedReprModifier):
         else:
             self.selector = selector
 
+    @property
+    def structure_invariant(self):
+        return not isinstance(self.selector, SpatialSelector)
+
     def apply_to_embed(self, embed):
         if self.selector is None:
-            embed.repr_entries[self.repr_type] = []
+            embed.set_repr_entries(self.repr_type, [])
         else:
-            embed.add_repr_entry(self.repr_type, self.selector.glmol_selection_string)
+            embed.add_repr_entry(self.repr_type, self.selector.selection_string(embed))
 
     @property
     def repr_type(self):
@@ -52,6 +61,8 @@ class Helix(SimpleReprModifier):
     pass
 
 class BackgroundColor(EmbedReprModifier):
+    structure_invariant = True
+
     def __init__(self, color):
         self.color = color
 
@@ -65,12 +76,80 @@ class Color(EmbedReprModifier):
         assert isinstance(selector, (GLMolSelector, GLMolSubSelector))
         self.selector = selector if isinstance(selector, GLMolSelector) else All() + selector
 
+    @property
+    def structure_invariant(self):
+        return not isinstance(self.selector, SpatialSelector)
+
     def apply_to_embed(self, embed):
-        color_selector = "%s:%s" % (self.color, self.selector.glmol_selection_string)
+        color_selector = "%s:%s" % (self.color, self.selector.selection_string(embed))
         embed.add_repr_entry("color", color_selector)
 
+def color_runs(color_index):
+    """Group contiguous runs of equal values in color_index by value.
+
+    returns - [(color, [(start, end), ...]), ...], with inclusive run ends,
+        matching selector slice ranges, see GLMolTypeSelector.selection_to_string.
+    """
+    color_index = numpy.asarray(color_index)
+    if len(color_index) == 0:
+        return []
+
+    starts = numpy.flatnonzero(numpy.diff(color_index)) + 1
+    starts = numpy.r_[0, starts]
+    ends = numpy.r_[starts[1:], len(color_index)] - 1
+    run_colors = color_index[starts]
+
+    order = numpy.argsort(run_colors, kind="mergesort")
+    group_starts = numpy.r_[0, numpy.flatnonzero(numpy.diff(run_colors[order])) + 1]
+    group_ends = numpy.r_[group_starts[1:], len(order)]
+
+    return [
+        (run_colors[order[gs]], zip(starts[order[gs:ge]].tolist(), ends[order[gs:ge]].tolist()))
+        for gs, ge in zip(group_starts, group_ends)]
+
+def run_selection(runs):
+    """Selection values of inclusive (start, end) runs, as formatted by GLMolTypeSelector.selection_to_string."""
+    return ",".join("%i-%i" % (start, end) if end > start else "%i" % start for start, end in runs)
+
+def color_bins(values, n_colors, thresholds = None):
+    """Quantize values into n_colors equal width bins over thresholds.
+
+    thresholds - (vmin, vmax) value range, defaulting to the range of valid values.
+
+    returns - Bin index per value, out of range values are clipped to the
+        first or last bin and invalid values, NaN or inf, are placed in bin n_colors.
+    """
+    import matplotlib.colors
+
+    if thresholds:
+        vmin, vmax = thresholds
+        norm = matplotlib.colors.Normalize(vmin=vmin, vmax=vmax)
+    else:
+        norm = matplotlib.colors.Normalize()
+
+    values = numpy.ma.masked_invalid(numpy.asarray(values, dtype=float))
+    invalid = numpy.ma.getmaskarray(values)
+    if invalid.all():
+        return numpy.full(len(values), n_colors, dtype=int)
+
+    scaled = numpy.ma.filled(norm(values), 0.0)
+    color_index = numpy.clip(numpy.floor(scaled * n_colors), 0, n_colors - 1).astype(int)
+    color_index[invalid] = n_colors
+
+    return color_index
+
 class ResidueSpectrum(EmbedReprModifier):
-    def __init__(self, residue_property, colors = None, sub_selector = None, thresholds = None):
+    """Color residues by a residue property.
+
+    Property values are quantized into n_colors color bins, defaulting to
+    the colormap resolution. One color entry is emitted per distinct color,
+    selecting contiguous runs of residues as residue number ranges.
+
+    The color palette is computed once per modifier, only quantization and
+    run selections are recomputed per embed.
+    """
+
+    def __init__(self, residue_property, colors = None, sub_selector = None, thresholds = None, n_colors = None):
         self.residue_property = residue_property
         self.colors = colors
         
@@ -81,32 +160,86 @@ class ResidueSpectrum(EmbedReprModifier):
             assert len(thresholds) == 2
         self.thresholds = thresholds
 
-    def apply_to_embed(self, embed):
-        import matplotlib.cm
-        import matplotlib.colors
-        from matplotlib.colors import rgb2hex
-
-        if isinstance( self.colors, matplotlib.colors.Colormap ):
-            cmap = self.colors
-        elif isinstance( self.colors, basestring ) or self.colors is None:
-            cmap = matplotlib.cm.get_cmap(self.colors)
-        else:
-            cmap = matplotlib.colors.LinearSegmentedColormap.from_list("residue_spectrum", self.colors)
+        assert n_colors is None or n_colors > 0
+        self.n_colors = n_colors
 
-        if self.thresholds:
-            vmin, vmax = self.thresholds
-            sm = matplotlib.cm.ScalarMappable(matplotlib.colors.Normalize(vmin=vmin, vmax=vmax), cmap=cmap)
-        else:
-            sm = matplotlib.cm.ScalarMappable(matplotlib.colors.Normalize(), cmap=cmap)
+        self._palette = None
 
+    @property
+    def palette(self):
+        """Hex colors of the color bins, followed by the invalid value color."""
+        if self._palette is None:
+            from matplotlib.colors import rgb2hex
+
+            cmap = resolve_colormap(self.colors)
+            n_colors = self.n_colors if self.n_colors else cmap.N
+
+            bin_values = numpy.ma.masked_invalid(numpy.r_[(numpy.arange(n_colors) + .5) / n_colors, numpy.nan])
+            self._palette = [rgb2hex(c) for c in cmap(bin_values)]
+
+        return self._palette
+
+    def apply_to_embed(self, embed):
         if not self.residue_property in embed.residue_properties:
             raise ValueError("Unable to load residue property: %s Available properties: %s" % (self.residue_property, embed.residue_properties.keys()))
 
-        color_entries = map(rgb2hex, sm.to_rgba(embed.residue_properties[self.residue_property]))
+        palette = self.palette
+        color_index = color_bins(embed.residue_properties[self.residue_property], len(palette) - 1, self.thresholds)
+
+        selector_name = ResidueNumber([]).selector_name
+        sub_selection = "; %s" % self.sub_selector.selector if self.sub_selector else ""
+
+        color_entries = [
+            "%s:%s %s%s" % (palette[c], selector_name, run_selection(runs), sub_selection)
+            for c, runs in color_runs(color_index)]
+
+        embed.add_repr_entry("color", color_entries)
+
+class PropertyColor(EmbedReprModifier):
+    """Color atoms by an atom or residue property.
+
+    Property values are quantized into n_colors bins and sent as uint8 or
+    uint16 codes with a color lookup table, applied per atom in the viewer.
+    Changing the property of a displayed embed sends only codes and table.
+
+    property_name - Atom or residue property name, see property_colors.property_values.
+    colors - Colormap, colormap name or list of colors.
+    thresholds - (vmin, vmax) value range, defaulting to the property range.
+    n_colors - Color bins, codes are uint8 up to 254 colors and uint16 beyond.
+    selector - Colored atoms, defaulting to all atoms.
+    """
+
+    def __init__(self, property_name, colors = None, thresholds = None, n_colors = 254, selector = None):
+        self.property_name = property_name
+        self.colors = colors
+
+        if thresholds:
+            assert len(thresholds) == 2
+        self.thresholds = thresholds
 
-        selectors = [ResidueNumber[i] for i in range(len(color_entries))]
-        if self.sub_selector:
-            selectors = [s + self.sub_selector for s in selectors]
+        assert n_colors > 0
+        self.n_colors = n_colors
+
+        assert selector is None or isinstance(selector, (GLMolSelector, GLMolSubSelector))
+        self.selector = selector
+
+    def apply_to_embed(self, embed):
+        vmin, vmax = self.thresholds if self.thresholds else (None, None)
+        codes = atom_codes(embed, self.property_name, self.n_colors, vmin, vmax)
 
-        embed.add_repr_entry("color",
-                ["%s:%s" % (c, s.glmol_selection_string) for c, s in zip(color_entries, selectors) ])
+        if self.selector is not None:
+            codes[~embed.selection_engine.mask(self.selector)] = self.n_colors + 1
+
+        embed.property_colors = dict(
+            property = self.property_name,
+            codes = codes,
+            table = colormap_table(resolve_colormap(self.colors), self.n_colors))
+
+    def __repr__(self):
+        return "%s(property_name = %r, n_colors = %r)" % (self.__class__.__name__, self.property_name, self.n_colors)
+
+class ClearPropertyColor(EmbedReprModifier):
+    """Remove property coloring."""
+
+    def apply_to_embed(self, embed):
+        embed.property_colors = None
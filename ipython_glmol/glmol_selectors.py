@@ -1,13 +1,37 @@
-from abc import abstractproperty, ABCMeta
+from abc import abstractproperty, abstractmethod, ABCMeta
 import collections
-from copy import deepcopy
 
 class GLMolSelectorMeta(ABCMeta):
     def __getitem__(self, arg):
         return self(arg)
 
+def _selection_key(selection):
+    """Hashable key of a type selector selection."""
+    if isinstance(selection, slice):
+        return (slice, selection.start, selection.stop)
+    elif isinstance(selection, collections.Iterable) and not isinstance(selection, basestring):
+        return tuple(map(_selection_key, selection))
+    else:
+        return selection
+
+def _freeze_selection(selection):
+    """Immutable copy of a type selector selection."""
+    if isinstance(selection, collections.Iterable) and not isinstance(selection, (basestring, tuple)):
+        return tuple(selection)
+    else:
+        return selection
+
 class GLMolSelector(object):
+    """Immutable, hashable selector value.
+
+    Selectors share subselection tuples, adding a subselection creates a new
+    selector. The selection string is computed once on first access.
+    """
     __metaclass__ = ABCMeta
+    __slots__ = ("subselections", "_glmol_selection_string", "_hash")
+
+    def __init__(self, subselections = None):
+        object.__setattr__(self, "subselections", tuple(subselections) if subselections else ())
 
     @abstractproperty
     def selector(self):
@@ -15,18 +39,58 @@ class GLMolSelector(object):
 
     @property
     def glmol_selection_string(self):
-        return "; ".join( [self.selector] + [s.selector for s in self.subselections] )
+        try:
+            return self._glmol_selection_string
+        except AttributeError:
+            selection_string = "; ".join( [self.selector] + [s.selector for s in self.subselections] )
+            object.__setattr__(self, "_glmol_selection_string", selection_string)
+            return selection_string
+
+    def selection_string(self, embed):
+        """GLmol selection string of selector within the given embed."""
+        return self.glmol_selection_string
+
+    @abstractmethod
+    def with_subselections(self, subselections):
+        """Copy of selector with the given subselections."""
+        pass
     
     def __add__(self, subselection):
         assert isinstance(subselection, GLMolSubSelector)
 
-        c = deepcopy(self)
-        c.subselections.append(subselection)
-        return c
+        return self.with_subselections(self.subselections + (subselection,))
+
+    def _key(self):
+        return (self.__class__, self.subselections)
+
+    def __eq__(self, other):
+        return isinstance(other, GLMolSelector) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            h = hash(self._key())
+            object.__setattr__(self, "_hash", h)
+            return h
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is immutable." % self.__class__.__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError("%s is immutable." % self.__class__.__name__)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
 class All(GLMolSelector):
-    def __init__(self, subselections = None):
-        self.subselections = subselections if subselections else []
+    __slots__ = ()
 
     @property
     def selector_name(self):
@@ -36,16 +100,24 @@ class All(GLMolSelector):
     def selector(self):
         return self.selector_name
 
+    def with_subselections(self, subselections):
+        return self.__class__(subselections)
+
+    def __reduce__(self):
+        return (self.__class__, (self.subselections,))
+
     def __repr__(self):
         return "%s(subselections = %r)" % (self.__class__.__name__, self.subselections)
 
 class GLMolTypeSelector(GLMolSelector):
     __metaclass__ = GLMolSelectorMeta
+    __slots__ = ("selection",)
 
-    def __init__(self, selection, subselections = []):
+    def __init__(self, selection, subselections = None):
+        selection = _freeze_selection(selection)
         self.selection_to_string(selection)
-        self.selection = selection
-        self.subselections = subselections if subselections else []
+        super(GLMolTypeSelector, self).__init__(subselections)
+        object.__setattr__(self, "selection", selection)
 
     @abstractproperty
     def selector_name(self):
@@ -57,63 +129,199 @@ class GLMolTypeSelector(GLMolSelector):
     
     @classmethod
     def selection_to_string(cls, selection):
+        """GLmol selection values of selection.
+
+        Slices are inclusive value ranges, selector[start:end] selects
+        start <= value <= end and is formatted as 'start-end'. Ranges from
+        exclusive span ends must be converted to selector[start:end - 1].
+        """
         if isinstance(selection, slice):
             assert selection.start is not None and selection.stop is not None
             return "%s-%s" % (selection.start, selection.stop)
-        elif isinstance(selection, collections.Iterable):
-            return ",".join(map(str, selection))
+        elif isinstance(selection, collections.Iterable) and not isinstance(selection, basestring):
+            return ",".join(map(cls.selection_to_string, selection))
         else:
             return str(selection)
 
+    def with_subselections(self, subselections):
+        return self.__class__(self.selection, subselections)
+
+    def _key(self):
+        return (self.__class__, _selection_key(self.selection), self.subselections)
+
+    def __reduce__(self):
+        return (self.__class__, (self.selection, self.subselections))
+
     def __repr__(self):
         return "%s(selection = %r, subselections = %r)" % (self.__class__.__name__, self.selection, self.subselections)
 
 class Chain(GLMolTypeSelector):
+    __slots__ = ()
+
     @property
     def selector_name(self):
         return "chain"
 
 class ChainNumber(GLMolTypeSelector):
+    __slots__ = ()
+
     @property
     def selector_name(self):
         return "chain_number"
 
 class Residue(GLMolTypeSelector):
+    __slots__ = ()
+
     @property
     def selector_name(self):
         return "resi"
 
 class ResidueNumber(GLMolTypeSelector):
+    __slots__ = ()
+
     @property
     def selector_name(self):
         return "residue_number"
 
 class Atom(GLMolTypeSelector):
+    __slots__ = ()
+
     @property
     def selector_name(self):
         return "atomi"
 
+def _resolve_selector(selector):
+    if isinstance(selector, basestring):
+        return Chain[selector]
+    elif isinstance(selector, GLMolSubSelector):
+        return All() + selector
+    elif isinstance(selector, GLMolSelector):
+        return selector
+    else:
+        raise ValueError("Invalid selector: %r" % (selector,))
+
+class SpatialSelector(GLMolSelector):
+    """Selector over atom coordinates, resolved per embed.
+
+    Spatial selectors have no GLmol selection string, repr modifiers resolve
+    them against the embed coordinates to residue or atom selections. See
+    selection_engine.SelectionEngine.resolve.
+
+    complete_residues - Select complete residues containing any selected atom.
+    """
+    __slots__ = ("distance", "complete_residues")
+
+    def __init__(self, distance, complete_residues = True, subselections = None):
+        super(SpatialSelector, self).__init__(subselections)
+        object.__setattr__(self, "distance", float(distance))
+        object.__setattr__(self, "complete_residues", bool(complete_residues))
+
+    @property
+    def selector(self):
+        raise ValueError("%r has no selection string, resolve with selection_string(embed)." % (self,))
+
+    def selection_string(self, embed):
+        return embed.selection_engine.resolve(self).glmol_selection_string
+
+    @abstractmethod
+    def atom_mask(self, engine):
+        """Boolean mask of selected atoms, before residue completion and subselections."""
+        pass
+
+class Within(SpatialSelector):
+    """Atoms within distance, in Angstrom, of the atoms selected by of.
+
+    of - Selector, subselector or chain id.
+    """
+    __slots__ = ("of",)
+
+    def __init__(self, distance, of, complete_residues = True, subselections = None):
+        super(Within, self).__init__(distance, complete_residues, subselections)
+        object.__setattr__(self, "of", _resolve_selector(of))
+
+    def atom_mask(self, engine):
+        return engine.near_mask(engine.mask(self.of), self.distance)
+
+    def with_subselections(self, subselections):
+        return self.__class__(self.distance, self.of, self.complete_residues, subselections)
+
+    def _key(self):
+        return (self.__class__, self.distance, self.of, self.complete_residues, self.subselections)
+
+    def __reduce__(self):
+        return (self.__class__, (self.distance, self.of, self.complete_residues, self.subselections))
+
+    def __repr__(self):
+        return "%s(distance = %r, of = %r, complete_residues = %r, subselections = %r)" % (
+            self.__class__.__name__, self.distance, self.of, self.complete_residues, self.subselections)
+
+class Interface(SpatialSelector):
+    """Atoms of either chain within distance, in Angstrom, of the other chain.
+
+    chain_a, chain_b - Chain ids or selectors.
+    """
+    __slots__ = ("chain_a", "chain_b")
+
+    def __init__(self, chain_a, chain_b, distance = 5.0, complete_residues = True, subselections = None):
+        super(Interface, self).__init__(distance, complete_residues, subselections)
+        object.__setattr__(self, "chain_a", _resolve_selector(chain_a))
+        object.__setattr__(self, "chain_b", _resolve_selector(chain_b))
+
+    def atom_mask(self, engine):
+        mask_a = engine.mask(self.chain_a)
+        mask_b = engine.mask(self.chain_b)
+        return engine.near_mask(mask_a, self.distance, mask_b) | engine.near_mask(mask_b, self.distance, mask_a)
+
+    def with_subselections(self, subselections):
+        return self.__class__(self.chain_a, self.chain_b, self.distance, self.complete_residues, subselections)
+
+    def _key(self):
+        return (self.__class__, frozenset((self.chain_a, self.chain_b)), self.distance, self.complete_residues, self.subselections)
+
+    def __reduce__(self):
+        return (self.__class__, (self.chain_a, self.chain_b, self.distance, self.complete_residues, self.subselections))
+
+    def __repr__(self):
+        return "%s(chain_a = %r, chain_b = %r, distance = %r, complete_residues = %r, subselections = %r)" % (
+            self.__class__.__name__, self.chain_a, self.chain_b, self.distance, self.complete_residues, self.subselections)
+
 class GLMolSubSelector(object):
     __metaclass__ = ABCMeta
+    __slots__ = ()
 
     @abstractproperty
     def selector(self):
         pass
 
+    def __eq__(self, other):
+        return self.__class__ is other.__class__
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.__class__)
+
     def __repr__(self):
         return "%s()" % self.__class__.__name__
 
 class Carbon(GLMolSubSelector):
+    __slots__ = ()
+
     @property
     def selector(self):
         return "elem C"
 
 class Heavyatom(GLMolSubSelector):
+    __slots__ = ()
+
     @property
     def selector(self):
         return "heavy"
     
 class Backbone(GLMolSubSelector):
+    __slots__ = ()
+
     @property
     def selector(self):
         return "bb"
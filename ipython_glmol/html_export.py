@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""Batch export of embeds as static html pages sharing one GLmol library asset.
+
+    python -m ipython_glmol.html_export -o <output_dir> <pdb files>
+"""
+import logging
+logger = logging.getLogger("ipython_glmol.html_export")
+
+import os
+from os import path
+import time
+import argparse
+import multiprocessing
+
+from .setup_js import library_digest, render_js, write_atomic
+
+def write_library_asset(output_dir):
+    """Render GLmol library into output_dir as 'GLmol.<digest>.js', if not present.
+
+    returns - Library file name, relative to output_dir.
+    """
+    library_name = "GLmol.%s.js" % library_digest()
+    library_file = path.join(output_dir, library_name)
+
+    if not path.exists(library_file):
+        logger.info("Writing glmol: %s", library_file)
+        write_atomic(library_file, render_js())
+
+    return library_name
+
+def load_embed(item, default_repr = None):
+    """Resolve export item, a PDBEmbed or pdb file path, to embed."""
+    from .glmol_embed import PDBEmbed
+
+    if isinstance(item, PDBEmbed):
+        return item
+
+    with open(item) as pdb_file:
+        embed = PDBEmbed(pdb_file.read())
+
+    if default_repr is not None:
+        embed += default_repr
+
+    return embed
+
+def item_name(index, item):
+    """Default page name of the export item."""
+    if isinstance(item, basestring):
+        return path.splitext(path.basename(item))[0]
+    else:
+        return "embed_%05i" % index
+
+def _export_page(args):
+    """Write single page, returns (page file, page bytes)."""
+    name, item, output_dir, library_url, default_repr = args
+
+    page_file = path.join(output_dir, "%s.html" % name)
+    page = load_embed(item, default_repr).dump_html(library_url = library_url)
+
+    with open(page_file, "w") as o:
+        o.write(page)
+
+    return page_file, len(page)
+
+def export_html(items, output_dir, processes = None, default_repr = None, chunksize = 8):
+    """Export embeds as html pages referencing a shared library asset.
+
+    items - Iterable of PDBEmbed, pdb file paths or (name, item) tuples.
+    processes - Worker process count, defaults to cpu count. Pages are
+        generated in-process if 0.
+    default_repr - Repr modifier applied to embeds loaded from pdb files.
+
+    returns - Export summary dict: pages, bytes, seconds, pages_per_second.
+    """
+
+    if not path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    library_url = write_library_asset(output_dir)
+
+    def page_args():
+        for i, item in enumerate(items):
+            name, item = item if isinstance(item, tuple) else (item_name(i, item), item)
+            yield (name, item, output_dir, library_url, default_repr)
+
+    start = time.time()
+    pages = 0
+    page_bytes = 0
+
+    if processes == 0:
+        pool = None
+        results = (_export_page(a) for a in page_args())
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_export_page, page_args(), chunksize)
+
+    try:
+        for page_file, size in results:
+            pages += 1
+            page_bytes += size
+            logger.debug("Wrote: %s", page_file)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    seconds = time.time() - start
+    summary = dict(
+        pages = pages,
+        bytes = page_bytes,
+        seconds = seconds,
+        pages_per_second = pages / seconds if seconds else float("inf"))
+
+    logger.info("Exported %(pages)i pages, %(bytes)i bytes in %(seconds).2fs (%(pages_per_second).1f pages/s)", summary)
+
+    return summary
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
+
+    parser = argparse.ArgumentParser(description='Export pdb files as static GLmol html pages.')
+    parser.add_argument('--output_dir', "-o", type=str, required=True, help="Output directory.")
+    parser.add_argument('--processes', "-j", type=int, default=None, help="Worker process count, defaults to cpu count.")
+    parser.add_argument('pdb_files', type=str, nargs="+", help="Exported pdb files.")
+    args = parser.parse_args()
+
+    from .glmol_repr import Ribbon
+    export_html(args.pdb_files, args.output_dir, processes = args.processes, default_repr = Ribbon())
@@ -0,0 +1,76 @@
+import logging
+logger = logging.getLogger("ipython_glmol.instrumentation")
+
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Browser timings reported by displayed viewers, in milliseconds
+browser_timing_names = ("load", "parse", "define_representation", "attributes", "geometry", "scene", "render", "first_frame", "refine")
+
+class EmbedProfile(object):
+    """Stage timings and payload sizes of an embed.
+
+    Python stage timings, in seconds, accumulate over repeated calls. Nested
+    stages are included in the enclosing stage. Browser timings, in
+    milliseconds, are reported per displayed viewer.
+    """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.payload_bytes = OrderedDict()
+        self.browser = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        """Time enclosed block as the named stage."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            calls, total = self.stages.get(name, (0, 0.0))
+            self.stages[name] = (calls + 1, total + elapsed)
+            logger.debug("Stage %s: %.3fms", name, elapsed * 1e3)
+
+    def record_payload(self, name, size):
+        """Record payload size in bytes, replacing any previous size."""
+        self.payload_bytes[name] = size
+        logger.debug("Payload %s: %i bytes", name, size)
+
+    def record_browser(self, embed_id, timings):
+        """Record browser timings of the viewer displayed as embed_id."""
+        timings = OrderedDict((k, timings[k]) for k in browser_timing_names if k in timings)
+        self.browser[embed_id] = timings
+        logger.info("Browser timings %s: %s", embed_id, ", ".join("%s=%sms" % i for i in timings.items()))
+
+    def report(self):
+        """Structured report of recorded timings and payload sizes.
+
+        returns - dict(
+            stages = {stage : dict(calls, seconds)},
+            payload_bytes = {payload : bytes},
+            browser = {embed_id : {timing : milliseconds}})
+        """
+        return dict(
+            stages = OrderedDict((name, dict(calls = calls, seconds = total)) for name, (calls, total) in self.stages.items()),
+            payload_bytes = OrderedDict(self.payload_bytes),
+            browser = OrderedDict((embed_id, OrderedDict(t)) for embed_id, t in self.browser.items()))
+
+    def format_report(self):
+        """Format report as text."""
+        lines = ["%-24s %6i calls %10.3fms" % (name, calls, total * 1e3) for name, (calls, total) in self.stages.items()]
+        lines.extend("%-24s %17iB" % i for i in self.payload_bytes.items())
+        for embed_id, timings in self.browser.items():
+            lines.append("%s: %s" % (embed_id, " ".join("%s=%sms" % i for i in timings.items())))
+
+        return "\n".join(lines)
+
+    def clear(self):
+        self.stages.clear()
+        self.payload_bytes.clear()
+        self.browser.clear()
+
+    def __repr__(self):
+        return "%s(stages = %i, payloads = %i, browser = %i)" % (
+            self.__class__.__name__, len(self.stages), len(self.payload_bytes), len(self.browser))
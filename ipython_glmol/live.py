@@ -0,0 +1,231 @@
+import logging
+logger = logging.getLogger("ipython_glmol.live")
+
+import numpy
+
+from .transport import encode_array
+from .picking import pick_response
+from .lru_cache import LRUCache
+
+comm_target_name = "ipython_glmol"
+
+# Displayed embeds by embed id, receiving messages from comms opened by the frontend.
+# Embeds are held until evicted by later displays, so temporaries such as
+# display(embed + Ribbon()) can still serve full detail and picks.
+displayed_embeds = LRUCache(64)
+
+_kernel_target_registered = False
+
+def open_comm(data = None):
+    """Open comm to the ipython_glmol frontend target."""
+    try:
+        from ipykernel.comm import Comm
+    except ImportError:
+        from IPython.kernel.comm import Comm
+
+    return Comm(target_name = comm_target_name, data = data)
+
+def handle_frontend_comm(comm, msg):
+    """Handle comm opened by a displayed viewer, dispatching to the displayed embed.
+
+    Comms opened with an "open" message stay open for viewer requests, other
+    comms are closed after handling the opening message.
+    """
+    data = msg["content"]["data"]
+
+    if data.get("type") == "open" and data.get("embed_id") in displayed_embeds:
+        comm.on_msg(lambda msg: handle_viewer_message(comm, msg))
+    else:
+        handle_viewer_message(comm, msg)
+        comm.close()
+
+def handle_viewer_message(comm, msg):
+    """Handle viewer message received on a frontend comm.
+
+    Messages for embeds not held in displayed_embeds are answered with an
+    "error" message, failing the pending viewer requests.
+    """
+    data = msg["content"]["data"]
+    embed = displayed_embeds.get(data.get("embed_id"))
+
+    if embed is None:
+        logger.debug("Message for unknown embed: %r", data)
+        comm.send(dict(type = "error", embed_id = data.get("embed_id"), request = data.get("type"),
+            error = "The kernel no longer holds this embed, display the embed again."))
+    elif data.get("type") == "timings":
+        embed.profile.record_browser(data["embed_id"], data["timings"])
+    elif data.get("type") == "pick":
+        comm.send(dict(type = "pick_info", embed_id = data["embed_id"], responses = pick_response(embed, data["requests"])))
+    elif data.get("type") == "structure":
+        logger.debug("Sending %s structure", data["embed_id"])
+        comm.send(dict(type = "structure", embed_id = data["embed_id"], payload = embed.structure_payload()))
+    elif data.get("type") == "frames":
+        logger.debug("Sending %s frames from: %s", data["embed_id"], data["start"])
+        comm.send(dict(type = "frames", embed_id = data["embed_id"], chunk = embed.frame_chunk(int(data["start"]))))
+    else:
+        logger.warning("Unhandled %s message: %r", data.get("embed_id"), data)
+
+def register_kernel_target():
+    """Register kernel comm target for frontend messages, if running in a kernel.
+
+    returns - True if the target is registered.
+    """
+    global _kernel_target_registered
+
+    if not _kernel_target_registered:
+        from IPython import get_ipython
+        shell = get_ipython()
+        if shell is None or getattr(shell, "kernel", None) is None:
+            return False
+
+        shell.kernel.comm_manager.register_target(comm_target_name, handle_frontend_comm)
+        _kernel_target_registered = True
+
+    return True
+
+def repr_lines(embed):
+    """Repr lines of embed, by repr type, omitting empty repr types."""
+    return dict(
+        (repr_type, ["%s:%s" % (repr_type, selection) for selection in selections])
+        for repr_type, selections in embed.repr_entries.items() if selections)
+
+def pack_colors(colors):
+    """Pack colors as 0xRRGGBB integers.
+
+    colors - Sequence of '#rrggbb' strings, 0xRRGGBB integers, or (n, 3) float rgb array in [0, 1].
+    """
+    if len(colors) and isinstance(colors[0], basestring):
+        return numpy.array([int(c.lstrip("#"), 16) for c in colors], dtype=numpy.uint32)
+
+    colors = numpy.asarray(colors)
+    if colors.ndim == 2:
+        rgb = numpy.clip(numpy.round(colors[:, :3] * 255), 0, 255).astype(numpy.uint32)
+        return (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+
+    return colors.astype(numpy.uint32)
+
+class LiveEmbed(object):
+    """Handle to a displayed PDBEmbed, pushing changes to the displayed viewer.
+
+    Repr updates send only the repr types changed since the last update,
+    the viewer redraws the affected repr types without reloading coordinates.
+    """
+
+    def __init__(self, embed, embed_id):
+        self.embed = embed
+        self.embed_id = embed_id
+
+        self._sent_lines = repr_lines(embed)
+        self._sent_property_colors = embed.property_colors
+        self._sent_property_serial = embed.property_colors is not None
+        self._comm = None
+        self._pick_callbacks = []
+
+    @property
+    def comm(self):
+        if self._comm is None:
+            self._comm = open_comm(dict(embed_id = self.embed_id))
+            self._comm.on_msg(self.handle_message)
+        return self._comm
+
+    def send(self, message_type, **data):
+        data.update(type = message_type, embed_id = self.embed_id)
+        self.comm.send(data)
+
+    def handle_message(self, msg):
+        """Dispatch frontend message to handle_<type> method."""
+        data = msg["content"]["data"]
+        handler = getattr(self, "handle_%s" % data.get("type"), None)
+
+        if handler is None:
+            logger.warning("Unhandled %s message: %r", self.embed_id, data)
+        else:
+            handler(data)
+
+    def update(self, embed = None):
+        """Push repr entries changed since the last update.
+
+        embed - Updated embed to display, defaults to the current embed.
+
+        returns - Dict of sent repr lines, by repr type.
+        """
+        if embed is not None:
+            self.embed = embed
+
+        current_lines = repr_lines(self.embed)
+
+        changed_lines = dict(
+            (repr_type, lines) for repr_type, lines in current_lines.items()
+            if self._sent_lines.get(repr_type) != lines)
+        changed_lines.update(
+            (repr_type, []) for repr_type in self._sent_lines if not repr_type in current_lines)
+
+        if changed_lines:
+            logger.debug("Updating %s repr types: %s", self.embed_id, changed_lines.keys())
+            self.send("repr", entries = changed_lines)
+
+        self._sent_lines = current_lines
+
+        if self.embed.property_colors is not self._sent_property_colors:
+            self.update_property_colors()
+
+        return changed_lines
+
+    def update_property_colors(self):
+        """Push property colors, sending codes and color table without coordinates."""
+        from .property_colors import pack_property_colors
+
+        property_colors = self.embed.property_colors
+        packed = pack_property_colors(property_colors, self.embed.atom_table, include_serial = not self._sent_property_serial)
+
+        logger.debug("Updating %s property colors: %s", self.embed_id, property_colors and property_colors["property"])
+        self.send("property_colors", property_colors = packed)
+
+        self._sent_property_colors = property_colors
+        self._sent_property_serial = self._sent_property_serial or packed is not None
+
+    def handle_timings(self, data):
+        self.embed.profile.record_browser(self.embed_id, data["timings"])
+
+    def handle_structure(self, data):
+        logger.debug("Sending %s structure", self.embed_id)
+        self.send("structure", payload = self.embed.structure_payload())
+
+    def on_pick(self, callback):
+        """Call callback with the pick info of each atom clicked in the viewer, see picking.atom_info."""
+        self._pick_callbacks.append(callback)
+        # Open comm, the viewer sends picks over the kernel comm once open.
+        self.comm
+
+    def handle_pick(self, data):
+        responses = pick_response(self.embed, data["requests"])
+        self.send("pick_info", responses = responses)
+
+        for response in responses:
+            if response["kind"] == "click" and response["info"] is not None:
+                for callback in self._pick_callbacks:
+                    try:
+                        callback(response["info"])
+                    except Exception:
+                        logger.exception("Pick callback failed: %r", callback)
+
+    def __iadd__(self, modifier):
+        self.embed += modifier
+        self.update()
+        return self
+
+    def set_atom_colors(self, serial, colors):
+        """Override colors of the given atoms, by atom serial number.
+
+        colors - See pack_colors.
+        """
+        serial = numpy.asarray(serial)
+        colors = pack_colors(colors)
+        assert len(serial) == len(colors)
+
+        self.send("atom_colors",
+            serial = encode_array(serial, "int32"),
+            colors = encode_array(colors, "uint32"))
+
+    def __repr__(self):
+        return "%s(embed_id = %r)" % (self.__class__.__name__, self.embed_id)
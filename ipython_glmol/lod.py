@@ -0,0 +1,221 @@
+import logging
+logger = logging.getLogger("ipython_glmol.lod")
+
+import numpy
+
+from .atom_table import atom_dtype
+from .transport import pack_atom_table
+
+# Trace atoms of protein and nucleic acid residues
+trace_atom_names = ("CA", "P")
+
+def residue_bounds(atoms):
+    """Start index of each residue, atoms are grouped by residue_number."""
+    return numpy.r_[0, numpy.flatnonzero(numpy.diff(atoms["residue_number"])) + 1] if len(atoms) else numpy.zeros(0, dtype=int)
+
+def group_centroids(atoms, starts):
+    """Centroid coordinates of the atom groups starting at starts."""
+    counts = numpy.diff(numpy.r_[starts, len(atoms)])
+    return numpy.add.reduceat(atoms["xyz"].astype(numpy.float64), starts, axis=0) / counts[:, None]
+
+def ca_trace(atoms):
+    """Trace level, CA and P atoms of polymer residues."""
+    return atoms[numpy.in1d(atoms["name"], trace_atom_names) & ~atoms["hetflag"]]
+
+def residue_centroids(atoms):
+    """Centroid level, one pseudo-atom per residue at the residue centroid.
+
+    Pseudo-atoms keep the serial of the first residue atom, viewer picks and
+    serial-keyed colors resolve to the source residue.
+    """
+    starts = residue_bounds(atoms)
+
+    centroids = atoms[starts].copy()
+    centroids["xyz"] = group_centroids(atoms, starts)
+    centroids["name"] = "CA"
+    centroids["elem"] = "C"
+
+    return centroids
+
+def chain_spheres(atoms):
+    """Chain level, one pseudo-atom per chain at the chain centroid.
+
+    The b column holds the chain radius of gyration. Pseudo-atoms keep the
+    serial of the first chain atom, see residue_centroids.
+    """
+    if not len(atoms):
+        return numpy.zeros(0, dtype=atom_dtype)
+
+    starts = numpy.r_[0, numpy.flatnonzero(numpy.diff(atoms["chain_number"])) + 1]
+    counts = numpy.diff(numpy.r_[starts, len(atoms)])
+
+    spheres = atoms[starts].copy()
+    spheres["xyz"] = group_centroids(atoms, starts)
+    spheres["name"] = "CA"
+    spheres["elem"] = "C"
+
+    square_deviations = ((atoms["xyz"] - numpy.repeat(spheres["xyz"], counts, axis=0)) ** 2).sum(axis=1)
+    spheres["b"] = numpy.sqrt(numpy.add.reduceat(square_deviations, starts) / counts)
+
+    return spheres
+
+lod_levels = {
+    "trace" : ca_trace,
+    "centroid" : residue_centroids,
+    "chain" : chain_spheres,
+}
+
+class LevelOfDetail(object):
+    """Level-of-detail display policy.
+
+    level - Coarse level, one of lod_levels, shown before full detail.
+    threshold - Minimum atom count for coarse display, smaller structures are
+        displayed at full detail.
+    refine_zoom - Zoom distance, in angstroms, into the initial view at which
+        the viewer loads full detail. Full detail is also loaded on request.
+
+    Notebook displays omit the full detail structure, the viewer requests it
+    from the kernel when refined, see PDBEmbed.embed_js. Static displays
+    include the full detail structure.
+    """
+
+    def __init__(self, level = "trace", threshold = 50000, refine_zoom = 30):
+        if not level in lod_levels:
+            raise ValueError("Invalid lod level: %r Available levels: %s" % (level, sorted(lod_levels)))
+
+        self.level = level
+        self.threshold = threshold
+        self.refine_zoom = refine_zoom
+
+    def is_coarse(self, atoms):
+        return len(atoms) >= self.threshold
+
+    def coarse_atoms(self, atoms):
+        return lod_levels[self.level](atoms)
+
+    def lod_data(self, atoms):
+        """Json-serializable coarse level data."""
+        coarse = self.coarse_atoms(atoms)
+        logger.debug("LOD %s: %i atoms -> %i", self.level, len(atoms), len(coarse))
+
+        return dict(
+            level = self.level,
+            refine_zoom = self.refine_zoom,
+            table = pack_atom_table(coarse, ""))
+
+    def __repr__(self):
+        return "%s(level = %r, threshold = %r, refine_zoom = %r)" % (self.__class__.__name__, self.level, self.threshold, self.refine_zoom)
+
+_lod_load_js_template = """
+        ipython_glmol.load_lod(%(embed_id)s, %(lod_json)s, function (loaded, failed)
+        {
+        %(full_load_js)s
+        });
+"""
+
+# Full detail load, run by refine_lod once the structure payload is available
+_lod_loaded_js_template = """
+        loaded(function ()
+        {
+        %(load_js)s
+        });
+"""
+
+# Full detail payload requested from the kernel, see live.handle_viewer_message
+_lod_deferred_payload_js_template = """
+        ipython_glmol.request_structure(%(embed_id)s, function (%(embed_id)s_payload)
+        {
+        %(load_js)s
+        }, failed);
+"""
+
+_lod_support_js = """
+    if (ipython_glmol.load_lod === undefined)
+    {
+        ipython_glmol.define_lod_representation = function ()
+        {
+            var all = this.getAllAtoms(), level = this.lod.level;
+
+            this.colorByChain(all, true);
+            if (level == 'trace')
+            {
+                this.drawMainchainCurve(this.modelGroup, all, this.curveWidth, 'CA');
+                this.drawMainchainCurve(this.modelGroup, all, this.curveWidth, 'P');
+            }
+            else if (level == 'centroid')
+            {
+                this.drawAtomsAsSphere(this.modelGroup, all, 2.0, true);
+            }
+            else
+            {
+                for (var i = 0; i < all.length; i++)
+                {
+                    this.drawAtomsAsSphere(this.modelGroup, [all[i]], Math.max(this.atoms[all[i]].b, 2.0), true);
+                }
+            }
+        };
+
+        ipython_glmol.refine_lod = function (viewer)
+        {
+            var lod = viewer.lod;
+            if (!lod || lod.refined || lod.loading) { return; }
+            lod.loading = true;
+            lod.status.text('Loading full detail...');
+
+            var time = new Date();
+            lod.load_full(function (load)
+            {
+                lod.refined = true;
+                lod.loading = false;
+                lod.controls.remove();
+                // Coarse level pick info is keyed by the serials of source atoms
+                if (viewer.picking) { viewer.picking.cache = {}; }
+
+                var view = viewer.getView();
+                viewer.show = lod.show;
+                viewer.defineRepresentation = lod.defineRepresentation;
+                load();
+                viewer.setView(view);
+                viewer.show();
+
+                console.log("Refined " + viewer.id + " in " + (new Date() - time) + "ms");
+                viewer.timings.refine = new Date() - time;
+                ipython_glmol.post_timings(viewer);
+            }, function (error)
+            {
+                lod.loading = false;
+                lod.status.text(String(error));
+            });
+        };
+
+        // Display coarse level, load_full(loaded, failed) calls loaded with a
+        // function loading full detail once the full payload is available.
+        ipython_glmol.load_lod = function (viewer, lod, load_full)
+        {
+            viewer.lod = {
+                level: lod.level, refined: false, loading: false, load_full: load_full,
+                show: viewer.show, defineRepresentation: viewer.defineRepresentation};
+
+            viewer.defineRepresentation = ipython_glmol.define_lod_representation;
+            ipython_glmol.load_atom_table(viewer, lod.table, false);
+
+            // Load full detail once zoomed in past refine_zoom, zooming in moves
+            // the model towards the camera at negative z.
+            var initial_zoom = viewer.rotationGroup.position.z;
+            viewer.show = function ()
+            {
+                viewer.lod.show.apply(viewer, arguments);
+                if (initial_zoom - viewer.rotationGroup.position.z > lod.refine_zoom)
+                {
+                    setTimeout(function () { ipython_glmol.refine_lod(viewer); }, 0);
+                }
+            };
+
+            viewer.lod.status = $('<span style="margin-left: 4px;"/>');
+            viewer.lod.controls = $('<div/>').append(
+                $('<button>Full detail</button>').click(function () { ipython_glmol.refine_lod(viewer); }),
+                viewer.lod.status);
+            $('#' + viewer.id).after(viewer.lod.controls);
+        };
+    }
+"""
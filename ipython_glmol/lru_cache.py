@@ -0,0 +1,47 @@
+from collections import OrderedDict
+
+class LRUCache(object):
+    """Bounded mapping, evicting least recently used entries beyond maxsize."""
+
+    def __init__(self, maxsize = 128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, key):
+        value = self._entries.pop(key)
+        self._entries[key] = value
+        return value
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = value
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last = False)
+
+    def pop(self, key, default = None):
+        return self._entries.pop(key, default)
+
+    def keys(self):
+        return self._entries.keys()
+
+    def values(self):
+        return self._entries.values()
+
+    def clear(self):
+        self._entries.clear()
+
+    def __repr__(self):
+        return "%s(maxsize = %r, entries = %i)" % (self.__class__.__name__, self.maxsize, len(self._entries))
@@ -0,0 +1,223 @@
+import logging
+logger = logging.getLogger("ipython_glmol.payload_policy")
+
+import os
+from os import path
+import json
+import zlib
+import base64
+from collections import OrderedDict
+
+from .setup_js import write_atomic
+from .lru_cache import LRUCache
+
+def _env_bytes(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return int(value) if value.strip() else None
+
+# Minimum structure payload bytes compressed in notebook output, None to disable.
+# Compression is opt-in, compressed payloads require DecompressionStream in
+# the browser, or a running kernel to request the uncompressed payload.
+default_compress_min_bytes = _env_bytes("IPYTHON_GLMOL_COMPRESS_BYTES", None)
+# Minimum structure payload bytes referenced rather than inlined, None to disable
+default_reference_min_bytes = _env_bytes("IPYTHON_GLMOL_REFERENCE_BYTES", None)
+# Payload and output records kept for footprint, evicting least recently recorded
+default_max_records = 1024
+
+class PayloadPolicy(object):
+    """Encoding of structure payloads in notebook output.
+
+    Notebook output javascript is stored in the notebook file. Payloads of
+    at least compress_min_bytes are deflate compressed and base64 encoded,
+    and decompressed in the browser. Payloads of at least reference_min_bytes
+    are written compressed to reference_dir and fetched by the browser from
+    reference_url, keeping only the url in the notebook.
+
+    reference_dir - Payload file directory, relative to the kernel working
+        directory.
+    reference_url - Url prefix of payload files. If None, payload files are
+        fetched from the notebook server files of the notebook directory,
+        assuming the kernel runs in the notebook directory.
+
+    Referenced payloads are displayed only while the payload files are
+    served, the notebook file is no longer self-contained.
+
+    The encoded size of each payload and the output size of each display
+    are recorded, see footprint, for the last max_records payloads and
+    displays.
+    """
+
+    def __init__(self, compress_min_bytes = default_compress_min_bytes, reference_min_bytes = default_reference_min_bytes,
+            reference_dir = "glmol_payloads", reference_url = None, compress_level = 6, max_records = default_max_records):
+        self.compress_min_bytes = compress_min_bytes
+        self.reference_min_bytes = reference_min_bytes
+        self.reference_dir = reference_dir
+        self.reference_url = reference_url
+        self.compress_level = compress_level
+
+        self.payloads = LRUCache(max_records)
+        self.outputs = LRUCache(max_records)
+
+    def mode(self, size):
+        """Payload encoding mode for payload of size bytes, "reference", "deflate" or "inline"."""
+        if self.reference_min_bytes is not None and size >= self.reference_min_bytes:
+            return "reference"
+        elif self.compress_min_bytes is not None and size >= self.compress_min_bytes:
+            return "deflate"
+        else:
+            return "inline"
+
+    def reference_path(self, key):
+        return path.join(self.reference_dir, "%s.json.z" % key)
+
+    def encode(self, key, payload_json):
+        """Encode json payload of structure key as json for notebook output.
+
+        Encoded payloads are resolved in the browser by ipython_glmol.with_payload.
+        """
+        mode = self.mode(len(payload_json))
+
+        if mode == "inline":
+            encoded = payload_json
+            stored_bytes = 0
+        else:
+            compressed = zlib.compress(payload_json, self.compress_level)
+            if mode == "deflate":
+                encoded = json.dumps(dict(encoding = "deflate", data = base64.b64encode(compressed)))
+                stored_bytes = 0
+            else:
+                payload_file = self.reference_path(key)
+                if not path.exists(payload_file):
+                    logger.info("Writing payload: %s", payload_file)
+                    write_atomic(payload_file, compressed)
+
+                url = (self.reference_url.rstrip("/") + "/" + path.basename(payload_file)
+                        if self.reference_url is not None else payload_file.replace(os.sep, "/"))
+                encoded = json.dumps(dict(
+                    encoding = "reference", url = url, relative = self.reference_url is None, compressed = True))
+                stored_bytes = len(compressed)
+
+        self.payloads[key] = dict(mode = mode, raw_bytes = len(payload_json), output_bytes = len(encoded), stored_bytes = stored_bytes)
+        logger.debug("Payload %s: %s %i -> %i bytes", key, mode, len(payload_json), len(encoded))
+
+        return encoded
+
+    def record_output(self, embed_id, size):
+        """Record notebook output javascript of size bytes displayed as embed_id."""
+        self.outputs[embed_id] = size
+
+    def footprint(self):
+        """Notebook footprint of the recorded displayed outputs and encoded payloads.
+
+        returns - dict(
+            output_bytes - Total output javascript bytes, stored in the notebook.
+            outputs - Number of displayed outputs.
+            payloads - {mode : dict(count, raw_bytes, output_bytes, stored_bytes)},
+                stored_bytes are payload file bytes outside the notebook.
+            )
+        """
+        payloads = OrderedDict()
+        for p in self.payloads.values():
+            totals = payloads.setdefault(p["mode"], dict(count = 0, raw_bytes = 0, output_bytes = 0, stored_bytes = 0))
+            totals["count"] += 1
+            for k in ("raw_bytes", "output_bytes", "stored_bytes"):
+                totals[k] += p[k]
+
+        return dict(
+            output_bytes = sum(self.outputs.values()),
+            outputs = len(self.outputs),
+            payloads = payloads)
+
+    def format_footprint(self):
+        """Format footprint as text."""
+        footprint = self.footprint()
+        lines = ["%i outputs, %iB notebook output" % (footprint["outputs"], footprint["output_bytes"])]
+        for mode, totals in footprint["payloads"].items():
+            lines.append("%-10s %4i payloads %12iB raw %12iB output %12iB stored" % (
+                mode, totals["count"], totals["raw_bytes"], totals["output_bytes"], totals["stored_bytes"]))
+
+        return "\n".join(lines)
+
+    def clear(self):
+        self.payloads.clear()
+        self.outputs.clear()
+
+    def __repr__(self):
+        return "%s(compress_min_bytes = %r, reference_min_bytes = %r, reference_dir = %r, reference_url = %r)" % (
+            self.__class__.__name__, self.compress_min_bytes, self.reference_min_bytes, self.reference_dir, self.reference_url)
+
+default_policy = PayloadPolicy()
+
+_payload_support_js = """
+    if (ipython_glmol.with_payload === undefined)
+    {
+        ipython_glmol.inflate = function (buffer)
+        {
+            var stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream('deflate'));
+            return new Response(stream).text();
+        };
+
+        ipython_glmol.payload_url = function (payload)
+        {
+            if (!payload.relative || typeof IPython === 'undefined' || !IPython.notebook) { return payload.url; }
+
+            // Notebook directory files, notebook_path includes the notebook name in IPython >= 3.
+            var notebook = IPython.notebook, directory = notebook.notebook_path || '';
+            if (notebook.notebook_name && directory.slice(-notebook.notebook_name.length) == notebook.notebook_name)
+            {
+                directory = directory.slice(0, -notebook.notebook_name.length);
+            }
+            if (directory && directory.slice(-1) != '/') { directory += '/'; }
+
+            return notebook.base_url + 'files/' + directory + payload.url;
+        };
+
+        ipython_glmol.resolve_payload = function (payload)
+        {
+            if (payload.encoding == 'deflate')
+            {
+                return ipython_glmol.inflate(ipython_glmol.decode(payload.data, Uint8Array)).then(JSON.parse);
+            }
+
+            var url = ipython_glmol.payload_url(payload);
+            return fetch(url).then(function (response)
+            {
+                if (!response.ok) { throw new Error('Unable to fetch payload ' + url + ': ' + response.status); }
+                return payload.compressed ? response.arrayBuffer().then(ipython_glmol.inflate) : response.text();
+            }).then(JSON.parse);
+        };
+
+        // Call callback with the decoded payload, synchronously for inline payloads,
+        // or failed with the error. Compressed payloads are requested uncompressed
+        // from the kernel in browsers without DecompressionStream.
+        ipython_glmol.with_payload = function (payload, callback, failed, viewer)
+        {
+            if (payload === null || typeof payload !== 'object' || payload.encoding === undefined)
+            {
+                callback(payload);
+                return;
+            }
+
+            if (typeof DecompressionStream === 'undefined' && (payload.encoding == 'deflate' || payload.compressed))
+            {
+                ipython_glmol.request_structure(viewer, callback, function (error)
+                {
+                    failed('Compressed payloads require DecompressionStream, unsupported by this browser. ' + error);
+                });
+                return;
+            }
+
+            if (payload.resolved === undefined) { payload.resolved = ipython_glmol.resolve_payload(payload); }
+            payload.resolved.then(callback).catch(failed);
+        };
+    }
+"""
+
+_payload_load_js_template = """
+        ipython_glmol.with_payload(%(source_js)s, function (%(embed_id)s_payload)
+        {
+        %(load_js)s
+        }, %(failed_js)s, %(embed_id)s);
+"""
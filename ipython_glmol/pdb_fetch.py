@@ -0,0 +1,304 @@
+import logging
+logger = logging.getLogger("ipython_glmol.pdb_fetch")
+
+import os
+from os import path
+import errno
+import gzip
+import time
+import socket
+import shutil
+import httplib
+import urllib2
+import urlparse
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
+
+class FetchError(IOError):
+    pass
+
+class ResponseFile(object):
+    """File-like view of an httplib response, iterating over lines."""
+
+    def __init__(self, response):
+        self.response = response
+
+    def read(self, *args):
+        return self.response.read(*args)
+
+    def __iter__(self):
+        pending = ""
+        for chunk in iter(lambda: self.response.read(1 << 16), ""):
+            lines = (pending + chunk).split("\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line + "\n"
+        if pending:
+            yield pending
+
+    def close(self):
+        self.response.close()
+
+class KeepAliveClient(object):
+    """HTTP GET client reusing one persistent connection per host.
+
+    Clients are not thread-safe, use one client per thread. Responses must be
+    read or closed before the next request.
+    """
+
+    max_redirects = 5
+
+    def __init__(self, timeout = 60):
+        self.timeout = timeout
+        self.connections = {}
+        self._responses = {}
+
+    def connection(self, scheme, netloc):
+        key = (scheme, netloc)
+        response = self._responses.pop(key, None)
+        if response is not None and not response.isclosed():
+            # Unread response, the connection can not be reused.
+            self.connections.pop(key).close()
+
+        if not key in self.connections:
+            connection_class = httplib.HTTPSConnection if scheme == "https" else httplib.HTTPConnection
+            self.connections[key] = connection_class(netloc, timeout = self.timeout)
+
+        return self.connections[key]
+
+    def _request(self, scheme, netloc, request_path):
+        for retry in (True, False):
+            connection = self.connection(scheme, netloc)
+            try:
+                connection.request("GET", request_path, headers = {"Connection" : "keep-alive"})
+                return connection.getresponse()
+            except (httplib.BadStatusLine, httplib.CannotSendRequest, socket.error):
+                # Retry once on a fresh connection, the server may close idle connections.
+                self.connections.pop((scheme, netloc)).close()
+                if not retry:
+                    raise
+
+    def get(self, url):
+        """GET url, following redirects, as ResponseFile."""
+        for _ in range(self.max_redirects + 1):
+            scheme, netloc, request_path, query, _ = urlparse.urlsplit(url)
+            if query:
+                request_path += "?" + query
+
+            response = self._request(scheme, netloc, request_path or "/")
+            self._responses[(scheme, netloc)] = response
+
+            if response.status in (301, 302, 303, 307, 308):
+                response.read()
+                url = urlparse.urljoin(url, response.getheader("location"))
+                continue
+            elif response.status != 200:
+                response.read()
+                raise FetchError("HTTP %i %s: %s" % (response.status, response.reason, url))
+
+            return ResponseFile(response)
+
+        raise FetchError("Too many redirects: %s" % url)
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.connections.clear()
+        self._responses.clear()
+
+class PDBFetcher(object):
+    """Fetch PDB entries via local mirror, on-disk cache or remote download.
+
+    Entries are resolved in order:
+        mirror_dir - Local mirror with wwPDB 'divided' layout:
+            '<mirror_dir>/pdb/<xy>/pdb<wxyz>.ent.gz' and '<mirror_dir>/mmCIF/<xy>/<wxyz>.cif.gz'
+        cache_dir - Gzip-compressed cache of downloaded entries: '<cache_dir>/<wxyz>.<format>.gz'
+        url_templates - Remote download, stored into the cache if enabled.
+
+    The cache is bounded to max_cache_bytes, evicting least recently used entries.
+    Entries are fetched concurrently over keep-alive connections by read_many.
+    """
+
+    formats = ("pdb", "cif")
+
+    url_templates = {
+        "pdb" : "http://www.pdb.org/pdb/files/%s.pdb",
+        "cif" : "http://www.pdb.org/pdb/files/%s.cif",
+    }
+
+    mirror_templates = {
+        "pdb" : path.join("pdb", "%(hash)s", "pdb%(pdb_id)s.ent.gz"),
+        "cif" : path.join("mmCIF", "%(hash)s", "%(pdb_id)s.cif.gz"),
+    }
+
+    def __init__(self, cache_dir = None, mirror_dir = None, max_cache_bytes = 1 << 30, timeout = 60, url_templates = None):
+        self.cache_dir = cache_dir
+        self.mirror_dir = mirror_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.timeout = timeout
+        if url_templates is not None:
+            self.url_templates = url_templates
+
+    def mirror_path(self, pdb_id, format = "pdb"):
+        pdb_id = pdb_id.lower()
+        return path.join(self.mirror_dir, self.mirror_templates[format] % dict(pdb_id = pdb_id, hash = pdb_id[1:3]))
+
+    def cache_path(self, pdb_id, format = "pdb"):
+        return path.join(self.cache_dir, "%s.%s.gz" % (pdb_id.lower(), format))
+
+    def open(self, pdb_id, format = "pdb", client = None):
+        """Open entry as file-like object of entry lines.
+
+        client - KeepAliveClient for remote downloads, downloads use urllib2 if None.
+        """
+        if not format in self.formats:
+            raise ValueError("Invalid PDB format: %r Available formats: %s" % (format, self.formats))
+
+        if self.mirror_dir:
+            mirror_file = self.mirror_path(pdb_id, format)
+            if path.exists(mirror_file):
+                logger.debug("Opening mirror entry: %s", mirror_file)
+                return gzip.open(mirror_file, "rb")
+
+        if not self.cache_dir:
+            return self.open_remote(pdb_id, format, client)
+
+        cache_file = self.cache_path(pdb_id, format)
+        if path.exists(cache_file):
+            logger.debug("Opening cached entry: %s", cache_file)
+            # Mark entry as recently used for eviction.
+            os.utime(cache_file, None)
+            return gzip.open(cache_file, "rb")
+
+        self.fetch_to_cache(pdb_id, format, client)
+        return gzip.open(cache_file, "rb")
+
+    def open_remote(self, pdb_id, format = "pdb", client = None):
+        """Open remote entry as file-like object."""
+        url = self.url_templates[format] % pdb_id
+        logger.info("Fetching: %s", url)
+
+        if client is None:
+            return urllib2.urlopen(url, timeout = self.timeout)
+        else:
+            return client.get(url)
+
+    def fetch_to_cache(self, pdb_id, format = "pdb", client = None):
+        """Stream remote entry into compressed cache file."""
+        cache_file = self.cache_path(pdb_id, format)
+
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        fd, temp_file = tempfile.mkstemp(dir=self.cache_dir, prefix=".%s." % path.basename(cache_file))
+        try:
+            with os.fdopen(fd, "wb") as raw_output:
+                remote = self.open_remote(pdb_id, format, client)
+                try:
+                    with gzip.GzipFile(fileobj=raw_output, mode="wb") as output:
+                        shutil.copyfileobj(remote, output)
+                finally:
+                    remote.close()
+            os.rename(temp_file, cache_file)
+        except:
+            os.unlink(temp_file)
+            raise
+
+        self.evict(keep = cache_file)
+
+        return cache_file
+
+    def read_many(self, pdb_ids, read, format = "pdb", connections = 8):
+        """Open and read entries concurrently, with at most connections concurrent downloads.
+
+        Each worker thread reuses keep-alive connections, see KeepAliveClient.
+        Failures are reported per entry without interrupting other entries.
+
+        pdb_ids - Iterable of entry ids.
+        read - Callable applied to each opened entry file.
+
+        returns - List of dict(pdb_id, result, error, seconds), in pdb_ids order.
+            error is the failure message, or None if read succeeded.
+        """
+        pdb_ids = list(pdb_ids)
+        local = threading.local()
+        clients = []
+
+        def read_entry(pdb_id):
+            if not hasattr(local, "client"):
+                local.client = KeepAliveClient(self.timeout)
+                clients.append(local.client)
+
+            start = time.time()
+            try:
+                entry = self.open(pdb_id, format, local.client)
+                try:
+                    result, error = read(entry), None
+                finally:
+                    entry.close()
+            except Exception as e:
+                logger.warning("Failed to read %s: %s", pdb_id, e)
+                result, error = None, "%s: %s" % (e.__class__.__name__, e)
+
+            return dict(pdb_id = pdb_id, result = result, error = error, seconds = time.time() - start)
+
+        pool = ThreadPool(max(min(connections, len(pdb_ids)), 1))
+        try:
+            results = pool.map(read_entry, pdb_ids, chunksize = 1)
+        finally:
+            pool.close()
+            pool.join()
+            for client in clients:
+                client.close()
+
+        logger.info("Read %i entries, %i failed.", len(results), sum(1 for r in results if r["error"]))
+
+        return results
+
+    def cache_entries(self):
+        """Cache entries as list of (last access, size, path), least recently used first."""
+        if not self.cache_dir or not path.exists(self.cache_dir):
+            return []
+
+        entries = []
+        for f in os.listdir(self.cache_dir):
+            if f.startswith(".") or not f.endswith(".gz"):
+                continue
+            f = path.join(self.cache_dir, f)
+            try:
+                s = os.stat(f)
+            except OSError:
+                continue
+            entries.append((s.st_mtime, s.st_size, f))
+
+        return sorted(entries)
+
+    def evict(self, keep = None):
+        """Remove least recently used cache entries, other than keep, until cache is within max_cache_bytes."""
+        if self.max_cache_bytes is None:
+            return
+
+        entries = self.cache_entries()
+        total_bytes = sum(size for _, size, _ in entries)
+
+        for _, size, f in entries:
+            if total_bytes <= self.max_cache_bytes:
+                break
+            if f == keep:
+                continue
+
+            logger.info("Evicting cached entry: %s", f)
+            try:
+                os.unlink(f)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            total_bytes -= size
+
+default_fetcher = PDBFetcher(
+    cache_dir = os.environ.get("IPYTHON_GLMOL_PDB_CACHE", path.expanduser(path.join("~", ".cache", "ipython_glmol", "pdb"))),
+    mirror_dir = os.environ.get("IPYTHON_GLMOL_PDB_MIRROR", None))
@@ -0,0 +1,228 @@
+import logging
+logger = logging.getLogger("ipython_glmol.pdb_reader")
+
+import re
+import gzip
+import mmap
+from contextlib import contextmanager
+
+default_record_types = ("ATOM", "HETATM", "TER", "HELIX", "SHEET")
+
+water_residues = ("HOH", "WAT", "DOD", "H2O", "SOL")
+hydrogen_elements = ("H", "D")
+
+@contextmanager
+def open_lines(source, use_mmap = True):
+    """Open source as iterator over lines.
+
+    source - File path, gzip compressed if ending in '.gz', or file-like object.
+    use_mmap - Memory map uncompressed local files.
+    """
+    if not isinstance(source, basestring):
+        yield iter(source)
+        return
+
+    if source.endswith(".gz"):
+        with gzip.open(source, "rb") as f:
+            yield iter(f)
+        return
+
+    with open(source, "rb") as f:
+        if use_mmap:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, mmap.error):
+                # Empty or unmappable file
+                mapped = None
+
+            if mapped is not None:
+                try:
+                    yield iter(mapped.readline, "")
+                finally:
+                    mapped.close()
+                return
+
+        yield iter(f)
+
+def _is_hydrogen(line):
+    elem = line[76:78].strip()
+    if elem:
+        return elem in hydrogen_elements
+    else:
+        return line[12:16].strip()[:1] in hydrogen_elements
+
+def filter_pdb_records(lines, record_types = default_record_types, drop_waters = False, drop_hydrogens = False, decimate = 1):
+    """Lazily filter pdb lines, stripping line endings.
+
+    record_types - Retained record types.
+    drop_waters - Drop water residue atoms.
+    drop_hydrogens - Drop hydrogen atoms.
+    decimate - Retain atoms of every decimate-th residue.
+    """
+
+    residue_key = None
+    residue_count = -1
+
+    for l in lines:
+        if not l.startswith(record_types):
+            continue
+
+        l = l.rstrip("\r\n")
+
+        if l.startswith(("ATOM", "HETATM")):
+            if drop_waters and l[17:20].strip() in water_residues:
+                continue
+            if drop_hydrogens and _is_hydrogen(l):
+                continue
+
+            if decimate > 1:
+                if l[21:27] != residue_key:
+                    residue_key = l[21:27]
+                    residue_count += 1
+                if residue_count % decimate:
+                    continue
+
+        yield l
+
+_cif_token = re.compile(r"""'[^']*'|"[^"]*"|\S+""")
+
+def _cif_tokens(line):
+    return [t[1:-1] if t[0] in "'\"" else t for t in _cif_token.findall(line)]
+
+def _pdb_atom_name(name, elem):
+    if len(name) < 4 and len(elem) == 1:
+        return " %-3s" % name
+    else:
+        return "%-4s" % name
+
+def _cif_field(row, columns, *names):
+    for n in names:
+        if n in columns:
+            v = row[columns[n]]
+            if not v in ("?", "."):
+                return v
+    return ""
+
+def _cif_atom_line(row, columns):
+    """Pdb atom line of an _atom_site loop row."""
+    elem = _cif_field(row, columns, "type_symbol")
+    name = _cif_field(row, columns, "auth_atom_id", "label_atom_id")
+    resi = _cif_field(row, columns, "auth_seq_id", "label_seq_id")
+
+    return "%-6s%5i %s%1s%3s %1s%4i%1s   %8.3f%8.3f%8.3f%6.2f%6.2f          %2s" % (
+        _cif_field(row, columns, "group_PDB") or "ATOM",
+        int(_cif_field(row, columns, "id") or 0) % 100000,
+        _pdb_atom_name(name, elem),
+        _cif_field(row, columns, "label_alt_id")[:1],
+        _cif_field(row, columns, "auth_comp_id", "label_comp_id")[:3],
+        _cif_field(row, columns, "auth_asym_id", "label_asym_id")[:1],
+        int(resi or 0) % 10000,
+        _cif_field(row, columns, "pdbx_PDB_ins_code")[:1],
+        float(row[columns["Cartn_x"]]),
+        float(row[columns["Cartn_y"]]),
+        float(row[columns["Cartn_z"]]),
+        float(_cif_field(row, columns, "occupancy") or 1.0),
+        float(_cif_field(row, columns, "B_iso_or_equiv") or 0.0),
+        elem[:2])
+
+def cif_atom_site_records(lines):
+    """Lazily convert mmCIF _atom_site loop rows of the first model to pdb atom lines.
+
+    Loop values are read as a token stream, rows may span several lines and
+    include semicolon-delimited text fields. An incomplete final row is
+    discarded with a warning.
+    """
+
+    columns = {}
+    state = "scan"
+    first_model = None
+
+    values = []
+    text_field = None
+
+    for l in lines:
+        if text_field is not None:
+            # Text field lines, up to a line starting with ';'
+            if l.startswith(";"):
+                values.append("\n".join(text_field))
+                text_field = None
+                l = l[1:]
+            else:
+                text_field.append(l.rstrip("\r\n"))
+                continue
+        elif state != "scan" and columns and l.startswith(";"):
+            state = "rows"
+            text_field = [l[1:].rstrip("\r\n")]
+            continue
+
+        l = l.strip()
+
+        if state == "scan":
+            if l == "loop_":
+                state = "header"
+                columns = {}
+            continue
+
+        if state == "header":
+            if l.startswith("_atom_site."):
+                columns[l.split()[0][len("_atom_site."):]] = len(columns)
+                continue
+            elif l.startswith("_") or not columns:
+                # Loop of another category
+                state = "scan"
+                continue
+            else:
+                state = "rows"
+
+        if not l:
+            continue
+        if l.startswith(("#", "_", "loop_", "data_")):
+            # End of atom_site loop
+            break
+
+        values.extend(_cif_tokens(l))
+        while len(values) >= len(columns):
+            row = values[:len(columns)]
+            del values[:len(columns)]
+
+            model = _cif_field(row, columns, "pdbx_PDB_model_num")
+            if first_model is None:
+                first_model = model
+            elif model != first_model:
+                return
+
+            yield _cif_atom_line(row, columns)
+
+    if values or text_field is not None:
+        logger.warning("Discarding incomplete _atom_site row, %i of %i values: %r", len(values), len(columns), values)
+
+def guess_format(source):
+    """Guess structure format, "pdb" or "cif", from source path."""
+    if isinstance(source, basestring):
+        name = source[:-3] if source.endswith(".gz") else source
+        if name.endswith((".cif", ".mmcif")):
+            return "cif"
+    return "pdb"
+
+def read_pdb_string(source, format = None, use_mmap = True, **filters):
+    """Read filtered pdb string from pdb or mmCIF source.
+
+    Records are filtered while streaming the source, only retained lines
+    are held in memory. See open_lines and filter_pdb_records.
+    """
+    if format is None:
+        format = guess_format(source)
+
+    with open_lines(source, use_mmap) as lines:
+        if format == "cif":
+            lines = cif_atom_site_records(lines)
+        elif format != "pdb":
+            raise ValueError("Invalid structure format: %r" % format)
+
+        return "\n".join(filter_pdb_records(lines, **filters))
+
+def read_embed(source, format = None, use_mmap = True, residue_properties = None, transport = "text", lod = None, **filters):
+    """Create PDBEmbed from pdb or mmCIF source, see read_pdb_string."""
+    from .glmol_embed import PDBEmbed
+
+    return PDBEmbed(read_pdb_string(source, format, use_mmap, **filters), residue_properties, transport, lod)
@@ -0,0 +1,280 @@
+import logging
+logger = logging.getLogger("ipython_glmol.picking")
+
+import numpy
+
+# Atom table columns included in pick info
+pick_atom_columns = ("serial", "name", "resn", "chain", "resi", "icode", "elem", "b", "occupancy", "residue_number")
+
+# Pick info columns of coarse level-of-detail pseudo-atoms, see lod.lod_levels.
+# Trace level atoms are source atoms, picked with all columns.
+coarse_pick_columns = {
+    "centroid" : ("serial", "resn", "chain", "resi", "icode", "residue_number"),
+    "chain" : ("serial", "chain"),
+}
+
+# Maximum requests answered per batch, earlier requests are dropped
+max_batch_requests = 64
+
+class AtomLookup(object):
+    """Atom table row lookup by atom serial number."""
+
+    def __init__(self, atoms):
+        serial = atoms["serial"]
+        self.order = numpy.argsort(serial, kind="mergesort")
+        self.sorted_serial = serial[self.order]
+
+    def rows(self, serials):
+        """Atom table rows of the first atom with each serial, -1 for unknown serials."""
+        serials = numpy.asarray(serials, dtype=numpy.int64)
+        if not len(self.sorted_serial):
+            return numpy.full(len(serials), -1, dtype=int)
+
+        positions = numpy.searchsorted(self.sorted_serial, serials)
+        clipped = numpy.minimum(positions, len(self.sorted_serial) - 1)
+        found = (positions < len(self.sorted_serial)) & (self.sorted_serial[clipped] == serials)
+
+        return numpy.where(found, self.order[clipped], -1)
+
+def _json_value(value):
+    """Json-serializable python value of numpy value, None for NaN."""
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    if isinstance(value, numpy.float32):
+        # Shortest float32 precision, rather than the float64 expansion
+        value = float("%.7g" % value)
+    elif isinstance(value, numpy.generic):
+        value = value.item()
+    if isinstance(value, float) and not numpy.isfinite(value):
+        return None
+    return value
+
+def atom_info(embed, row, level = None):
+    """Pick info of atom table row, atom columns with atom and residue property values.
+
+    level - Coarse level of the picked pseudo-atom, row is its source atom.
+        Centroid info omits atom values, chain info omits residue values.
+    """
+    atom = embed.atom_table[row]
+    residue = atom["residue_number"]
+
+    info = dict((c, _json_value(atom[c])) for c in coarse_pick_columns.get(level, pick_atom_columns))
+    info["residue_properties"] = dict(
+        (k, _json_value(v[residue])) for k, v in embed.residue_properties.items()
+        if residue < len(v) and level != "chain")
+    info["atom_properties"] = dict(
+        (k, _json_value(v[row])) for k, v in embed.atom_properties.items()
+        if row < len(v) and not level in coarse_pick_columns)
+
+    return info
+
+def pick_response(embed, requests):
+    """Pick info responses to a batch of viewer pick requests.
+
+    requests - List of dict(id, kind, serial, level), kind is "hover" or "click".
+        level is the coarse level of picks on level-of-detail displays, see atom_info.
+        Only the last hover request of a batch is answered.
+
+    returns - List of dict(id, kind, serial, level, info), info is None for unknown atoms.
+    """
+    hovers = [r for r in requests if r.get("kind") == "hover"]
+    requests = [r for r in requests if r.get("kind") != "hover"] + hovers[-1:]
+    if len(requests) > max_batch_requests:
+        logger.warning("Dropping %i pick requests.", len(requests) - max_batch_requests)
+        requests = requests[-max_batch_requests:]
+
+    rows = embed.atom_lookup.rows([int(r["serial"]) for r in requests])
+
+    return [
+        dict(id = r.get("id"), kind = r.get("kind"), serial = r["serial"], level = r.get("level"),
+            info = atom_info(embed, row, r.get("level")) if row >= 0 else None)
+        for r, row in zip(requests, rows.tolist())]
+
+_enable_picking_js_template = """
+        ipython_glmol.enable_picking(%(embed_id)s);
+"""
+
+_picking_support_js = """
+    if (ipython_glmol.enable_picking === undefined)
+    {
+        // Screen distance of picked atoms, hover debounce, and pick info cache lifetime.
+        ipython_glmol.pick_radius = 6;
+        ipython_glmol.pick_debounce_ms = 120;
+        ipython_glmol.pick_cache_ms = 5000;
+        ipython_glmol.pick_timeout_ms = 2000;
+
+        // Front-most atom within pick_radius pixels of container position x, y.
+        ipython_glmol.pick_atom = function (viewer, x, y)
+        {
+            var width = viewer.container.width(), height = viewer.container.height(),
+                radius = ipython_glmol.pick_radius, camera = viewer.camera,
+                projector = THREE.Projector ? new THREE.Projector() : null,
+                serials = viewer.getAllAtoms(), v = new THREE.Vector3(), best = null, best_z = Infinity;
+
+            viewer.scene.updateMatrixWorld(true);
+            var matrix = viewer.modelGroup.matrixWorld;
+
+            for (var i = 0; i < serials.length; i++)
+            {
+                var atom = viewer.atoms[serials[i]];
+                v.set(atom.x, atom.y, atom.z);
+                if (v.applyMatrix4) { v.applyMatrix4(matrix); } else { matrix.multiplyVector3(v); }
+                if (v.project) { v.project(camera); } else { projector.projectVector(v, camera); }
+
+                var dx = (v.x + 1) * width / 2 - x, dy = (1 - v.y) * height / 2 - y;
+                if (dx * dx + dy * dy <= radius * radius && v.z < best_z) { best = atom; best_z = v.z; }
+            }
+
+            return best;
+        };
+
+        // Coarse level pseudo-atoms are labeled by their source residue or chain.
+        ipython_glmol.format_pick_info = function (atom, info, level)
+        {
+            var label = level == 'chain' ? 'chain ' + atom.chain :
+                level == 'centroid' ? atom.chain + ' ' + atom.resn + ' ' + atom.resi :
+                atom.chain + ' ' + atom.resn + ' ' + atom.resi + ' ' + atom.atom + ' #' + atom.serial;
+            var lines = [label];
+            function add_values(values)
+            {
+                for (var name in values)
+                {
+                    var value = values[name];
+                    lines.push(name + ': ' + (typeof value == 'number' ? +value.toPrecision(4) : value));
+                }
+            }
+            if (info) { add_values(info.residue_properties); add_values(info.atom_properties); }
+            return lines.join('\\n');
+        };
+
+        ipython_glmol.show_pick_info = function (viewer, kind, atom, info)
+        {
+            var picking = viewer.picking, label = kind == 'hover' ? picking.tooltip : picking.label;
+            if (!atom) { label.hide(); return; }
+
+            label.text(ipython_glmol.format_pick_info(atom, info, ipython_glmol.coarse_level(viewer))).show();
+            if (kind == 'hover') { label.css({left: picking.x + 12, top: picking.y + 12}); }
+        };
+
+        // Send queued requests, unless a batch is in flight. Flushes again once
+        // an unanswered batch times out.
+        ipython_glmol.flush_pick_requests = function (viewer)
+        {
+            var picking = viewer.picking;
+            clearTimeout(picking.timer);
+            picking.timer = null;
+
+            if (!picking.queue.length) { return; }
+            if (picking.in_flight)
+            {
+                var remaining = ipython_glmol.pick_timeout_ms - (new Date() - picking.in_flight);
+                if (remaining > 0)
+                {
+                    picking.timer = setTimeout(function () { ipython_glmol.flush_pick_requests(viewer); }, remaining);
+                    return;
+                }
+            }
+
+            // Offline once the kernel failed a request, atoms show viewer info only.
+            var comm = picking.offline ? null : ipython_glmol.viewer_comm(viewer);
+            if (!comm) { picking.queue = []; return; }
+
+            comm.send({type: 'pick', embed_id: viewer.id, requests: picking.queue});
+            picking.queue = [];
+            picking.in_flight = new Date();
+        };
+
+        // Show atom info, requesting kernel info unless cached. Requests are sent
+        // in batches, at most one batch in flight per viewer.
+        ipython_glmol.request_pick_info = function (viewer, kind, atom)
+        {
+            var picking = viewer.picking;
+            picking.shown[kind] = atom ? atom.serial : null;
+            if (!atom) { ipython_glmol.show_pick_info(viewer, kind, null); return; }
+
+            var cached = picking.cache[atom.serial];
+            if (cached && new Date() - cached.time < ipython_glmol.pick_cache_ms)
+            {
+                ipython_glmol.show_pick_info(viewer, kind, atom, cached.info);
+                if (kind == 'hover') { return; }
+            }
+            else
+            {
+                ipython_glmol.show_pick_info(viewer, kind, atom, null);
+            }
+
+            if (kind == 'hover')
+            {
+                picking.queue = $.grep(picking.queue, function (r) { return r.kind != 'hover'; });
+            }
+            picking.queue.push({id: picking.next_id++, kind: kind, serial: atom.serial, level: ipython_glmol.coarse_level(viewer)});
+
+            if (!picking.timer) { picking.timer = setTimeout(function () { ipython_glmol.flush_pick_requests(viewer); }, 0); }
+        };
+
+        ipython_glmol.handlers.pick_info = function (viewer, data)
+        {
+            var picking = viewer.picking;
+            if (!picking) { return; }
+            picking.in_flight = null;
+
+            for (var i = 0; i < data.responses.length; i++)
+            {
+                // Responses to picks on the coarse level are dropped once refined
+                var response = data.responses[i];
+                if ((response.level || null) !== ipython_glmol.coarse_level(viewer)) { continue; }
+
+                picking.cache[response.serial] = {info: response.info, time: new Date()};
+                if (picking.shown[response.kind] === response.serial)
+                {
+                    ipython_glmol.show_pick_info(viewer, response.kind, viewer.atoms[response.serial], response.info);
+                }
+            }
+
+            ipython_glmol.flush_pick_requests(viewer);
+        };
+
+        ipython_glmol.enable_picking = function (viewer)
+        {
+            var container = viewer.container.css('position', 'relative'),
+                style = {position: 'absolute', 'white-space': 'pre', 'pointer-events': 'none', 'font-size': 'small',
+                    background: 'rgba(255, 255, 255, 0.85)', color: 'black', padding: '2px 4px', 'z-index': 10},
+                picking = viewer.picking = {
+                    queue: [], cache: {}, shown: {}, next_id: 0, timer: null, in_flight: null, x: 0, y: 0,
+                    tooltip: $('<div/>').css(style).hide().appendTo(container),
+                    label: $('<div/>').css(style).css({left: 4, top: 4}).hide().appendTo(container)},
+                hover_timer = null, down = null;
+
+            function position(e)
+            {
+                var offset = container.offset();
+                return {x: e.pageX - offset.left, y: e.pageY - offset.top};
+            }
+
+            container.on('mousemove', function (e)
+            {
+                clearTimeout(hover_timer);
+                if (down) { picking.tooltip.hide(); return; }
+
+                var p = position(e);
+                picking.x = p.x; picking.y = p.y;
+                hover_timer = setTimeout(function ()
+                {
+                    ipython_glmol.request_pick_info(viewer, 'hover', ipython_glmol.pick_atom(viewer, p.x, p.y));
+                }, ipython_glmol.pick_debounce_ms);
+            });
+            container.on('mouseleave', function ()
+            {
+                clearTimeout(hover_timer);
+                ipython_glmol.request_pick_info(viewer, 'hover', null);
+            });
+            container.on('mousedown', function (e) { down = position(e); });
+            container.on('mouseup', function (e)
+            {
+                var p = position(e), clicked = down && Math.abs(p.x - down.x) + Math.abs(p.y - down.y) < 4;
+                down = null;
+                if (clicked) { ipython_glmol.request_pick_info(viewer, 'click', ipython_glmol.pick_atom(viewer, p.x, p.y)); }
+            });
+        };
+    }
+"""
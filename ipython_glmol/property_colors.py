@@ -0,0 +1,122 @@
+import logging
+logger = logging.getLogger("ipython_glmol.property_colors")
+
+import numpy
+
+from .transport import encode_array
+from .live import pack_colors
+
+# Atom table columns available as atom properties
+atom_table_properties = ("b", "occupancy")
+
+def code_dtype(n_colors):
+    """Smallest code dtype holding n_colors colors and the invalid and unselected codes."""
+    if n_colors + 2 <= 2 ** 8:
+        return numpy.uint8
+    elif n_colors + 2 <= 2 ** 16:
+        return numpy.uint16
+    else:
+        raise ValueError("Invalid color count: %i, at most %i colors are supported." % (n_colors, 2 ** 16 - 2))
+
+def quantize_property(values, n_colors, vmin = None, vmax = None):
+    """Quantize values into n_colors bins over [vmin, vmax].
+
+    vmin, vmax - Value range, defaulting to the range of finite values.
+
+    returns - Code array, invalid values are coded n_colors.
+    """
+    values = numpy.asarray(values, dtype=float)
+    valid = numpy.isfinite(values)
+
+    if vmin is None:
+        vmin = values[valid].min() if valid.any() else 0.0
+    if vmax is None:
+        vmax = values[valid].max() if valid.any() else 0.0
+    scale = n_colors / float(vmax - vmin) if vmax > vmin else 0.0
+
+    codes = numpy.empty(len(values), dtype=code_dtype(n_colors))
+    codes[valid] = numpy.clip(numpy.floor((values[valid] - vmin) * scale), 0, n_colors - 1)
+    codes[~valid] = n_colors
+
+    return codes
+
+def resolve_colormap(colors):
+    """Matplotlib colormap from colormap, colormap name or list of colors."""
+    import matplotlib.cm
+    import matplotlib.colors
+
+    if isinstance(colors, matplotlib.colors.Colormap):
+        return colors
+    elif isinstance(colors, basestring) or colors is None:
+        return matplotlib.cm.get_cmap(colors)
+    else:
+        return matplotlib.colors.LinearSegmentedColormap.from_list("property_colors", colors)
+
+def colormap_table(cmap, n_colors):
+    """Color lookup table of n_colors bin colors followed by the invalid value color.
+
+    returns - uint32 0xRRGGBB array (n_colors + 1)
+    """
+    bin_values = numpy.ma.masked_invalid(numpy.r_[(numpy.arange(n_colors) + .5) / n_colors, numpy.nan])
+    return pack_colors(cmap(bin_values))
+
+def property_values(embed, name):
+    """Values of the named atom or residue property of embed.
+
+    Properties are looked up in atom_properties, residue_properties, then
+    the atom table columns in atom_table_properties.
+
+    returns - (values, level), level is "atom" or "residue".
+    """
+    if name in embed.atom_properties:
+        return numpy.asarray(embed.atom_properties[name]), "atom"
+    elif name in embed.residue_properties:
+        return numpy.asarray(embed.residue_properties[name]), "residue"
+    elif name in atom_table_properties:
+        return embed.atom_table[name], "atom"
+    else:
+        raise ValueError("Unable to load property: %s Available properties: %s" % (
+            name, sorted(set(embed.atom_properties) | set(embed.residue_properties) | set(atom_table_properties))))
+
+def atom_codes(embed, name, n_colors, vmin = None, vmax = None):
+    """Per-atom color codes of the named property, see quantize_property.
+
+    Residue properties are indexed by atom residue_number.
+    """
+    values, level = property_values(embed, name)
+    atoms = embed.atom_table
+
+    if level == "atom":
+        if len(values) != len(atoms):
+            raise ValueError("Invalid atom property %s length: %i for %i atoms" % (name, len(values), len(atoms)))
+        return quantize_property(values, n_colors, vmin, vmax)
+    else:
+        n_residues = atoms["residue_number"][-1] + 1 if len(atoms) else 0
+        if len(values) < n_residues:
+            raise ValueError("Invalid residue property %s length: %i for %i residues" % (name, len(values), n_residues))
+        return quantize_property(values, n_colors, vmin, vmax)[atoms["residue_number"]]
+
+def pack_property_colors(property_colors, atoms, include_serial = True):
+    """Json-serializable property color buffers.
+
+    include_serial - Include atom serial numbers, the viewer reuses previously
+        sent serial numbers if False.
+    """
+    if property_colors is None:
+        return None
+
+    codes = property_colors["codes"]
+    packed = dict(
+        property = property_colors["property"],
+        code_type = numpy.dtype(codes.dtype).name,
+        codes = encode_array(codes, codes.dtype),
+        table = encode_array(property_colors["table"], "uint32"))
+
+    if include_serial:
+        packed["serial"] = encode_array(atoms["serial"], "int32")
+
+    return packed
+
+_property_colors_load_js_template = """
+        ipython_glmol.set_property_colors(%(embed_id)s, %(property_colors_json)s, false);
+"""
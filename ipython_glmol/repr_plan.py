@@ -0,0 +1,109 @@
+import logging
+logger = logging.getLogger("ipython_glmol.repr_plan")
+
+from .glmol_embed import PDBEmbed, EmbedReprModifier, CompositeReprModifier
+from .lru_cache import LRUCache
+
+# Compiled plans by modifier stack, see repr_plan
+plan_cache = LRUCache(64)
+
+def flatten_modifiers(modifiers):
+    """Modifier stack as flat list of modifiers."""
+    if isinstance(modifiers, CompositeReprModifier):
+        modifiers = modifiers.modifiers
+    elif isinstance(modifiers, EmbedReprModifier):
+        return [modifiers]
+
+    flat = []
+    for m in modifiers:
+        flat.extend(flatten_modifiers(m))
+    return flat
+
+# Placeholder for repr entries present before a compiled segment
+_prior_entries = object()
+
+def _compile_segment(modifiers):
+    """Repr entry changes of structure invariant modifiers.
+
+    returns - [(repr_type, replace, entries, lines)], replace if the segment
+        replaces prior entries of the repr type, otherwise extends them.
+    """
+    scratch = PDBEmbed("")
+    scratch.repr_entries.default_factory = lambda: [_prior_entries]
+    for m in modifiers:
+        m.apply_to_embed(scratch)
+
+    changes = []
+    for repr_type, entries in scratch.repr_entries.items():
+        replace = not entries or entries[0] is not _prior_entries
+        entries = tuple(entries if replace else entries[1:])
+        if replace or entries:
+            lines = "\n".join("%s:%s" % (repr_type, selection) for selection in entries)
+            changes.append((repr_type, replace, entries, lines))
+
+    return changes
+
+class ReprPlan(EmbedReprModifier):
+    """Modifier stack compiled to serialized repr entries.
+
+    Consecutive structure invariant modifiers, see
+    EmbedReprModifier.structure_invariant, are applied once at compile time
+    and recorded with their serialized repr lines. Applying the plan adds the
+    recorded entries and lines without re-running these modifiers. Structure
+    dependent modifiers, such as ResidueSpectrum or spatial selections, are
+    re-applied to each embed in stack order.
+
+    Recorded entries do not depend on the embed structure, a plan applies to
+    embeds of any topology.
+    """
+
+    def __init__(self, modifiers):
+        self.modifiers = flatten_modifiers(modifiers)
+
+        # List of ("entries", changes) and ("modifier", modifier) steps
+        self.steps = []
+        segment = []
+        for m in self.modifiers + [None]:
+            if m is not None and m.structure_invariant:
+                segment.append(m)
+                continue
+
+            if segment:
+                self.steps.append(("entries", _compile_segment(segment)))
+                segment = []
+            if m is not None:
+                self.steps.append(("modifier", m))
+
+    @property
+    def dynamic_modifiers(self):
+        """Modifiers re-applied to each embed."""
+        return [s for t, s in self.steps if t == "modifier"]
+
+    def apply_to_embed(self, embed):
+        for step_type, step in self.steps:
+            if step_type == "entries":
+                for repr_type, replace, entries, lines in step:
+                    embed.add_repr_lines(repr_type, entries, lines, replace)
+            else:
+                step.apply_to_embed(embed)
+
+    def __repr__(self):
+        return "%s(modifiers = %i, dynamic_modifiers = %i)" % (
+            self.__class__.__name__, len(self.modifiers), len(self.dynamic_modifiers))
+
+def repr_plan(modifiers):
+    """Cached ReprPlan of modifier stack.
+
+    Plans are cached by modifier identity, modifiers must not be changed
+    after compilation. Cached plans reference their modifiers, keeping the
+    modifier ids of cache keys unique.
+    """
+    modifiers = flatten_modifiers(modifiers)
+    key = tuple(id(m) for m in modifiers)
+
+    plan = plan_cache.get(key)
+    if plan is None:
+        logger.debug("Compiling repr plan: %i modifiers", len(modifiers))
+        plan = plan_cache[key] = ReprPlan(modifiers)
+
+    return plan
@@ -0,0 +1,136 @@
+import logging
+logger = logging.getLogger("ipython_glmol.rosetta_pose")
+
+import re
+import hashlib
+
+import numpy
+
+from .atom_table import atom_dtype
+from .lru_cache import LRUCache
+
+# Pose data memoized by pose fingerprint
+pose_cache = LRUCache(32)
+
+def pose_coordinates(pose):
+    """Coordinates of all pose atoms, in residue and residue atom order, as (n_atoms, 3) array."""
+    xyz = []
+    for i in range(1, pose.n_residue() + 1):
+        residue = pose.residue(i)
+        for j in range(1, residue.natoms() + 1):
+            v = residue.xyz(j)
+            xyz.append((v.x, v.y, v.z))
+
+    return numpy.array(xyz, dtype=numpy.float64).reshape((-1, 3))
+
+def pose_fingerprint(pose, xyz = None):
+    """Conformation fingerprint of pose: sequence, secondary structure, residue labels and all atom coordinates.
+
+    xyz - Pose coordinates, see pose_coordinates, read from pose if None.
+    """
+    if xyz is None:
+        xyz = pose_coordinates(pose)
+
+    n_residue = pose.n_residue()
+    pdb_info = pose.pdb_info()
+
+    residues = numpy.empty(n_residue, dtype=[("natoms", "i4"), ("chain", "S1"), ("resi", "i4"), ("icode", "S1")])
+    for i in range(n_residue):
+        residues["natoms"][i] = pose.residue(i + 1).natoms()
+        if pdb_info is not None:
+            residues["chain"][i] = pdb_info.chain(i + 1)
+            residues["resi"][i] = pdb_info.number(i + 1)
+            residues["icode"][i] = pdb_info.icode(i + 1)
+        else:
+            residues["chain"][i] = chr(ord("A") + (pose.chain(i + 1) - 1) % 26)
+            residues["resi"][i] = i + 1
+            residues["icode"][i] = " "
+
+    digest = hashlib.sha1(pose.sequence())
+    digest.update(pose.secstruct())
+    digest.update(residues.tostring())
+    digest.update(numpy.ascontiguousarray(xyz, dtype=numpy.float64).tostring())
+
+    return digest.hexdigest()
+
+def pose_atom_table(pose, xyz = None):
+    """Atom table of pose, read directly from pose residues.
+
+    xyz - Pose coordinates, see pose_coordinates, read from pose if None.
+    """
+    if xyz is None:
+        xyz = pose_coordinates(pose)
+
+    pdb_info = pose.pdb_info()
+
+    n_atoms = len(xyz)
+    atoms = numpy.zeros(n_atoms, dtype=atom_dtype)
+    atoms["altloc"] = " "
+    atoms["icode"] = " "
+
+    a = 0
+    for i in range(1, pose.n_residue() + 1):
+        residue = pose.residue(i)
+        natoms = residue.natoms()
+        s = slice(a, a + natoms)
+
+        if pdb_info is not None:
+            atoms["chain"][s] = pdb_info.chain(i)
+            atoms["resi"][s] = pdb_info.number(i)
+            atoms["icode"][s] = pdb_info.icode(i)
+        else:
+            atoms["chain"][s] = chr(ord("A") + (pose.chain(i) - 1) % 26)
+            atoms["resi"][s] = i
+
+        atoms["resn"][s] = residue.name3()
+        atoms["hetflag"][s] = not residue.is_polymer()
+        atoms["residue_number"][s] = i - 1
+        atoms["chain_number"][s] = pose.chain(i) - 1
+
+        atoms["name"][s] = [residue.atom_name(j).strip() for j in range(1, natoms + 1)]
+        atoms["elem"][s] = [residue.atom_type(j).element() for j in range(1, natoms + 1)]
+        a += natoms
+
+    atoms["xyz"] = xyz
+    atoms["serial"] = numpy.arange(1, n_atoms + 1)
+    atoms["occupancy"] = 1.0
+
+    return atoms
+
+def pose_residue_properties(pose):
+    """Residue properties of pose, residue_number and per-term residue energies as arrays."""
+    residue_properties = {}
+    residue_properties["residue_number"] = numpy.arange(pose.n_residue())
+
+    if pose.energies().energies_updated() and hasattr( pose.energies(), "residue_total_energies_array"):
+        residue_energies = pose.energies().residue_total_energies_array()
+        for n in residue_energies.dtype.names:
+            residue_properties[n] = residue_energies[n]
+
+    return residue_properties
+
+def pose_secstruct(pose):
+    """Pose secondary structure, performing DSSP if pose has no assignment."""
+    ss_string = pose.secstruct()
+    # Missing pose secondary structure assignment, recalculate
+    if not re.search("[^L]", ss_string):
+        import rosetta.core.scoring.dssp
+        logger.debug("Performing DSSP.")
+        ss_string = rosetta.core.scoring.dssp.Dssp(pose).get_dssp_secstruct()
+
+    return ss_string
+
+def pose_embed_data(pose):
+    """Memoized (atom table, secondary structure) of pose, keyed by pose_fingerprint.
+
+    No pdb string is formatted, pose embeds use binary transport.
+    """
+    xyz = pose_coordinates(pose)
+    fingerprint = pose_fingerprint(pose, xyz)
+    if not fingerprint in pose_cache:
+        atoms = pose_atom_table(pose, xyz)
+        # Shared between embeds of the same conformation
+        atoms.flags.writeable = False
+        pose_cache[fingerprint] = (atoms, pose_secstruct(pose))
+
+    return pose_cache[fingerprint]
@@ -0,0 +1,269 @@
+import logging
+logger = logging.getLogger("ipython_glmol.selection_engine")
+
+import re
+
+import numpy
+
+from .glmol_selectors import GLMolSelector, GLMolSubSelector, SpatialSelector, ResidueNumber, Atom
+from .spatial_index import CellList
+
+# Atom table column of each type selector, by selector name
+type_selector_columns = {
+    "chain" : "chain",
+    "chain_number" : "chain_number",
+    "resi" : "resi",
+    "residue_number" : "residue_number",
+    "atomi" : "serial",
+}
+
+backbone_atom_names = ("N", "CA", "C", "O")
+
+_range_pattern = re.compile(r"^(-?\d+)-(-?\d+)$")
+
+def parse_selection_values(value_string, numeric = True):
+    """Parse comma-separated selection values and inclusive 'start-end' ranges.
+
+    returns - List of (low, high) inclusive value ranges.
+    """
+    values = []
+    for v in value_string.split(","):
+        v = v.strip()
+        if not v:
+            continue
+
+        range_match = _range_pattern.match(v) if numeric else None
+        if range_match:
+            values.append((int(range_match.group(1)), int(range_match.group(2))))
+        elif numeric:
+            values.append((int(v), int(v)))
+        else:
+            values.append((v, v))
+
+    return values
+
+def mask_ranges(mask):
+    """Contiguous [start, stop) index ranges of true values in mask, as (n, 2) array."""
+    edges = numpy.flatnonzero(numpy.diff(numpy.r_[False, mask, False].astype(numpy.int8)))
+    return edges.reshape((-1, 2))
+
+class ColumnIndex(object):
+    """Sorted index of an atom table column, resolving value ranges to atoms."""
+
+    def __init__(self, values):
+        self.is_sorted = len(values) < 2 or bool(numpy.all(values[1:] >= values[:-1]))
+
+        if self.is_sorted:
+            self.order = None
+            self.sorted_values = values
+        else:
+            self.order = numpy.argsort(values, kind="mergesort")
+            self.sorted_values = values[self.order]
+
+    def select(self, mask, low, high):
+        """Set mask for atoms with low <= value <= high."""
+        start = numpy.searchsorted(self.sorted_values, low, "left")
+        stop = numpy.searchsorted(self.sorted_values, high, "right")
+
+        if self.order is None:
+            mask[start:stop] = True
+        else:
+            mask[self.order[start:stop]] = True
+
+class SelectionEngine(object):
+    """Evaluates selectors and selection strings to atom masks over an atom table.
+
+    Masks are cached per selection and returned read-only. Type selections
+    resolve through per-column sorted indexes, ranges are inclusive. Spatial
+    selections resolve through a cell list over atom coordinates, built on
+    first use.
+    """
+
+    def __init__(self, atoms):
+        self.atoms = atoms
+        self._column_indexes = {}
+        self._mask_cache = {}
+        self._spatial_index = None
+
+    def column_index(self, column):
+        if not column in self._column_indexes:
+            self._column_indexes[column] = ColumnIndex(self.atoms[column])
+        return self._column_indexes[column]
+
+    @property
+    def spatial_index(self):
+        """CellList over atom coordinates."""
+        if self._spatial_index is None:
+            self._spatial_index = CellList(self.atoms["xyz"])
+        return self._spatial_index
+
+    def near_mask(self, of_mask, distance, target_mask = None):
+        """Mask of atoms within distance of any atom in of_mask.
+
+        target_mask - Restrict result to target atoms, pruning of_mask atoms
+            far from any target atom before computing distances.
+        """
+        index = self.spatial_index
+
+        query = numpy.flatnonzero(of_mask)
+        if target_mask is not None:
+            query = query[index.near_cells(target_mask, distance)[query]]
+
+        mask = index.within_mask(self.atoms["xyz"][query], distance)
+        if target_mask is not None:
+            mask &= target_mask
+
+        return mask
+
+    def residue_mask(self, mask):
+        """Mask of all atoms in residues containing any atom in mask."""
+        residue_numbers = self.atoms["residue_number"]
+        residues = numpy.zeros(residue_numbers.max() + 1 if len(residue_numbers) else 0, dtype=bool)
+        residues[residue_numbers[mask]] = True
+        return residues[residue_numbers]
+
+    def _spatial_mask(self, selector):
+        if selector.subselections:
+            mask = self.mask(selector.with_subselections(())).copy()
+            for subselection in selector.subselections:
+                mask &= self.mask(subselection)
+        else:
+            mask = selector.atom_mask(self)
+            if selector.complete_residues:
+                mask = self.residue_mask(mask)
+
+        return mask
+
+    def resolve(self, selector):
+        """Type selector selecting the atoms of a spatial selector.
+
+        Complete residue selections resolve to residue number ranges, atom
+        selections to atom serial ranges.
+        """
+        if not isinstance(selector, SpatialSelector):
+            return selector
+
+        mask = self.mask(selector.with_subselections(()))
+        if selector.complete_residues:
+            values, resolved_type = numpy.unique(self.atoms["residue_number"][mask]), ResidueNumber
+        else:
+            values, resolved_type = numpy.unique(self.atoms["serial"][mask]), Atom
+
+        # Inclusive runs of consecutive values
+        breaks = numpy.flatnonzero(numpy.diff(values) != 1) + 1
+        if len(values):
+            runs = zip(values[numpy.r_[0, breaks]].tolist(), values[numpy.r_[breaks, len(values)] - 1].tolist())
+        else:
+            runs = []
+
+        return resolved_type([slice(start, end) if end > start else start for start, end in runs], selector.subselections)
+
+    def _type_mask(self, selector_name, value_string):
+        if not selector_name in type_selector_columns:
+            raise ValueError("Unknown selector: %r" % selector_name)
+
+        column = type_selector_columns[selector_name]
+        numeric = self.atoms.dtype[column].kind in "iu"
+
+        index = self.column_index(column)
+        mask = numpy.zeros(len(self.atoms), dtype=bool)
+        for low, high in parse_selection_values(value_string, numeric):
+            index.select(mask, low, high)
+
+        return mask
+
+    def _subselector_mask(self, subselector):
+        if subselector == "heavy":
+            return self.atoms["elem"] != "H"
+        elif subselector == "bb":
+            return numpy.in1d(self.atoms["name"], backbone_atom_names)
+        elif subselector.startswith("elem "):
+            return numpy.in1d(self.atoms["elem"], [e.strip() for e in subselector[5:].split(",")])
+        else:
+            raise ValueError("Unknown subselector: %r" % subselector)
+
+    def _evaluate(self, selection_string):
+        terms = [t.strip() for t in selection_string.split(";")]
+
+        selector = terms[0]
+        if selector == "all":
+            mask = numpy.ones(len(self.atoms), dtype=bool)
+        else:
+            selector_name, _, value_string = selector.partition(" ")
+            mask = self._type_mask(selector_name, value_string)
+
+        for subselector in terms[1:]:
+            mask &= self.mask(subselector)
+
+        return mask
+
+    def mask(self, selection):
+        """Boolean atom mask of selector or selection string."""
+        if isinstance(selection, GLMolSubSelector):
+            selection = selection.selector
+        elif isinstance(selection, SpatialSelector):
+            pass
+        elif isinstance(selection, GLMolSelector):
+            selection = selection.glmol_selection_string
+
+        if not selection in self._mask_cache:
+            if isinstance(selection, SpatialSelector):
+                mask = self._spatial_mask(selection)
+            elif ";" in selection or selection == "all" or selection.partition(" ")[0] in type_selector_columns:
+                mask = self._evaluate(selection)
+            else:
+                mask = self._subselector_mask(selection)
+
+            mask.flags.writeable = False
+            self._mask_cache[selection] = mask
+
+        return self._mask_cache[selection]
+
+    def indices(self, selection):
+        """Atom table indices of selector or selection string."""
+        return numpy.flatnonzero(self.mask(selection))
+
+    def ranges(self, selection):
+        """Contiguous [start, stop) atom table index ranges of selector or selection string."""
+        return mask_ranges(self.mask(selection))
+
+    def count(self, selection):
+        """Number of atoms selected by selector or selection string."""
+        return int(numpy.count_nonzero(self.mask(selection)))
+
+    # Repr types with "<argument>:<selection>" entries
+    argument_repr_types = ("color",)
+    # Repr types without atom selections
+    non_selection_repr_types = ("bgcolor", "view")
+
+    def resolve_repr_entries(self, repr_entries):
+        """Resolve repr entry selections to atom index ranges.
+
+        returns - {repr_type : [(argument, ranges), ...]}, argument is the entry
+            color for color entries and None otherwise.
+        """
+        resolved = {}
+        for repr_type, selections in repr_entries.items():
+            if repr_type in self.non_selection_repr_types:
+                continue
+
+            entries = []
+            for selection in selections:
+                if repr_type in self.argument_repr_types:
+                    argument, _, selection = selection.partition(":")
+                else:
+                    argument = None
+                entries.append((argument, self.ranges(selection)))
+            resolved[repr_type] = entries
+
+        return resolved
+
+    def validate_repr_entries(self, repr_entries):
+        """Repr entries selecting no atoms, as list of (repr_type, selection)."""
+        empty = []
+        for repr_type, entries in self.resolve_repr_entries(repr_entries).items():
+            for selection, (_, ranges) in zip(repr_entries[repr_type], entries):
+                if not len(ranges):
+                    empty.append((repr_type, selection))
+
+        return empty
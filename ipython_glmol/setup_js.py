@@ -4,7 +4,10 @@ logger = logging.getLogger("glmol_embed.setup_js")
 
 import os
 from os import path
-import shutil
+import re
+import errno
+import hashlib
+import tempfile
 
 import subprocess
 import fileinput
@@ -24,46 +27,198 @@ window.GLmol = GLmol;
 source_library_names = ["csscolorparser.js", "three.js", "GLmol.js"]
 source_libraries = [path.join(path.dirname(__file__), "GLmol", "src", "js", l) for l in source_library_names]
 
-def render_js(target_files = source_libraries, js_filter=None):
-    """docstring for do_setup"""
-    logger.info("do_setup(%r)", locals())
+render_cache_dir = os.environ.get(
+    "IPYTHON_GLMOL_JS_CACHE", path.expanduser(path.join("~", ".cache", "ipython_glmol", "js")))
+# Rendered library cache bound, evicting least recently used renders
+render_cache_max_bytes = 16 << 20
+
+# Per-process caches, keyed by file stat so modified sources are re-read.
+_file_digests = {}
+_rendered_js = {}
+
+def _stat_key(target_file):
+    s = os.stat(target_file)
+    return (path.abspath(target_file), s.st_mtime, s.st_size)
+
+def file_digest(target_file):
+    """Content digest of target_file, cached by file path, mtime and size."""
+    key = _stat_key(target_file)
+    if not key in _file_digests:
+        with open(target_file, "rb") as i:
+            _file_digests[key] = hashlib.sha1(i.read()).hexdigest()
+
+    return _file_digests[key]
+
+def library_digest(target_files = None, js_filter = None):
+    """Short content digest of the given source libraries, defaulting to source_libraries, and js filter command."""
+    if target_files is None:
+        target_files = source_libraries
+
+    digest = hashlib.sha1()
+    for f in target_files:
+        digest.update(file_digest(f))
+    if js_filter is not None:
+        digest.update("\0".join(js_filter))
+
+    return digest.hexdigest()[:16]
+
+def _render_js(target_files, js_filter):
+    logger.info("render_js(%r)", dict(target_files = target_files, js_filter = js_filter))
 
     source_js = "".join(l for l in fileinput.FileInput(target_files))
 
     if js_filter is not None:
         cmd = subprocess.Popen(js_filter, stdout=subprocess.PIPE, stdin=subprocess.PIPE)
         source_js, _ = cmd.communicate(source_js)
+        if cmd.returncode != 0:
+            raise subprocess.CalledProcessError(cmd.returncode, js_filter)
 
     return output_template % dict(source_js = source_js)
 
-def install_ipython_js():
+def render_js(target_files = None, js_filter=None, cache_dir = None):
+    """Render GLmol library from target_files, defaulting to source_libraries, optionally filtered by js_filter command.
+
+    Rendered libraries are cached in-process and in cache_dir, defaulting to
+    render_cache_dir, as 'GLmol.render.<digest>.js' keyed by the digest of the
+    source files and filter command. The filter is run at most once per
+    library version across processes. The cache directory is bounded to
+    render_cache_max_bytes, see evict_render_cache.
+    """
+
+    if target_files is None:
+        target_files = source_libraries
+
+    key = (tuple(_stat_key(f) for f in target_files), tuple(js_filter) if js_filter else None)
+    if key in _rendered_js:
+        return _rendered_js[key]
+
+    if cache_dir is None:
+        cache_dir = render_cache_dir
+
+    cache_file = path.join(cache_dir, "GLmol.render.%s.js" % library_digest(target_files, js_filter))
+
+    if path.exists(cache_file):
+        logger.debug("Reading rendered glmol: %s", cache_file)
+        with open(cache_file) as i:
+            rendered = i.read()
+        # Mark render as recently used for eviction.
+        try:
+            os.utime(cache_file, None)
+        except OSError:
+            pass
+    else:
+        rendered = _render_js(target_files, js_filter)
+        try:
+            write_atomic(cache_file, rendered)
+            evict_render_cache(cache_dir, keep = cache_file)
+        except (IOError, OSError) as e:
+            logger.warning("Unable to cache rendered glmol: %s %s", cache_file, e)
+
+    _rendered_js[key] = rendered
+
+    return rendered
+
+def evict_render_cache(cache_dir, max_bytes = None, keep = None):
+    """Remove least recently used renders, other than keep, until cache_dir is within max_bytes.
+
+    max_bytes - Cache bound, defaulting to render_cache_max_bytes. None disables eviction.
+    """
+    if max_bytes is None:
+        max_bytes = render_cache_max_bytes
+    if max_bytes is None or not path.exists(cache_dir):
+        return
+
+    entries = []
+    for f in os.listdir(cache_dir):
+        if not (f.startswith("GLmol.render.") and f.endswith(".js")):
+            continue
+        f = path.join(cache_dir, f)
+        try:
+            s = os.stat(f)
+        except OSError:
+            continue
+        entries.append((s.st_mtime, s.st_size, f))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, f in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        if f == keep:
+            continue
+
+        logger.info("Evicting rendered glmol: %s", f)
+        try:
+            os.unlink(f)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        total_bytes -= size
+
+def write_atomic(output_file, content):
+    """Write content to output_file via a temporary file and rename.
+
+    Concurrent writers of identical content race harmlessly, readers never
+    observe a partially written file."""
+
+    output_dir = path.dirname(output_file)
+    try:
+        os.makedirs(output_dir)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    fd, temp_file = tempfile.mkstemp(dir=output_dir, prefix=".%s." % path.basename(output_file))
+    try:
+        with os.fdopen(fd, "w") as o:
+            o.write(content)
+        os.chmod(temp_file, 0o644)
+        os.rename(temp_file, output_file)
+    except:
+        os.unlink(temp_file)
+        raise
+
+def install_ipython_js(profile_dir = None):
     """Render GLmol library and install into ipython profile static include directory.
     
     Resolves current ipython profile directory and writes the rendered library as:
-    '<ipython_profile_dir>/static/glmol/GLmol.full.devel.js'.
+    '<ipython_profile_dir>/static/glmol/GLmol.<digest>.js', where digest is the
+    content digest of the source libraries. The library is only rendered and
+    written if no file for the current digest exists.
     
     returns - Script url for use in the notebook."""
 
     base_path = "static/glmol"
-    base_name = "GLmol.full.devel.js"
+    base_name = "GLmol.%s.js" % library_digest()
 
-    from IPython.utils.path import locate_profile
-    base_dir = path.join(locate_profile(), base_path)
+    if profile_dir is None:
+        from IPython.utils.path import locate_profile
+        profile_dir = locate_profile()
 
-    if path.exists(base_dir):
-        logger.info("Removing existing glmol: %s", base_dir)
-        shutil.rmtree(base_dir)
+    output_file = path.join(profile_dir, base_path, base_name)
 
-    os.makedirs(base_dir)
-    
-    output_file = path.join(base_dir, base_name)
-
-    logger.info("Writing glmol: %s", output_file)
-    with open(output_file, "w") as o:
-        o.write(render_js())
+    if not path.exists(output_file):
+        logger.info("Writing glmol: %s", output_file)
+        write_atomic(output_file, render_js())
+        remove_stale_libraries(path.dirname(output_file), keep = output_file)
     
     return path.join(base_path, base_name)
 
+def remove_stale_libraries(library_dir, keep):
+    """Remove installed 'GLmol.<digest>.js' libraries in library_dir other than keep."""
+    for f in os.listdir(library_dir):
+        if not re.match(r"^GLmol\.[0-9a-f]{16}\.js$", f):
+            continue
+        f = path.join(library_dir, f)
+        if f == keep:
+            continue
+
+        logger.info("Removing stale glmol: %s", f)
+        try:
+            os.unlink(f)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
 
@@ -0,0 +1,138 @@
+import logging
+logger = logging.getLogger("ipython_glmol.spatial_index")
+
+import numpy
+
+# Cell edge length, in Angstrom, queries within this distance visit 27 cells
+default_cell_size = 5.0
+
+class CellList(object):
+    """Cell list spatial index over atom coordinates.
+
+    Atoms are binned into cubic cells of cell_size and sorted by cell key.
+    Neighbor queries are vectorized over query points, visiting the cells
+    within the query distance of each point.
+    """
+
+    # Query points processed per batch, bounding candidate pair memory
+    chunk_size = 4096
+
+    def __init__(self, xyz, cell_size = default_cell_size):
+        self.xyz = numpy.asarray(xyz, dtype=float).reshape((-1, 3))
+        self.cell_size = float(cell_size)
+
+        if len(self.xyz):
+            self.origin = self.xyz.min(axis=0)
+        else:
+            self.origin = numpy.zeros(3)
+
+        cells = self.cells(self.xyz)
+        self.shape = cells.max(axis=0) + 1 if len(cells) else numpy.ones(3, dtype=numpy.int64)
+
+        self.cell_keys = self.keys(cells)
+        self.order = numpy.argsort(self.cell_keys, kind="mergesort")
+        self.sorted_keys = self.cell_keys[self.order]
+
+        # Occupied cell keys, sorted, and the occupied cell index of each atom
+        first = numpy.ones(len(self.sorted_keys), dtype=bool)
+        first[1:] = self.sorted_keys[1:] != self.sorted_keys[:-1]
+        self.occupied_keys = self.sorted_keys[first]
+        self.atom_cells = numpy.empty(len(self.order), dtype=numpy.int64)
+        self.atom_cells[self.order] = numpy.cumsum(first) - 1
+
+    def __len__(self):
+        return len(self.xyz)
+
+    def cells(self, xyz):
+        """Integer cell coordinates of points, (n, 3)."""
+        return numpy.floor((xyz - self.origin) / self.cell_size).astype(numpy.int64)
+
+    def keys(self, cells):
+        """Cell keys of cell coordinates, -1 for cells outside the index."""
+        cells = numpy.asarray(cells)
+        valid = numpy.all((cells >= 0) & (cells < self.shape), axis=-1)
+        keys = (cells[..., 0] * self.shape[1] + cells[..., 1]) * self.shape[2] + cells[..., 2]
+        return numpy.where(valid, keys, -1)
+
+    def neighbor_offsets(self, distance):
+        """Cell offsets covering all points within distance, (k, 3)."""
+        r = max(int(numpy.ceil(distance / self.cell_size)), 0)
+        steps = numpy.arange(-r, r + 1)
+        return numpy.stack(numpy.meshgrid(steps, steps, steps, indexing="ij"), axis=-1).reshape((-1, 3))
+
+    def neighbor_keys(self, cells, distance):
+        """Keys of the cells within the neighbor offsets of cells, omitting cells outside the index."""
+        r = max(int(numpy.ceil(distance / self.cell_size)), 0)
+        steps = numpy.arange(-r, r + 1)
+
+        # Per axis neighbor coordinates (n, 3, steps), combined over the offset grid
+        c = cells[:, :, None] + steps
+        valid = (c >= 0) & (c < self.shape[:, None])
+        keys = (c[:, 0, :, None, None] * self.shape[1] + c[:, 1, None, :, None]) * self.shape[2] + c[:, 2, None, None, :]
+
+        return keys[valid[:, 0, :, None, None] & valid[:, 1, None, :, None] & valid[:, 2, None, None, :]]
+
+    def _chunk_pairs(self, query_xyz, distance, offsets):
+        neighbor_keys = self.keys(self.cells(query_xyz)[:, None, :] + offsets[None, :, :]).ravel()
+
+        starts = numpy.searchsorted(self.sorted_keys, neighbor_keys, "left")
+        counts = numpy.searchsorted(self.sorted_keys, neighbor_keys, "right") - starts
+        counts[neighbor_keys < 0] = 0
+
+        # Expand cell ranges to candidate (query, atom) pairs
+        total = counts.sum()
+        query_indices = numpy.repeat(numpy.repeat(numpy.arange(len(query_xyz)), len(offsets)), counts)
+        positions = numpy.arange(total) + numpy.repeat(starts - (numpy.cumsum(counts) - counts), counts)
+        atom_indices = self.order[positions]
+
+        d2 = ((self.xyz[atom_indices] - query_xyz[query_indices]) ** 2).sum(axis=1)
+        within = d2 <= distance ** 2
+
+        return query_indices[within], atom_indices[within]
+
+    def pairs(self, query_xyz, distance):
+        """Pairs of query points and indexed atoms within distance.
+
+        returns - (query indices, atom indices)
+        """
+        query_xyz = numpy.asarray(query_xyz, dtype=float).reshape((-1, 3))
+        offsets = self.neighbor_offsets(distance)
+
+        query_indices, atom_indices = [numpy.zeros(0, dtype=int)], [numpy.zeros(0, dtype=int)]
+        for start in range(0, len(query_xyz), self.chunk_size):
+            q, a = self._chunk_pairs(query_xyz[start:start + self.chunk_size], distance, offsets)
+            query_indices.append(q + start)
+            atom_indices.append(a)
+
+        return numpy.concatenate(query_indices), numpy.concatenate(atom_indices)
+
+    def near_cells(self, atom_mask, distance):
+        """Mask of atoms in cells within distance of any cell of the atoms in atom_mask.
+
+        A superset of the atoms within distance of atom_mask atoms, used to
+        prune queries before computing distances.
+        """
+        occupied = numpy.zeros(len(self.occupied_keys), dtype=bool)
+        occupied[self.atom_cells[atom_mask]] = True
+        cells = numpy.column_stack(numpy.unravel_index(self.occupied_keys[occupied], tuple(self.shape)))
+
+        # Dilate the occupied cells of atom_mask by the neighbor offsets, sparse
+        # over the occupied cells of the index rather than the full cell grid.
+        near_keys = self.neighbor_keys(cells, distance)
+        positions = numpy.minimum(numpy.searchsorted(self.occupied_keys, near_keys), max(len(self.occupied_keys) - 1, 0))
+
+        near = numpy.zeros(len(self.occupied_keys), dtype=bool)
+        if len(self.occupied_keys):
+            near[positions[self.occupied_keys[positions] == near_keys]] = True
+
+        return near[self.atom_cells]
+
+    def within_mask(self, query_xyz, distance):
+        """Mask of indexed atoms within distance of any query point."""
+        mask = numpy.zeros(len(self), dtype=bool)
+        mask[self.pairs(query_xyz, distance)[1]] = True
+        return mask
+
+    def __repr__(self):
+        return "%s(atoms = %i, cell_size = %r, shape = %s)" % (
+            self.__class__.__name__, len(self), self.cell_size, tuple(self.shape))
@@ -0,0 +1,144 @@
+import logging
+logger = logging.getLogger("ipython_glmol.structure_registry")
+
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+import numpy
+
+default_max_bytes = int(os.environ.get("IPYTHON_GLMOL_STRUCTURE_CACHE_BYTES", 256 << 20))
+
+def structure_key(embed):
+    """Content hash of the structure payload of embed.
+
+    Binary transport payloads are keyed by atom table and secondary structure
+    records, without formatting the pdb string of embeds created from an atom table.
+    """
+    digest = hashlib.sha1(embed.transport)
+    if embed.transport == "binary":
+        digest.update(numpy.ascontiguousarray(embed.atom_table).tostring())
+        digest.update(numpy.ascontiguousarray(embed.ss_records).tostring())
+    else:
+        pdb_string = embed.pdb_string
+        if isinstance(pdb_string, unicode):
+            pdb_string = pdb_string.encode("utf-8")
+        digest.update(pdb_string)
+
+    return digest.hexdigest()[:16]
+
+class StructureRegistry(object):
+    """Structures cached in the notebook frontend, keyed by content hash.
+
+    The first display of a structure stores its payload in the frontend
+    cache, later displays reference the cached payload and send only their
+    repr. Least recently displayed structures are evicted from the frontend
+    once cached payloads exceed max_bytes.
+
+    The registry is per kernel and opt-in, see default_registry. Outputs
+    referencing cached structures depend on earlier outputs displayed in the
+    same page: they do not display after reloading the page without
+    restarting the kernel, clear the registry to resend structures, and do
+    not display in saved notebooks rendered without a kernel.
+    """
+
+    def __init__(self, max_bytes = default_max_bytes):
+        self.max_bytes = max_bytes
+        self._sizes = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._sizes
+
+    def __len__(self):
+        return len(self._sizes)
+
+    @property
+    def total_bytes(self):
+        return sum(self._sizes.values())
+
+    def touch(self, key):
+        """Mark structure as most recently displayed."""
+        self._sizes[key] = self._sizes.pop(key)
+
+    def add(self, key, size):
+        """Record structure payload of size bytes stored in the frontend.
+
+        returns - Keys of structures to evict from the frontend.
+        """
+        self._sizes.pop(key, None)
+        self._sizes[key] = size
+
+        evicted = []
+        total = self.total_bytes
+        while total > self.max_bytes and len(self._sizes) > 1:
+            evicted_key, evicted_size = self._sizes.popitem(last = False)
+            evicted.append(evicted_key)
+            total -= evicted_size
+
+        if evicted:
+            logger.debug("Evicting %i structures, %i bytes cached.", len(evicted), total)
+
+        return evicted
+
+    def forget(self, key):
+        self._sizes.pop(key, None)
+
+    def clear(self):
+        self._sizes.clear()
+
+    def structure_js(self, key, payload_json):
+        """Javascript storing a structure payload in the frontend cache, if not cached.
+
+        payload_json - Callable returning the json payload, only called for
+            structures not already cached.
+
+        returns - (data_js, source_js), source_js evaluates to the cached payload.
+        """
+        if key in self:
+            self.touch(key)
+            data_js = ""
+        else:
+            payload = payload_json()
+            evicted = self.add(key, len(payload))
+            data_js = _store_structure_js_template % dict(
+                key_json = json.dumps(key),
+                payload_json = payload,
+                evicted_json = json.dumps(evicted))
+
+        return _structure_cache_js + data_js, "ipython_glmol.cached_structure(%s)" % json.dumps(key)
+
+    def __repr__(self):
+        return "%s(max_bytes = %r, structures = %i, total_bytes = %i)" % (
+            self.__class__.__name__, self.max_bytes, len(self), self.total_bytes)
+
+# Registry of notebook displays, None to inline each structure payload in its
+# output. Set to a StructureRegistry to send each structure once per page.
+default_registry = None
+
+_store_structure_js_template = """
+    ipython_glmol.store_structure(%(key_json)s, %(payload_json)s, %(evicted_json)s);
+"""
+
+_structure_cache_js = """
+    if (ipython_glmol.structures === undefined)
+    {
+        ipython_glmol.structures = {};
+
+        ipython_glmol.store_structure = function (key, payload, evicted)
+        {
+            for (var i = 0; i < evicted.length; i++) { delete ipython_glmol.structures[evicted[i]]; }
+            ipython_glmol.structures[key] = payload;
+        };
+
+        ipython_glmol.cached_structure = function (key)
+        {
+            if (ipython_glmol.structures[key] === undefined)
+            {
+                throw new Error("Structure " + key + " is not cached in this page, " +
+                    "call ipython_glmol.structure_registry.default_registry.clear() and display again.");
+            }
+            return ipython_glmol.structures[key];
+        };
+    }
+"""
@@ -0,0 +1,503 @@
+#!/usr/bin/env python
+"""Headless software rendering of embeds as PNG thumbnails.
+
+Repr entries are rendered as depth-buffered, shaded sphere impostors by a
+numpy rasterizer: spheres as atom spheres, sticks and lines as sampled
+bonds, ribbons as tubes along a spline through trace atoms.
+
+    python -m ipython_glmol.thumbnails -o <output_dir> <pdb files>
+"""
+import logging
+logger = logging.getLogger("ipython_glmol.thumbnails")
+
+import os
+from os import path
+import zlib
+import time
+import struct
+import shutil
+import hashlib
+import argparse
+import colorsys
+import multiprocessing
+
+import numpy
+
+from .atom_table import assign_secondary_structure
+from .structure_registry import structure_key
+from .setup_js import write_atomic
+
+thumbnail_cache_dir = os.environ.get(
+    "IPYTHON_GLMOL_THUMBNAIL_CACHE", path.expanduser(path.join("~", ".cache", "ipython_glmol", "thumbnails")))
+
+default_view = (("width", 256), ("height", 256), ("rotation", (0.0, 0.0, 0.0)), ("zoom", 1.0))
+
+# GLmol element colors, carbons keep chain colors
+element_colors = {
+    "H" : 0xCCCCCC, "O" : 0xCC0000, "N" : 0x0000CC, "S" : 0xCCCC00, "P" : 0x6622CC,
+    "F" : 0x00CC00, "CL" : 0x00CC00, "BR" : 0x882200, "I" : 0x6600AA, "FE" : 0xCC6600, "CA" : 0x8888AA,
+}
+
+water_residues = ("HOH", "WAT", "DOD", "H2O", "SOL")
+
+# Primitive radii, in angstroms
+sphere_radius = 1.5
+stick_radius = 0.25
+line_radius = 0.08
+coil_radius = 0.35
+ss_radius = 0.9
+
+trace_gap = {"CA" : 4.2, "P" : 8.0}
+spline_subdivision = 8
+
+light_direction = numpy.array([-0.3, 0.4, 1.0]) / numpy.linalg.norm([-0.3, 0.4, 1.0])
+
+# Maximum fragments rasterized per chunk
+max_chunk_fragments = 1 << 22
+
+def parse_color(color):
+    """0xRRGGBB integer of '#rrggbb', '0xrrggbb' or 'rrggbb' color string."""
+    return int(color.strip().lstrip("#"), 16)
+
+def unpack_colors(colors):
+    """Float rgb array (n, 3) in [0, 1] of 0xRRGGBB colors."""
+    colors = numpy.asarray(colors, dtype=numpy.uint32)
+    return numpy.column_stack(((colors >> 16) & 0xFF, (colors >> 8) & 0xFF, colors & 0xFF)) / 255.0
+
+def default_atom_colors(atoms):
+    """Chain colors, as GLmol colorByChain, with element colors for non-carbon atoms."""
+    colors = numpy.zeros(len(atoms), dtype=numpy.uint32)
+
+    for chain in numpy.unique(atoms["chain"]):
+        r, g, b = colorsys.hsv_to_rgb((ord(chain[:1] or " ") * 5) % 17 / 17.0, 1, 0.9)
+        colors[atoms["chain"] == chain] = (int(r * 255) << 16) | (int(g * 255) << 8) | int(b * 255)
+
+    elem = numpy.char.upper(atoms["elem"])
+    for e, c in element_colors.items():
+        colors[elem == e] = c
+
+    return colors
+
+def atom_colors(embed, resolved):
+    """Per-atom 0xRRGGBB colors of embed, applying property colors and color entries."""
+    colors = default_atom_colors(embed.atom_table)
+
+    if embed.property_colors is not None:
+        codes, table = embed.property_colors["codes"], embed.property_colors["table"]
+        colored = codes < len(table)
+        colors[colored] = table[codes[colored]]
+
+    for color, ranges in resolved.get("color", []):
+        for start, stop in ranges:
+            colors[start:stop] = parse_color(color)
+
+    return colors
+
+def ranges_mask(ranges, n):
+    mask = numpy.zeros(n, dtype=bool)
+    for start, stop in ranges:
+        mask[start:stop] = True
+    return mask
+
+def atom_bonds(atoms, window = 32):
+    """Covalent bonds by distance between atoms at most window apart in the atom table.
+
+    returns - Bond atom index array (n, 2)
+    """
+    xyz = atoms["xyz"]
+    hydrogen = numpy.in1d(numpy.char.upper(atoms["elem"]), ("H", "D"))
+
+    bonds = [numpy.zeros((0, 2), dtype=int)]
+    for k in range(1, min(window, len(atoms))):
+        d2 = ((xyz[k:] - xyz[:-k]) ** 2).sum(axis=1)
+        cutoff = numpy.where(hydrogen[k:] | hydrogen[:-k], 1.3 ** 2, 1.9 ** 2)
+        i = numpy.flatnonzero(d2 < cutoff)
+        bonds.append(numpy.column_stack((i, i + k)))
+
+    return numpy.concatenate(bonds)
+
+def catmull_rom(points, subdivision):
+    """Catmull-Rom spline through points (m, 3), subdivision samples per segment.
+
+    returns - (samples, segment), segment is the index of the starting control
+        point of each sample.
+    """
+    padded = numpy.concatenate((points[:1], points, points[-1:]))
+    p0, p1, p2, p3 = [padded[i:i + len(points) - 1, None, :] for i in range(4)]
+    t = (numpy.arange(subdivision, dtype=float) / subdivision)[None, :, None]
+
+    samples = 0.5 * (
+        2 * p1 + (p2 - p0) * t + (2 * p0 - 5 * p1 + 4 * p2 - p3) * t ** 2 + (3 * p1 - p0 - 3 * p2 + p3) * t ** 3)
+    segment = numpy.repeat(numpy.arange(len(points) - 1), subdivision)
+
+    return (numpy.concatenate((samples.reshape((-1, 3)), points[-1:])),
+            numpy.r_[segment, len(points) - 1])
+
+class Primitives(object):
+    """Spheres and bonds to rasterize, in model coordinates."""
+
+    def __init__(self):
+        self.spheres = []
+        self.bonds = []
+
+    def add_spheres(self, centers, radius, colors):
+        if len(centers):
+            self.spheres.append((numpy.asarray(centers, dtype=float), numpy.broadcast_to(float(radius), (len(centers),)), colors))
+
+    def add_bonds(self, ends, radius, colors):
+        """Add bonds between ends (n, 2, 3), colored by nearest end colors (n, 2)."""
+        if len(ends):
+            self.bonds.append((ends, radius, colors))
+
+    def anchor_points(self):
+        """Sphere centers and bond ends, with radii."""
+        points = [s[0] for s in self.spheres] + [b[0].reshape((-1, 3)) for b in self.bonds]
+        radii = [s[1] for s in self.spheres] + [numpy.repeat(float(b[1]), b[0].shape[0] * 2) for b in self.bonds]
+        if not points:
+            return numpy.zeros((0, 3)), numpy.zeros(0)
+        return numpy.concatenate(points), numpy.concatenate(radii)
+
+    def sampled_spheres(self, spacing):
+        """All spheres, sampling bonds as spheres at most spacing(radius) apart."""
+        spheres = list(self.spheres)
+
+        for ends, radius, colors in self.bonds:
+            lengths = numpy.sqrt(((ends[:, 1] - ends[:, 0]) ** 2).sum(axis=1))
+            n_samples = numpy.maximum(numpy.ceil(lengths / spacing(radius)).astype(int), 1) + 1
+
+            bond_index = numpy.repeat(numpy.arange(len(ends)), n_samples)
+            offsets = numpy.arange(len(bond_index)) - numpy.repeat(numpy.cumsum(n_samples) - n_samples, n_samples)
+            t = offsets / (n_samples[bond_index] - 1.0)
+
+            centers = ends[bond_index, 0] + (ends[bond_index, 1] - ends[bond_index, 0]) * t[:, None]
+            sample_colors = numpy.where(t < .5, colors[bond_index, 0], colors[bond_index, 1])
+            spheres.append((centers, numpy.broadcast_to(float(radius), (len(centers),)), sample_colors))
+
+        if not spheres:
+            return numpy.zeros((0, 3)), numpy.zeros(0), numpy.zeros(0, dtype=numpy.uint32)
+
+        return tuple(numpy.concatenate(c) for c in zip(*spheres))
+
+def embed_primitives(embed):
+    """Primitives of the repr entries of embed, with GLmol default hetatm spheres."""
+    atoms = embed.atom_table
+    resolved = embed.selection_engine.resolve_repr_entries(embed.repr_entries)
+    colors = atom_colors(embed, resolved)
+    xyz = atoms["xyz"].astype(float)
+
+    def type_mask(repr_type):
+        mask = numpy.zeros(len(atoms), dtype=bool)
+        for _, ranges in resolved.get(repr_type, []):
+            mask |= ranges_mask(ranges, len(atoms))
+        return mask
+
+    primitives = Primitives()
+
+    hetatm = atoms["hetflag"] & ~numpy.in1d(atoms["resn"], water_residues)
+    sphere = type_mask("sphere") | hetatm
+    primitives.add_spheres(xyz[sphere], sphere_radius, colors[sphere])
+
+    bonds = None
+    for repr_type, radius in (("stick", stick_radius), ("line", line_radius)):
+        mask = type_mask(repr_type)
+        if not mask.any():
+            continue
+        if bonds is None:
+            bonds = atom_bonds(atoms)
+
+        selected = bonds[mask[bonds[:, 0]] & mask[bonds[:, 1]]]
+        primitives.add_spheres(xyz[mask], radius, colors[mask])
+        primitives.add_bonds(xyz[selected], radius, colors[selected])
+
+    ribbon = type_mask("ribbon")
+    if ribbon.any():
+        ss, _, _ = assign_secondary_structure(atoms, embed.ss_records)
+        ss[type_mask("helix")] = "h"
+        ss[type_mask("sheet")] = "s"
+
+        for trace_name, gap in trace_gap.items():
+            trace = numpy.flatnonzero(ribbon & (atoms["name"] == trace_name) & ~atoms["hetflag"])
+            if len(trace) < 2:
+                continue
+
+            # Split trace at chain changes and chain breaks
+            breaks = (numpy.diff(atoms["chain_number"][trace]) != 0) | \
+                (((xyz[trace[1:]] - xyz[trace[:-1]]) ** 2).sum(axis=1) > gap ** 2)
+            for segment in numpy.split(trace, numpy.flatnonzero(breaks) + 1):
+                if len(segment) < 2:
+                    continue
+
+                samples, control = catmull_rom(xyz[segment], spline_subdivision)
+                control_ss = ss[segment[control]]
+                for is_ss, radius in ((False, coil_radius), (True, ss_radius)):
+                    sample_mask = (control_ss != "c") == is_ss
+                    primitives.add_spheres(samples[sample_mask], radius, colors[segment[control[sample_mask]]])
+
+    return primitives
+
+def rotation_matrix(rotation):
+    """Rotation matrix of (x, y, z) euler angles in degrees, applied in x, y, z order."""
+    rx, ry, rz = numpy.radians(rotation)
+    x = numpy.array([[1, 0, 0], [0, numpy.cos(rx), -numpy.sin(rx)], [0, numpy.sin(rx), numpy.cos(rx)]])
+    y = numpy.array([[numpy.cos(ry), 0, numpy.sin(ry)], [0, 1, 0], [-numpy.sin(ry), 0, numpy.cos(ry)]])
+    z = numpy.array([[numpy.cos(rz), -numpy.sin(rz), 0], [numpy.sin(rz), numpy.cos(rz), 0], [0, 0, 1]])
+    return z.dot(y).dot(x)
+
+def view_transform(points, rotation):
+    """Center and rotation placing the principal axes of points along x, y and z, then rotation.
+
+    returns - (center, rotation matrix), view coordinates are (p - center).dot(matrix.T)
+    """
+    if not len(points):
+        return numpy.zeros(3), numpy.eye(3)
+
+    center = points.mean(axis=0)
+    if len(points) < 3:
+        axes = numpy.eye(3)
+    else:
+        _, vectors = numpy.linalg.eigh(numpy.cov((points - center).T))
+        axes = vectors[:, ::-1].T
+        if numpy.linalg.det(axes) < 0:
+            axes[2] *= -1
+
+    return center, rotation_matrix(rotation).dot(axes)
+
+def rasterize(centers, radii, colors, width, height, background):
+    """Rasterize view space spheres as shaded impostors into an rgb float image.
+
+    centers - Pixel space centers (n, 3), x right, y down, z toward the viewer.
+    radii - Pixel radii (n,)
+    colors - Float rgb (n, 3)
+    """
+    image = numpy.empty((height * width, 3))
+    image[:] = background
+    depth = numpy.empty(height * width)
+    depth[:] = -numpy.inf
+
+    if not len(centers):
+        return image.reshape((height, width, 3))
+
+    z_min, z_max = (centers[:, 2] - radii).min(), (centers[:, 2] + radii).max()
+    fog_scale = 1.0 / (z_max - z_min) if z_max > z_min else 0.0
+
+    stencil_radius = numpy.ceil(radii).astype(int)
+    for r in numpy.unique(stencil_radius):
+        offsets = numpy.arange(-r, r + 1)
+        oy, ox = [o.ravel() for o in numpy.meshgrid(offsets, offsets, indexing="ij")]
+
+        group = numpy.flatnonzero(stencil_radius == r)
+        chunk = max(max_chunk_fragments // len(ox), 1)
+        for start in range(0, len(group), chunk):
+            s = group[start:start + chunk]
+            cx, cy, cz, pr = centers[s, 0], centers[s, 1], centers[s, 2], radii[s]
+
+            ix = numpy.round(cx).astype(int)[:, None] + ox[None, :]
+            iy = numpy.round(cy).astype(int)[:, None] + oy[None, :]
+            dx = (ix - cx[:, None]) / pr[:, None]
+            dy = (iy - cy[:, None]) / pr[:, None]
+            d2 = dx ** 2 + dy ** 2
+
+            inside = (d2 <= 1) & (ix >= 0) & (ix < width) & (iy >= 0) & (iy < height)
+            sphere, _ = numpy.nonzero(inside)
+            dx, dy, d2 = dx[inside], dy[inside], d2[inside]
+            nz = numpy.sqrt(1 - d2)
+
+            pixel = iy[inside] * width + ix[inside]
+            fragment_depth = cz[sphere] + pr[sphere] * nz
+
+            # Nearest fragment per pixel within the chunk, then against the depth buffer
+            order = numpy.lexsort((fragment_depth, pixel))
+            pixel, fragment_depth = pixel[order], fragment_depth[order]
+            last = numpy.r_[pixel[1:] != pixel[:-1], True]
+            nearest = order[last]
+            pixel, fragment_depth = pixel[last], fragment_depth[last]
+
+            visible = fragment_depth > depth[pixel]
+            nearest, pixel = nearest[visible], pixel[visible]
+            depth[pixel] = fragment_depth[visible]
+
+            normal = numpy.column_stack((dx[nearest], -dy[nearest], nz[nearest]))
+            diffuse = numpy.clip(normal.dot(light_direction), 0, 1)
+            specular = diffuse ** 24 * .3
+            fog = 0.55 + 0.45 * (fragment_depth[visible] - z_min) * fog_scale
+
+            shaded = colors[s][sphere[nearest]] * (0.3 + 0.7 * diffuse)[:, None] + specular[:, None]
+            image[pixel] = shaded * fog[:, None] + background * (1 - fog[:, None])
+
+    return numpy.clip(image, 0, 1).reshape((height, width, 3))
+
+def background_color(embed):
+    entries = embed.repr_entries.get("bgcolor")
+    return unpack_colors([parse_color(entries[-1]) if entries else 0x000000])[0]
+
+def render_embed(embed, width = 256, height = 256, rotation = (0.0, 0.0, 0.0), zoom = 1.0, supersample = 2):
+    """Render embed repr as rgb image.
+
+    The structure is viewed along its smallest principal axis, then rotated
+    by rotation euler angles, in degrees, and scaled to fit the image at zoom 1.
+
+    returns - uint8 array (height, width, 3)
+    """
+    primitives = embed_primitives(embed)
+    points, point_radii = primitives.anchor_points()
+    center, matrix = view_transform(points, rotation)
+
+    view_points = (points - center).dot(matrix.T)
+    render_width, render_height = width * supersample, height * supersample
+    if len(view_points):
+        extent_x = (numpy.abs(view_points[:, 0]) + point_radii).max()
+        extent_y = (numpy.abs(view_points[:, 1]) + point_radii).max()
+        scale = 0.95 * zoom * min(render_width / 2.0 / extent_x, render_height / 2.0 / extent_y)
+    else:
+        scale = 1.0
+
+    # Sample bonds at most a third of the radius or a pixel apart.
+    centers, radii, colors = primitives.sampled_spheres(lambda radius: max(radius / 3.0, 1.0 / scale))
+
+    view_centers = (centers - center).dot(matrix.T) * scale
+    pixel_centers = numpy.column_stack((
+        view_centers[:, 0] + render_width / 2.0,
+        render_height / 2.0 - view_centers[:, 1],
+        view_centers[:, 2]))
+
+    image = rasterize(
+        pixel_centers, numpy.maximum(radii * scale, .75), unpack_colors(colors),
+        render_width, render_height, background_color(embed))
+
+    if supersample > 1:
+        image = image.reshape((height, supersample, width, supersample, 3)).mean(axis=(1, 3))
+
+    return numpy.round(image * 255).astype(numpy.uint8)
+
+def encode_png(image):
+    """Encode uint8 rgb image (height, width, 3) as PNG."""
+    height, width, _ = image.shape
+    rows = numpy.column_stack((numpy.zeros(height, dtype=numpy.uint8), image.reshape((height, width * 3))))
+
+    def chunk(chunk_type, data):
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+
+    return "\x89PNG\r\n\x1a\n" + \
+        chunk("IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) + \
+        chunk("IDAT", zlib.compress(rows.tobytes(), 6)) + \
+        chunk("IEND", "")
+
+def render_png(embed, **view):
+    """Render embed as PNG, see render_embed."""
+    return encode_png(render_embed(embed, **view))
+
+# View parameter types, equal views have equal keys regardless of given types
+view_types = dict(width = int, height = int, rotation = lambda r: tuple(float(a) for a in r), zoom = float, supersample = int)
+
+def view_key(view):
+    """Canonical view tuple, filling defaults."""
+    view = dict(default_view, **view)
+    return tuple((k, view_types.get(k, lambda v: v)(view[k])) for k in sorted(view))
+
+def thumbnail_key(embed, view):
+    """Cache key of embed thumbnail, by structure hash, repr hash and view."""
+    repr_digest = hashlib.sha1(embed.repr_string)
+    if embed.property_colors is not None:
+        repr_digest.update(numpy.ascontiguousarray(embed.property_colors["codes"]).tostring())
+        repr_digest.update(numpy.ascontiguousarray(embed.property_colors["table"]).tostring())
+
+    view_digest = hashlib.sha1(repr(view_key(view)))
+
+    return "%s_%s_%s" % (structure_key(embed), repr_digest.hexdigest()[:16], view_digest.hexdigest()[:8])
+
+def _render_thumbnail(args):
+    """Render single thumbnail into cache and output, returns (thumbnail file, bytes, cached)."""
+    name, item, output_dir, cache_dir, default_repr, view = args
+    from .html_export import load_embed
+
+    embed = load_embed(item, default_repr)
+    output_file = path.join(output_dir, "%s.png" % name)
+
+    cache_file = path.join(cache_dir, "%s.png" % thumbnail_key(embed, view)) if cache_dir else None
+    if cache_file and path.exists(cache_file):
+        shutil.copyfile(cache_file, output_file)
+        return output_file, path.getsize(output_file), True
+
+    png = render_png(embed, **view)
+    if cache_file:
+        write_atomic(cache_file, png)
+    with open(output_file, "wb") as o:
+        o.write(png)
+
+    return output_file, len(png), False
+
+def render_thumbnails(items, output_dir, processes = None, default_repr = None, chunksize = 8, cache_dir = thumbnail_cache_dir, **view):
+    """Render embeds as '<output_dir>/<name>.png' thumbnails.
+
+    items - Iterable of PDBEmbed, pdb file paths or (name, item) tuples.
+    processes - Worker process count, defaults to cpu count. Thumbnails are
+        rendered in-process if 0.
+    default_repr - Repr modifier applied to embeds loaded from pdb files.
+    cache_dir - Thumbnail cache, keyed by structure hash, repr hash and view.
+        Caching is disabled if None.
+    view - View parameters, see render_embed.
+
+    returns - Summary dict: thumbnails, cached, bytes, seconds, thumbnails_per_second.
+    """
+    from .html_export import item_name
+
+    if not path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    def thumbnail_args():
+        for i, item in enumerate(items):
+            name, item = item if isinstance(item, tuple) else (item_name(i, item), item)
+            yield (name, item, output_dir, cache_dir, default_repr, view)
+
+    start = time.time()
+    thumbnails = 0
+    cached = 0
+    thumbnail_bytes = 0
+
+    if processes == 0:
+        pool = None
+        results = (_render_thumbnail(a) for a in thumbnail_args())
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_render_thumbnail, thumbnail_args(), chunksize)
+
+    try:
+        for thumbnail_file, size, is_cached in results:
+            thumbnails += 1
+            cached += is_cached
+            thumbnail_bytes += size
+            logger.debug("Wrote: %s", thumbnail_file)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    seconds = time.time() - start
+    summary = dict(
+        thumbnails = thumbnails,
+        cached = cached,
+        bytes = thumbnail_bytes,
+        seconds = seconds,
+        thumbnails_per_second = thumbnails / seconds if seconds else float("inf"))
+
+    logger.info("Rendered %(thumbnails)i thumbnails, %(cached)i cached, %(bytes)i bytes in %(seconds).2fs (%(thumbnails_per_second).1f thumbnails/s)", summary)
+
+    return summary
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
+
+    parser = argparse.ArgumentParser(description='Render pdb files as PNG thumbnails.')
+    parser.add_argument('--output_dir', "-o", type=str, required=True, help="Output directory.")
+    parser.add_argument('--processes', "-j", type=int, default=None, help="Worker process count, defaults to cpu count.")
+    parser.add_argument('--size', type=int, nargs=2, default=(256, 256), metavar=("WIDTH", "HEIGHT"), help="Thumbnail size.")
+    parser.add_argument('--rotation', type=float, nargs=3, default=(0.0, 0.0, 0.0), help="View rotation, x y z euler angles in degrees.")
+    parser.add_argument('--no_cache', action="store_true", help="Disable the thumbnail cache.")
+    parser.add_argument('pdb_files', type=str, nargs="+", help="Rendered pdb files.")
+    args = parser.parse_args()
+
+    from .glmol_repr import Ribbon
+    render_thumbnails(
+        args.pdb_files, args.output_dir, processes = args.processes, default_repr = Ribbon(),
+        cache_dir = None if args.no_cache else thumbnail_cache_dir,
+        width = args.size[0], height = args.size[1], rotation = tuple(args.rotation))
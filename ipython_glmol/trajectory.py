@@ -0,0 +1,290 @@
+import logging
+logger = logging.getLogger("ipython_glmol.trajectory")
+
+import json
+
+import numpy
+
+from IPython.display import Javascript
+
+from .glmol_embed import PDBEmbed
+from .atom_table import atom_table_from_lines
+from .transport import encode_array
+from .live import LiveEmbed
+
+def parse_pdb_models(pdb_string):
+    """Split multi-model pdb string into topology and per-model coordinates.
+
+    returns - (topology_pdb_string, frames), where topology is the pdb string of
+        the first model and frames is a float32 array (num_models, num_atoms, 3).
+    """
+
+    header_lines = []
+    models = []
+    model_lines = None
+
+    for l in pdb_string.splitlines():
+        if l.startswith("MODEL"):
+            model_lines = []
+        elif l.startswith("ENDMDL"):
+            models.append(model_lines)
+            model_lines = None
+        elif l.startswith(("ATOM", "HETATM")):
+            if model_lines is None:
+                # Atoms outside MODEL records, single model pdb
+                model_lines = []
+                models.append(model_lines)
+            model_lines.append(l)
+        elif model_lines is None or not l.startswith("TER"):
+            header_lines.append(l)
+
+    if not models:
+        raise ValueError("No models found in pdb string.")
+
+    frames = [atom_table_from_lines(m)["xyz"] for m in models]
+    if any(len(f) != len(frames[0]) for f in frames):
+        raise ValueError("Inconsistent model atom counts: %s" % sorted(set(len(f) for f in frames)))
+
+    return "\n".join(header_lines + models[0]), numpy.array(frames, dtype=numpy.float32)
+
+def encode_frame_chunk(frames, reference, start, stop, precision):
+    """Encode frames[start:stop] as deltas from reference frame.
+
+    Deltas are quantized to int16 multiples of precision, falling back to
+    float32 deltas if the quantized deltas exceed the int16 range.
+    """
+
+    deltas = frames[start:stop] - reference
+    quantized = numpy.round(deltas / precision) if precision else None
+
+    if quantized is not None and (not quantized.size or numpy.abs(quantized).max() < 2 ** 15):
+        encoding, data = "int16", encode_array(quantized, "int16")
+    else:
+        encoding, data = "float32", encode_array(deltas, "float32")
+
+    return dict(start = start, stop = stop, encoding = encoding, data = data)
+
+class TrajectoryEmbed(PDBEmbed):
+    """Embeds multi-frame trajectory as GLmol canvas with playback controls.
+
+    The topology is sent once, frames are sent as quantized deltas from the
+    first frame in chunks of chunk_size frames.
+
+    pdb_string - Topology pdb string, or multi-model pdb string if frames is None.
+    frames - Coordinate array (num_frames, num_atoms, 3), in topology atom order.
+    precision - Frame coordinate quantization, in angstroms.
+    inline_frames - Number of frames included in the initial display from
+        PDBEmbed.display, remaining frames are fetched on demand. All frames are
+        inlined for static displays.
+    """
+
+    def __init__(self, pdb_string, frames = None, residue_properties = None, transport = "text",
+            precision = 1e-2, chunk_size = 32, inline_frames = 64, fps = 10):
+
+        if frames is None:
+            pdb_string, frames = parse_pdb_models(pdb_string)
+
+        super(TrajectoryEmbed, self).__init__(pdb_string, residue_properties, transport)
+
+        self.frames = numpy.asarray(frames, dtype=numpy.float32)
+        if self.frames.ndim != 3 or self.frames.shape[1:] != (len(self.atom_table), 3):
+            raise ValueError("Invalid frame shape: %s for %i atom topology" % (self.frames.shape, len(self.atom_table)))
+        if not len(self.frames):
+            raise ValueError("Trajectory has no frames.")
+
+        self.precision = precision
+        self.chunk_size = chunk_size
+        self.inline_frames = inline_frames
+        self.fps = fps
+
+    @property
+    def n_frames(self):
+        return len(self.frames)
+
+    def frame_chunk(self, start):
+        """Encoded frame chunk starting at the given frame."""
+        return encode_frame_chunk(self.frames, self.frames[0], start, min(start + self.chunk_size, self.n_frames), self.precision)
+
+    def trajectory_data(self, inline_frames = None):
+        """Json-serializable trajectory header and inlined frame chunks."""
+        if inline_frames is None:
+            inline_frames = self.n_frames
+
+        return dict(
+            n_frames = self.n_frames,
+            n_atoms = self.frames.shape[1],
+            chunk_size = self.chunk_size,
+            fps = self.fps,
+            precision = self.precision,
+            serial = encode_array(self.atom_table["serial"], "int32"),
+            reference = encode_array(self.frames[0], "float32"),
+            chunks = [self.frame_chunk(start) for start in range(0, min(inline_frames, self.n_frames), self.chunk_size)])
+
+    def embed_js(self, embed_id, inline_frames = None, registry = None, defer_lod = False, encode_payload = False):
+        trajectory_json = json.dumps(self.trajectory_data(inline_frames))
+
+        return super(TrajectoryEmbed, self).embed_js(embed_id, registry, defer_lod, encode_payload) + \
+            _trajectory_support_js + \
+            _trajectory_js_template % dict(embed_id = embed_id, trajectory_json = trajectory_json)
+
+    def display(self):
+        """Display embed, returning a LiveTrajectory handle serving on-demand frame chunks."""
+        from IPython.display import display
+
+        embed_id = self.generate_id()
+        display(Javascript(self.notebook_embed_js(embed_id, inline_frames = self.inline_frames)))
+
+        return LiveTrajectory(self, embed_id)
+
+class LiveTrajectory(LiveEmbed):
+    """Handle to a displayed TrajectoryEmbed, serving frame chunk requests.
+
+    The viewer requests frames over the comm it opens on the first request,
+    see live.handle_viewer_message, or over the handle comm once opened.
+    """
+
+    def handle_frames(self, data):
+        start = int(data["start"])
+        logger.debug("Sending %s frames from: %s", self.embed_id, start)
+        self.send("frames", chunk = self.embed.frame_chunk(start))
+
+_trajectory_js_template = """
+        ipython_glmol.setup_trajectory(%(embed_id)s, %(trajectory_json)s);
+"""
+
+_trajectory_support_js = """
+    if (ipython_glmol.setup_trajectory === undefined)
+    {
+        ipython_glmol.store_frame_chunk = function (viewer, chunk)
+        {
+            var trajectory = viewer.trajectory,
+                deltas = ipython_glmol.decode(chunk.data, chunk.encoding == 'int16' ? Int16Array : Float32Array),
+                scale = chunk.encoding == 'int16' ? trajectory.precision : 1.0,
+                frame_size = trajectory.n_atoms * 3;
+
+            for (var f = chunk.start; f < chunk.stop; f++)
+            {
+                trajectory.frames[f] = {
+                    deltas: deltas.subarray((f - chunk.start) * frame_size, (f - chunk.start + 1) * frame_size),
+                    scale: scale};
+                delete trajectory.pending[f];
+            }
+        };
+
+        ipython_glmol.request_frames = function (viewer, frame)
+        {
+            var trajectory = viewer.trajectory,
+                start = frame - (frame % trajectory.chunk_size);
+
+            if (trajectory.frames[start] || trajectory.pending[start]) { return; }
+
+            // Opens the viewer comm on the first request, see live.handle_viewer_message
+            var comm = ipython_glmol.viewer_comm(viewer);
+            if (!comm) { return; }
+
+            trajectory.pending[start] = true;
+            comm.send({type: 'frames', embed_id: viewer.id, start: start});
+        };
+
+        ipython_glmol.set_frame = function (viewer, frame)
+        {
+            var trajectory = viewer.trajectory, coords = trajectory.frames[frame];
+
+            trajectory.current = frame;
+            trajectory.slider.val(frame);
+            trajectory.label.text((frame + 1) + ' / ' + trajectory.n_frames);
+
+            // Prefetch the following chunk
+            if (frame + trajectory.chunk_size < trajectory.n_frames)
+            {
+                ipython_glmol.request_frames(viewer, frame + trajectory.chunk_size);
+            }
+            if (!coords)
+            {
+                ipython_glmol.request_frames(viewer, frame);
+                return false;
+            }
+
+            var reference = trajectory.reference, serial = trajectory.serial,
+                deltas = coords.deltas, scale = coords.scale;
+            for (var i = 0; i < trajectory.n_atoms; i++)
+            {
+                var atom = viewer.atoms[serial[i]];
+                atom.x = reference[3 * i] + deltas[3 * i] * scale;
+                atom.y = reference[3 * i + 1] + deltas[3 * i + 1] * scale;
+                atom.z = reference[3 * i + 2] + deltas[3 * i + 2] * scale;
+            }
+
+            var view = viewer.getView();
+            viewer.rebuildScene(true);
+            viewer.setView(view);
+            viewer.show();
+            return true;
+        };
+
+        ipython_glmol.handlers.frames = function (viewer, data)
+        {
+            ipython_glmol.store_frame_chunk(viewer, data.chunk);
+            if (viewer.trajectory.current >= data.chunk.start && viewer.trajectory.current < data.chunk.stop)
+            {
+                ipython_glmol.set_frame(viewer, viewer.trajectory.current);
+            }
+        };
+
+        ipython_glmol.setup_trajectory = function (viewer, data)
+        {
+            var trajectory = viewer.trajectory = {
+                n_frames: data.n_frames, n_atoms: data.n_atoms, chunk_size: data.chunk_size,
+                precision: data.precision, fps: data.fps,
+                serial: ipython_glmol.decode(data.serial, Int32Array),
+                reference: ipython_glmol.decode(data.reference, Float32Array),
+                frames: {}, pending: {}, current: 0, timer: null};
+
+            for (var i = 0; i < data.chunks.length; i++)
+            {
+                ipython_glmol.store_frame_chunk(viewer, data.chunks[i]);
+            }
+
+            var controls = $('<div/>'),
+                play = $('<button>Play</button>').appendTo(controls);
+
+            trajectory.slider = $('<input type="range" min="0" step="1"/>')
+                .attr('max', data.n_frames - 1).val(0).appendTo(controls);
+            trajectory.label = $('<span/>').appendTo(controls);
+            $('#' + viewer.id).after(controls);
+
+            trajectory.slider.on('input change', function ()
+            {
+                ipython_glmol.set_frame(viewer, parseInt($(this).val()));
+            });
+
+            play.click(function ()
+            {
+                if (trajectory.timer)
+                {
+                    clearInterval(trajectory.timer);
+                    trajectory.timer = null;
+                    play.text('Play');
+                    return;
+                }
+
+                play.text('Pause');
+                trajectory.timer = setInterval(function ()
+                {
+                    var next = (trajectory.current + 1) % trajectory.n_frames;
+                    if (trajectory.frames[next])
+                    {
+                        ipython_glmol.set_frame(viewer, next);
+                    }
+                    else
+                    {
+                        // Wait for on-demand chunk
+                        ipython_glmol.request_frames(viewer, next);
+                    }
+                }, 1000 / trajectory.fps);
+            });
+
+            trajectory.label.text('1 / ' + data.n_frames);
+        };
+    }
+"""
@@ -0,0 +1,138 @@
+import base64
+import json
+
+import numpy
+
+from .atom_table import parse_pdb_secondary_structure, assign_secondary_structure
+
+def encode_array(array, dtype):
+    """Base64 encoded little-endian buffer of array as the given dtype."""
+    return base64.b64encode(numpy.ascontiguousarray(array, dtype=numpy.dtype(dtype).newbyteorder("<")).tobytes())
+
+def encode_string_column(column):
+    """Encode string column as string table and small-int index buffer."""
+    table, index = numpy.unique(column, return_inverse=True)
+    index_dtype = "uint8" if len(table) <= 2 ** 8 else "uint16" if len(table) <= 2 ** 16 else "uint32"
+
+    return dict(
+            table = [str(s) for s in table],
+            dtype = index_dtype,
+            data = encode_array(index, index_dtype))
+
+_string_columns = ("name", "resn", "chain", "elem")
+
+def pack_atom_table(atoms, pdb_string = None, ss_records = None):
+    """Pack atom table and secondary structure into json-serializable buffers.
+
+    ss_records - Secondary structure records, parsed from pdb_string if None.
+    """
+
+    if ss_records is None:
+        ss_records = parse_pdb_secondary_structure(pdb_string or "")
+    ss, ssbegin, ssend = assign_secondary_structure(atoms, ss_records)
+    ss_code = numpy.zeros(len(atoms), dtype=numpy.uint8)
+    ss_code[ss == "h"] = 1
+    ss_code[ss == "s"] = 2
+
+    flags = (atoms["hetflag"].astype(numpy.uint8) |
+             (ssbegin.astype(numpy.uint8) << 1) |
+             (ssend.astype(numpy.uint8) << 2))
+
+    packed = dict(
+            n_atoms = len(atoms),
+            xyz = encode_array(atoms["xyz"], "float32"),
+            serial = encode_array(atoms["serial"], "int32"),
+            resi = encode_array(atoms["resi"], "int32"),
+            b = encode_array(atoms["b"], "float32"),
+            ss = encode_array(ss_code, "uint8"),
+            flags = encode_array(flags, "uint8"),
+            )
+
+    for c in _string_columns:
+        packed[c] = encode_string_column(atoms[c])
+
+    return packed
+
+def payload_sizes(embed):
+    """Byte size of the json-encoded coordinate payload under each transport."""
+    return dict(
+            text = len(json.dumps(embed.pdb_string)),
+            binary = len(json.dumps(pack_atom_table(embed.atom_table, ss_records = embed.ss_records))))
+
+_atom_table_data_js_template = """
+    var %(embed_id)s_atom_table = %(atom_table_json)s;
+"""
+
+_atom_table_load_js_template = """
+        ipython_glmol.load_atom_table(%(embed_id)s, %(table_js)s, true);
+"""
+
+_atom_table_loader_js = """
+    if (ipython_glmol.load_atom_table === undefined)
+    {
+        ipython_glmol.load_atom_table = function (glmol, table, repressZoom)
+        {
+            var time = new Date(), decode = ipython_glmol.decode;
+
+            var index_types = {uint8: Uint8Array, uint16: Uint16Array, uint32: Uint32Array};
+            function decode_strings(column)
+            {
+                return {index: decode(column.data, index_types[column.dtype]), table: column.table};
+            }
+
+            var n = table.n_atoms,
+                xyz = decode(table.xyz, Float32Array),
+                serial = decode(table.serial, Int32Array),
+                resi = decode(table.resi, Int32Array),
+                b = decode(table.b, Float32Array),
+                ss = decode(table.ss, Uint8Array),
+                flags = decode(table.flags, Uint8Array),
+                name = decode_strings(table.name),
+                resn = decode_strings(table.resn),
+                chain = decode_strings(table.chain),
+                elem = decode_strings(table.elem),
+                ss_codes = ['c', 'h', 's'];
+
+            glmol.protein = {sheet: [], helix: [], biomtChains: '', biomtMatrices: [], symMat: [], pdbID: '', title: ''};
+            glmol.atoms = [];
+
+            var atoms = glmol.atoms, ordered = new Array(n);
+            for (var i = 0; i < n; i++)
+            {
+                var atom = {
+                    'resn': resn.table[resn.index[i]], 'x': xyz[3 * i], 'y': xyz[3 * i + 1], 'z': xyz[3 * i + 2],
+                    'elem': elem.table[elem.index[i]], 'hetflag': (flags[i] & 1) != 0,
+                    'chain': chain.table[chain.index[i]], 'resi': resi[i], 'serial': serial[i],
+                    'atom': name.table[name.index[i]], 'bonds': [], 'bondOrder': [], 'b': b[i],
+                    'ss': ss_codes[ss[i]], 'color': 0xFFFFFF};
+                if (flags[i] & 2) { atom.ssbegin = true; }
+                if (flags[i] & 4) { atom.ssend = true; }
+                atoms[serial[i]] = atom;
+                ordered[i] = atom;
+            }
+
+            // Covalent connectivity over a window of following atoms, bonded atoms are
+            // adjacent in record order.
+            for (var i = 0; i < n; i++)
+            {
+                for (var j = i + 1; j < n && j < i + 64; j++)
+                {
+                    var order = glmol.isConnected(ordered[i], ordered[j]);
+                    if (order)
+                    {
+                        ordered[i].bonds.push(ordered[j].serial); ordered[i].bondOrder.push(order);
+                        ordered[j].bonds.push(ordered[i].serial); ordered[j].bondOrder.push(order);
+                    }
+                }
+            }
+            glmol.protein.smallMolecule = false;
+
+            console.log("Loaded atom table in " + (new Date() - time) + "ms");
+
+            glmol.centerMolecule();
+            glmol.rebuildScene();
+            if (!repressZoom) { glmol.zoomInto(glmol.getAllAtoms()); }
+            glmol.show();
+        };
+    }
+"""
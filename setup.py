@@ -9,5 +9,6 @@ setup(name='ipython_glmol',
     package_data={'ipython_glmol' : ["GLmol/src/js/*"]},
     install_requires = [
         "ipython>=2.0",
+        "numpy",
     ]
 )
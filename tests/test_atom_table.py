@@ -0,0 +1,82 @@
+import numpy
+
+import pytest
+
+from ipython_glmol.atom_table import parse_pdb_atoms, parse_pdb_secondary_structure, assign_secondary_structure, ss_record_dtype, hybrid36_int
+from ipython_glmol.test_data import test_pdb_data
+
+def reference_secondary_structure(atoms, ss_records):
+    ss = numpy.empty(len(atoms), dtype="S1")
+    ss[:] = "c"
+    ssbegin = numpy.zeros(len(atoms), dtype=bool)
+    ssend = numpy.zeros(len(atoms), dtype=bool)
+
+    for ss_type in ("s", "h"):
+        for r in ss_records[ss_records["type"] == ss_type]:
+            chain_mask = atoms["chain"] == r["chain"]
+            ss[chain_mask & (atoms["resi"] >= r["start"]) & (atoms["resi"] <= r["end"])] = ss_type
+            ssbegin[chain_mask & (atoms["resi"] == r["start"])] = True
+            ssend[chain_mask & (atoms["resi"] == r["end"])] = True
+
+    return ss, ssbegin, ssend
+
+def test_assign_secondary_structure_matches_reference():
+    atoms = parse_pdb_atoms(test_pdb_data)
+    atoms = numpy.concatenate([atoms, atoms])
+    atoms["chain"][len(atoms) // 2:] = "B"
+    atoms["resi"] -= 5
+    atoms = atoms[numpy.random.RandomState(0).permutation(len(atoms))]
+
+    ss_records = numpy.array([
+        ("s", "A", -3, 2),
+        ("h", "A", 1, 4),
+        ("s", "A", 4, 4),
+        ("h", "B", 6, 3),
+        ("s", "B", -10, 0),
+        ("h", "Z", 1, 5),
+        ("h", "B", 5, 100),
+        ], dtype=ss_record_dtype)
+
+    result = assign_secondary_structure(atoms, ss_records)
+    expected = reference_secondary_structure(atoms, ss_records)
+
+    for r, e in zip(result, expected):
+        numpy.testing.assert_array_equal(r, e)
+    assert set(result[0]) == set(["c", "h", "s"])
+
+def test_assign_secondary_structure_empty():
+    atoms = parse_pdb_atoms(test_pdb_data)
+    ss_records = numpy.array([("h", "A", 2, 4)], dtype=ss_record_dtype)
+
+    ss, ssbegin, ssend = assign_secondary_structure(atoms[:0], ss_records)
+    assert len(ss) == len(ssbegin) == len(ssend) == 0
+
+    ss, ssbegin, ssend = assign_secondary_structure(atoms, ss_records[:0])
+    assert (ss == "c").all() and not ssbegin.any() and not ssend.any()
+
+def test_hybrid36_fields():
+    assert hybrid36_int("99999") == 99999
+    assert hybrid36_int("A0000") == 100000
+    assert hybrid36_int("A000Z") == 100035
+    assert hybrid36_int("a0000") == 100000 + 26 * 36 ** 4
+    assert hybrid36_int("A000") == 10000
+    assert hybrid36_int("  -7") == -7
+
+    for invalid in ("Aa000", "0A000", "A-000"):
+        with pytest.raises(ValueError):
+            hybrid36_int(invalid)
+
+def test_parse_hybrid36_serial_and_resi():
+    lines = [l for l in test_pdb_data.splitlines() if l.startswith("ATOM")][:3]
+    serials = ["99999", "A0000", "A0001"]
+    resis = ["9999", "A000", "A000"]
+    pdb_string = "\n".join(l[:6] + s + l[11:22] + r + l[26:] for l, s, r in zip(lines, serials, resis))
+    pdb_string += "\nHELIX    1   1 ALA A 9999  ALA A A000  1                                   5"
+
+    atoms = parse_pdb_atoms(pdb_string)
+    assert atoms["serial"].tolist() == [99999, 100000, 100001]
+    assert atoms["resi"].tolist() == [9999, 10000, 10000]
+    assert atoms["residue_number"].tolist() == [0, 1, 1]
+
+    ss_records = parse_pdb_secondary_structure(pdb_string)
+    assert ss_records[["start", "end"]].tolist() == [(9999, 10000)]
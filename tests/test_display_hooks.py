@@ -0,0 +1,28 @@
+from ipython_glmol.display_hooks import extract_character_spans, ss_repr_entries
+from ipython_glmol.glmol_repr import Helix, Sheet
+
+def selections(repr_entries):
+    return [(type(e), e.selector.glmol_selection_string) for e in repr_entries]
+
+def test_extract_character_spans_are_end_exclusive():
+    spans = extract_character_spans("LHHHLEEL")
+    assert spans["type"].tolist() == list("LHLEL")
+    assert spans["start"].tolist() == [0, 1, 4, 5, 7]
+    assert spans["end"].tolist() == [1, 4, 5, 7, 8]
+
+def test_ss_repr_entries_select_span_residues():
+    # Residue numbers:  0123456789
+    entries = ss_repr_entries("LHHHLEELHE")
+    assert selections(entries) == [
+        (Helix, "residue_number 1-3"),
+        (Sheet, "residue_number 5-6"),
+        (Helix, "residue_number 8-8"),
+        (Sheet, "residue_number 9-9"),
+    ]
+
+def test_ss_repr_entries_combined_select_span_residues():
+    entries = ss_repr_entries("HHLEELHHE", combined = True)
+    assert selections(entries) == [
+        (Helix, "residue_number 0-1,6-7"),
+        (Sheet, "residue_number 3-4,8-8"),
+    ]
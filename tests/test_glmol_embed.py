@@ -0,0 +1,45 @@
+from ipython_glmol import PDBEmbed, Ribbon, Stick, glmol_embed, glmol_library_url, glmol_source_library
+from ipython_glmol.test_data import test_pdb_data
+
+def test_repr_string_after_replacing_entries():
+    embed = PDBEmbed(test_pdb_data)
+    embed.repr_entries["stick"] = ["chain A"]
+    assert embed.repr_string == "stick:chain A"
+
+    embed.repr_entries["stick"] = ["chain B"]
+    assert embed.repr_string == "stick:chain B"
+
+    embed.repr_entries["stick"][0] = "chain C"
+    assert embed.repr_string == "stick:chain C"
+
+    embed.repr_entries["stick"].append("chain D")
+    assert embed.repr_string == "stick:chain C\nstick:chain D"
+
+    embed.repr_entries = {"line": ["all"]}
+    assert embed.repr_string == "line:all"
+
+def test_repr_entries_assignment_copies():
+    embed = PDBEmbed(test_pdb_data)
+    entries = ["chain A"]
+    embed.set_repr_entries("stick", entries)
+    embed.repr_string
+
+    entries.append("chain B")
+    assert embed.repr_string == "stick:chain A"
+
+def test_copies_do_not_share_repr_entries():
+    base = PDBEmbed(test_pdb_data) + Ribbon()
+    base.repr_string
+
+    variant = base + Stick()
+    variant.repr_entries["ribbon"][0] = "chain A"
+
+    assert base.repr_string == "ribbon:all"
+    assert "ribbon:chain A" in variant.repr_string.split("\n")
+    assert "stick:all" in variant.repr_string.split("\n")
+
+def test_glmol_source_library_returns_url_string(monkeypatch):
+    monkeypatch.setattr(glmol_embed, "_glmol_source_library", "/static/glmol/GLmol.0123456789abcdef.js")
+
+    assert isinstance(glmol_source_library(), basestring)
+    assert glmol_source_library() == glmol_library_url() == "/static/glmol/GLmol.0123456789abcdef.js"
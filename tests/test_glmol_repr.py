@@ -0,0 +1,43 @@
+import numpy
+
+from ipython_glmol.glmol_repr import color_runs, color_bins, run_selection, ResidueSpectrum
+from ipython_glmol.glmol_selectors import ResidueNumber
+from ipython_glmol import PDBEmbed
+from ipython_glmol.test_data import test_pdb_data
+
+def test_color_runs():
+    assert color_runs([]) == []
+    assert color_runs([3]) == [(3, [(0, 0)])]
+    assert color_runs([1, 1, 0, 0, 0, 1, 2, 1, 1]) == [
+        (0, [(2, 4)]),
+        (1, [(0, 1), (5, 5), (7, 8)]),
+        (2, [(6, 6)]),
+        ]
+
+def test_run_selection_matches_selector_ranges():
+    runs = [(0, 1), (5, 5), (7, 8)]
+    assert run_selection(runs) == "0-1,5,7-8"
+    assert ResidueNumber[[slice(s, e) if e > s else s for s, e in runs]].selector == "residue_number " + run_selection(runs)
+
+def test_color_bins():
+    values = numpy.array([0.0, 0.1, 0.5, 0.99, 1.0, numpy.nan, numpy.inf])
+
+    numpy.testing.assert_array_equal(color_bins(values, 4), [0, 0, 2, 3, 3, 4, 4])
+    numpy.testing.assert_array_equal(color_bins(values, 1), [0, 0, 0, 0, 0, 1, 1])
+    numpy.testing.assert_array_equal(color_bins(values, 2, thresholds = (0.4, 0.6)), [0, 0, 1, 1, 1, 2, 2])
+
+def test_color_bins_invalid_only():
+    numpy.testing.assert_array_equal(color_bins([numpy.nan, numpy.nan], 8), [8, 8])
+    numpy.testing.assert_array_equal(color_bins([2.0, 2.0], 8), [0, 0])
+
+def test_residue_spectrum_entries():
+    embed = PDBEmbed(test_pdb_data, residue_properties = dict(score = [0.0, 0.0, 1.0, numpy.nan, 1.0, 0.0]))
+    spectrum = ResidueSpectrum("score", ["#ff0000", "#0000ff"], n_colors = 2)
+    embed += spectrum
+
+    low, high, invalid = spectrum.palette
+    assert sorted(embed.repr_entries["color"]) == sorted([
+        "%s:residue_number 0-1,5" % low,
+        "%s:residue_number 2,4" % high,
+        "%s:residue_number 3" % invalid,
+        ])
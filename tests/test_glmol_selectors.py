@@ -0,0 +1,21 @@
+import pytest
+
+from ipython_glmol.glmol_selectors import GLMolSelector, All, Chain, ResidueNumber, Within, Interface, Carbon
+
+def test_incomplete_selector_fails_on_instantiation():
+    class Incomplete(GLMolSelector):
+        __slots__ = ()
+
+        @property
+        def selector(self):
+            return "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_with_subselections():
+    for selector in (All(), Chain["A"], ResidueNumber[0:3], Within(4.0, Chain["A"]), Interface("A", "B")):
+        with_carbon = selector + Carbon()
+        assert type(with_carbon) is type(selector)
+        assert with_carbon.subselections == (Carbon(),)
+        assert with_carbon != selector
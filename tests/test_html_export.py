@@ -0,0 +1,71 @@
+import os
+import re
+
+import pytest
+
+from ipython_glmol import PDBEmbed, setup_js
+from ipython_glmol.html_export import export_html, write_library_asset
+from ipython_glmol.glmol_repr import Ribbon
+from ipython_glmol.test_data import test_pdb_data
+
+@pytest.fixture
+def sources(tmpdir, monkeypatch):
+    """GLmol source libraries, independent of the GLmol submodule."""
+    source = tmpdir.join("GLmol.js")
+    source.write("var GLmol = function (id) {};\n")
+
+    monkeypatch.setattr(setup_js, "source_libraries", [str(source)])
+    monkeypatch.setattr(setup_js, "render_cache_dir", str(tmpdir.mkdir("render_cache")))
+    monkeypatch.setattr(setup_js, "_rendered_js", {})
+
+    return source
+
+def library_scripts(page):
+    return re.findall(r'<script src="(GLmol\.[0-9a-f]{16}\.js)"', page)
+
+def assert_self_contained(page, embed):
+    """Page displays the embed without a kernel or structure registry."""
+    assert "new GLmol('glmol', true)" in page
+    assert embed.pdb_string.splitlines()[0] in page
+    assert not "request_structure(glmol," in page
+    assert not "ipython_glmol.cached_structure(" in page
+
+def test_dump_html_inlines_or_references_library(sources):
+    embed = PDBEmbed(test_pdb_data) + Ribbon()
+
+    inlined = embed.dump_html()
+    assert "var GLmol = function (id) {};" in inlined
+    assert library_scripts(inlined) == []
+    assert_self_contained(inlined, embed)
+
+    library_name = "GLmol.%s.js" % setup_js.library_digest()
+    shared = embed.dump_html(library_url = library_name)
+    assert not "var GLmol = function (id) {};" in shared
+    assert library_scripts(shared) == [library_name]
+    assert_self_contained(shared, embed)
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_export_html_shares_library_asset(sources, tmpdir, processes):
+    pdb_file = tmpdir.join("structure.pdb")
+    pdb_file.write(test_pdb_data)
+    embed = PDBEmbed(test_pdb_data) + Ribbon()
+
+    output_dir = tmpdir.join("export")
+    summary = export_html([str(pdb_file), ("embed", embed)], str(output_dir), processes = processes, default_repr = Ribbon())
+
+    library_name = "GLmol.%s.js" % setup_js.library_digest()
+    assert sorted(os.listdir(str(output_dir))) == sorted([library_name, "structure.html", "embed.html"])
+    assert output_dir.join(library_name).read() == setup_js.render_js()
+
+    pages = [output_dir.join(name).read() for name in ("structure.html", "embed.html")]
+    assert summary["pages"] == 2 and summary["bytes"] == sum(len(p) for p in pages)
+    for page in pages:
+        assert library_scripts(page) == [library_name]
+        assert not "var GLmol = function (id) {};" in page
+        assert_self_contained(page, embed)
+
+    # Repeat exports reuse the library, changed sources get a new content hash
+    assert write_library_asset(str(output_dir)) == library_name
+    sources.write("var GLmol = function (id, changed) {};\n")
+    os.utime(str(sources), (1, 1))
+    assert write_library_asset(str(output_dir)) != library_name
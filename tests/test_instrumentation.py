@@ -0,0 +1,104 @@
+import re
+import json
+
+import pytest
+
+from ipython_glmol import PDBEmbed, glmol_embed, instrumentation, live, transport
+from ipython_glmol.instrumentation import EmbedProfile
+from ipython_glmol.glmol_repr import Ribbon, Stick
+from ipython_glmol.glmol_selectors import Chain
+from ipython_glmol.lru_cache import LRUCache
+from ipython_glmol.test_data import test_pdb_data
+
+@pytest.fixture
+def notebook(monkeypatch):
+    monkeypatch.setattr(glmol_embed, "_glmol_source_library", "/static/glmol/GLmol.js")
+    monkeypatch.setattr(live, "displayed_embeds", LRUCache(8))
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_stages_accumulate_and_include_nested_stages(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(instrumentation.time, "time", clock)
+
+    profile = EmbedProfile()
+    for _ in range(2):
+        with profile.stage("outer"):
+            clock.now += 1.0
+            with profile.stage("inner"):
+                clock.now += 0.25
+
+    with pytest.raises(ValueError):
+        with profile.stage("failed"):
+            clock.now += 0.5
+            raise ValueError()
+
+    report = profile.report()
+    assert report["stages"] == dict(
+        outer = dict(calls = 2, seconds = 2.5),
+        inner = dict(calls = 2, seconds = 0.5),
+        failed = dict(calls = 1, seconds = 0.5))
+
+def test_browser_timings_keep_known_names():
+    profile = EmbedProfile()
+    profile.record_browser("glmol_a", dict(render = 3, load = 10, unknown = 1))
+    profile.record_browser("glmol_a", dict(load = 12))
+
+    assert profile.report()["browser"] == {"glmol_a": {"load": 12}}
+    assert "glmol_a: load=12ms" in profile.format_report()
+
+    profile.clear()
+    assert profile.report() == dict(stages = {}, payload_bytes = {}, browser = {})
+
+def test_text_embed_profile_matches_generated_javascript():
+    embed = PDBEmbed(test_pdb_data)
+    embed += Ribbon()
+    embed += Stick(Chain["A"])
+    embed_js = embed.embed_js("glmol_profile")
+    report = embed.timing_report()
+
+    pdb_textarea_json = re.search(r"var pdb_textarea_json = (.*);\n", embed_js).group(1)
+    repr_textarea_json = re.search(r"var repr_textarea_json = (.*);\n", embed_js).group(1)
+
+    assert report["payload_bytes"] == dict(repr = len(embed.repr_string), structure = len(pdb_textarea_json))
+    assert embed.pdb_string in json.loads(pdb_textarea_json)
+    assert embed.repr_string in json.loads(repr_textarea_json)
+
+    stages = report["stages"]
+    assert stages["modifiers"]["calls"] == 2
+    assert stages["repr_serialization"]["calls"] == 1
+    assert stages["json_encode"]["calls"] == 2
+    assert all(s["seconds"] >= 0 for s in stages.values())
+
+def test_notebook_embed_profile_matches_output(notebook):
+    for embed_transport in PDBEmbed.transports:
+        embed = PDBEmbed(test_pdb_data, transport = embed_transport) + Ribbon()
+        output_js = embed.notebook_embed_js("glmol_profile")
+        report = embed.timing_report()
+
+        structure_json = json.dumps(embed.structure_payload())
+        encoded = re.search(r"var glmol_profile_encoded_payload = (.*);\n", output_js).group(1)
+
+        assert report["payload_bytes"] == dict(
+            repr = len(embed.repr_string),
+            structure = len(structure_json),
+            structure_output = len(encoded),
+            javascript = len(output_js))
+
+        stages = report["stages"]
+        assert stages["library_install"]["calls"] == 1
+        assert stages["embed_js"]["calls"] == 1
+        # Nested stages are included in the enclosing embed_js stage
+        assert stages["embed_js"]["seconds"] >= stages["json_encode"]["seconds"]
+
+def test_binary_structure_payload_size():
+    embed = PDBEmbed(test_pdb_data, transport = "binary")
+    embed.structure_payload_json()
+
+    packed = transport.pack_atom_table(embed.atom_table, ss_records = embed.ss_records)
+    assert embed.timing_report()["payload_bytes"]["structure"] == len(json.dumps(packed))
@@ -0,0 +1,116 @@
+import pytest
+
+from ipython_glmol import PDBEmbed, live
+from ipython_glmol.live import LiveEmbed
+from ipython_glmol.glmol_repr import Ribbon, Stick, Sphere
+from ipython_glmol.glmol_selectors import Chain
+from ipython_glmol.lru_cache import LRUCache
+from ipython_glmol.test_data import test_pdb_data
+
+class RecordingComm(object):
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+        self.handler = None
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def on_msg(self, handler):
+        self.handler = handler
+
+    def close(self):
+        self.closed = True
+
+def message(**data):
+    return dict(content = dict(data = data))
+
+@pytest.fixture
+def comms(monkeypatch):
+    opened = []
+
+    def open_comm(data = None):
+        opened.append(RecordingComm())
+        return opened[-1]
+
+    monkeypatch.setattr(live, "open_comm", open_comm)
+    monkeypatch.setattr(live, "displayed_embeds", LRUCache(8))
+
+    return opened
+
+def test_update_sends_changed_repr_types(comms):
+    handle = LiveEmbed(PDBEmbed(test_pdb_data) + Ribbon(), "glmol_live")
+
+    # Unchanged embed, no message and no comm
+    assert handle.update() == {}
+    assert comms == []
+
+    # Added modifier, only the added repr type is sent
+    handle += Stick(Chain["A"])
+    comm, = comms
+    assert [m["type"] for m in comm.sent] == ["repr"]
+    assert comm.sent[-1]["embed_id"] == "glmol_live"
+    assert comm.sent[-1]["entries"] == {"stick": ["stick:chain A"]}
+
+    # Unchanged after a repeat update
+    assert handle.update() == {}
+    assert len(comm.sent) == 1
+
+    # Removed repr type is sent empty, other types are unchanged
+    handle += Stick(None)
+    assert comm.sent[-1]["entries"] == {"stick": []}
+
+    # Replaced embed, both the added and the removed types are sent
+    handle.update(PDBEmbed(test_pdb_data) + Sphere(Chain["A"]))
+    assert comm.sent[-1]["entries"] == {"ribbon": [], "sphere": ["sphere:chain A"]}
+    assert len(comm.sent) == 3
+
+def test_live_embed_handles_frontend_messages(comms):
+    embed = PDBEmbed(test_pdb_data)
+    handle = LiveEmbed(embed, "glmol_live")
+    handle.send("repr", entries = {})
+    comm, = comms
+
+    comm.handler(message(type = "structure", embed_id = "glmol_live"))
+    assert comm.sent[-1] == dict(type = "structure", embed_id = "glmol_live", payload = embed.structure_payload())
+
+    serial = int(embed.atom_table["serial"][0])
+    comm.handler(message(type = "pick", embed_id = "glmol_live", requests = [dict(id = 0, kind = "click", serial = serial)]))
+    assert comm.sent[-1]["type"] == "pick_info"
+    assert [r["serial"] for r in comm.sent[-1]["responses"]] == [serial]
+
+def test_frontend_comm_dispatches_to_displayed_embed(comms):
+    embed = PDBEmbed(test_pdb_data)
+    live.displayed_embeds["glmol_shown"] = embed
+
+    comm = RecordingComm()
+    live.handle_frontend_comm(comm, message(type = "open", embed_id = "glmol_shown"))
+    assert not comm.closed and comm.sent == []
+
+    comm.handler(message(type = "structure", embed_id = "glmol_shown"))
+    assert comm.sent == [dict(type = "structure", embed_id = "glmol_shown", payload = embed.structure_payload())]
+
+    # Timings are posted on a comm closed after the message
+    timings_comm = RecordingComm()
+    live.handle_frontend_comm(timings_comm, message(type = "timings", embed_id = "glmol_shown", timings = dict(load = 12)))
+    assert timings_comm.closed and timings_comm.sent == []
+    assert embed.profile.report()["browser"]["glmol_shown"]["load"] == 12
+
+def test_frontend_comm_for_unknown_embed_replies_error(comms):
+    for data in (dict(type = "open"), dict(type = "structure"), dict(type = "pick", requests = [])):
+        comm = RecordingComm()
+        live.handle_frontend_comm(comm, message(embed_id = "glmol_unknown", **data))
+
+        assert comm.closed and comm.handler is None
+        reply, = comm.sent
+        assert (reply["type"], reply["embed_id"], reply["request"]) == ("error", "glmol_unknown", data["type"])
+        assert reply["error"]
+
+    # Messages on open comms of evicted embeds are answered the same way
+    live.displayed_embeds["glmol_evicted"] = PDBEmbed(test_pdb_data)
+    comm = RecordingComm()
+    live.handle_frontend_comm(comm, message(type = "open", embed_id = "glmol_evicted"))
+    live.displayed_embeds.clear()
+
+    comm.handler(message(type = "structure", embed_id = "glmol_evicted"))
+    assert [(m["type"], m["request"]) for m in comm.sent] == [("error", "structure")]
@@ -0,0 +1,94 @@
+import gc
+import json
+
+import numpy
+
+from ipython_glmol import PDBEmbed, live
+from ipython_glmol.lod import LevelOfDetail, ca_trace, residue_centroids, chain_spheres
+from ipython_glmol.benchmarks import synthetic_structure
+from ipython_glmol.lru_cache import LRUCache
+
+class RecordingComm(object):
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+        self.handler = None
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def on_msg(self, handler):
+        self.handler = handler
+
+    def close(self):
+        self.closed = True
+
+def message(**data):
+    return dict(content = dict(data = data))
+
+def test_coarse_levels():
+    atoms = PDBEmbed(synthetic_structure(600)[0]).atom_table
+    n_residues = len(numpy.unique(atoms["residue_number"]))
+
+    assert (ca_trace(atoms)["name"] == "CA").all()
+    assert len(residue_centroids(atoms)) == n_residues
+    assert len(chain_spheres(atoms)) == len(numpy.unique(atoms["chain_number"]))
+
+    # Pseudo-atoms carry source atom serials, picks and serial-keyed colors resolve to source atoms
+    for coarse in (ca_trace(atoms), residue_centroids(atoms), chain_spheres(atoms)):
+        assert numpy.in1d(coarse["serial"], atoms["serial"]).all()
+        assert len(numpy.unique(coarse["serial"])) == len(coarse)
+
+def test_deferred_full_detail():
+    pdb_string = synthetic_structure(600)[0]
+    full_detail = json.dumps(pdb_string)[1:-1]
+
+    for transport in PDBEmbed.transports:
+        embed = PDBEmbed(pdb_string, transport = transport, lod = LevelOfDetail(threshold = 100))
+
+        inlined = embed.embed_js("glmol_lod")
+        deferred = embed.embed_js("glmol_lod", defer_lod = True)
+
+        assert "ipython_glmol.request_structure(glmol_lod," in deferred
+        assert not "ipython_glmol.request_structure(glmol_lod," in inlined
+        assert len(deferred) < len(inlined)
+        if transport == "text":
+            assert full_detail[:1000] in inlined and not full_detail[:1000] in deferred
+
+        # Fine structures are displayed without level of detail
+        assert not "load_lod(" in PDBEmbed(pdb_string, transport = transport, lod = LevelOfDetail(threshold = 10 ** 6)).embed_js("glmol_lod", defer_lod = True)
+
+def test_structure_request():
+    embed = PDBEmbed(synthetic_structure(300)[0], lod = LevelOfDetail(threshold = 100))
+    live.displayed_embeds["glmol_lod"] = embed
+
+    comm = RecordingComm()
+    live.handle_frontend_comm(comm, message(type = "open", embed_id = "glmol_lod"))
+    comm.handler(message(type = "structure", embed_id = "glmol_lod"))
+
+    assert comm.sent == [dict(type = "structure", embed_id = "glmol_lod", payload = embed.pdb_string)]
+
+def test_displayed_temporary_serves_full_detail(monkeypatch):
+    from ipython_glmol import glmol_embed
+    from ipython_glmol.glmol_repr import Ribbon
+
+    monkeypatch.setattr(glmol_embed, "_glmol_source_library", "/static/glmol/GLmol.js")
+    monkeypatch.setattr(live, "displayed_embeds", LRUCache(2))
+
+    pdb_string = synthetic_structure(300)[0]
+    (PDBEmbed(pdb_string, lod = LevelOfDetail(threshold = 100)) + Ribbon()).notebook_embed_js("glmol_temporary")
+    gc.collect()
+
+    comm = RecordingComm()
+    live.handle_frontend_comm(comm, message(type = "open", embed_id = "glmol_temporary"))
+    comm.handler(message(type = "structure", embed_id = "glmol_temporary"))
+    assert comm.sent == [dict(type = "structure", embed_id = "glmol_temporary", payload = pdb_string)]
+
+    # Evicted by later displays, requests are answered with an error
+    for i in range(2):
+        PDBEmbed(pdb_string).notebook_embed_js("glmol_later%i" % i)
+
+    comm = RecordingComm()
+    live.handle_frontend_comm(comm, message(type = "structure", embed_id = "glmol_temporary"))
+    assert [(m["type"], m["request"]) for m in comm.sent] == [("error", "structure")]
+    assert comm.sent[0]["error"] and comm.closed
@@ -0,0 +1,46 @@
+import json
+import zlib
+import base64
+
+from ipython_glmol import PDBEmbed
+from ipython_glmol.payload_policy import PayloadPolicy
+from ipython_glmol.test_data import test_pdb_data
+
+def test_encode_modes(tmpdir):
+    payload_json = json.dumps(test_pdb_data)
+    policy = PayloadPolicy(compress_min_bytes = 1024, reference_min_bytes = None)
+
+    assert policy.encode("small", json.dumps("ATOM")) == json.dumps("ATOM")
+
+    encoded = json.loads(policy.encode("large", payload_json))
+    assert encoded["encoding"] == "deflate"
+    assert zlib.decompress(base64.b64decode(encoded["data"])) == payload_json
+
+def test_load_finishes_in_payload_callback():
+    embed = PDBEmbed(test_pdb_data)
+    embed.payload_policy = PayloadPolicy(compress_min_bytes = 0)
+    embed_js = embed.embed_js("glmol_test", encode_payload = True)
+
+    callback_start = embed_js.index("ipython_glmol.with_payload(glmol_test_encoded_payload, function (glmol_test_payload)")
+    callback_end = embed_js.index("}, function (error) { ipython_glmol.show_error(glmol_test, error); }, glmol_test);")
+
+    assert embed_js.count("ipython_glmol.finish_load(glmol_test,") == 1
+    assert callback_start < embed_js.index("ipython_glmol.finish_load(glmol_test,") < callback_end
+
+def test_compression_is_opt_in():
+    payload_json = json.dumps(test_pdb_data * 64)
+    assert len(payload_json) > 64 << 10
+    assert PayloadPolicy().encode("large", payload_json) == payload_json
+
+def test_records_are_bounded():
+    policy = PayloadPolicy(compress_min_bytes = 1024, max_records = 4)
+    for i in range(10):
+        policy.encode("structure_%i" % i, json.dumps(test_pdb_data))
+        policy.record_output("glmol_%i" % i, 100 + i)
+
+    assert len(policy.payloads) == len(policy.outputs) == 4
+    assert policy.outputs.keys() == ["glmol_%i" % i for i in range(6, 10)]
+
+    footprint = policy.footprint()
+    assert footprint["outputs"] == 4 and footprint["output_bytes"] == sum(range(106, 110))
+    assert footprint["payloads"]["deflate"]["count"] == 4
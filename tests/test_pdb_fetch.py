@@ -0,0 +1,132 @@
+import os
+import threading
+import SocketServer
+import BaseHTTPServer
+
+import pytest
+
+from ipython_glmol import PDBEmbed
+from ipython_glmol.pdb_fetch import PDBFetcher, FetchError, KeepAliveClient
+from ipython_glmol.display_hooks import pdb_grid_display
+from ipython_glmol.test_data import test_pdb_data
+
+def test_fetch_to_cache_error_removes_temp_file(tmpdir, monkeypatch):
+    fetcher = PDBFetcher(cache_dir = str(tmpdir))
+
+    def open_remote(pdb_id, format = "pdb", client = None):
+        raise FetchError("unavailable")
+    monkeypatch.setattr(fetcher, "open_remote", open_remote)
+
+    open_fds = len(os.listdir("/proc/self/fd")) if os.path.exists("/proc/self/fd") else None
+    for _ in range(3):
+        with pytest.raises(FetchError):
+            fetcher.fetch_to_cache("1abc")
+
+    assert os.listdir(str(tmpdir)) == []
+    if open_fds is not None:
+        assert len(os.listdir("/proc/self/fd")) == open_fds
+
+class PDBRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.client_address))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            if server.max_active >= server.expected_concurrency:
+                server.concurrent.set()
+        try:
+            # Hold requests until concurrent requests arrive, bounded by timeout
+            server.concurrent.wait(0.5)
+
+            pdb_id = self.path.strip("/").split(".")[0]
+            if pdb_id in server.entries:
+                self.send_response(200)
+                body = server.entries[pdb_id]
+            else:
+                self.send_response(404)
+                body = "Not found"
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+class PDBServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+@pytest.fixture
+def pdb_server():
+    server = PDBServer(("127.0.0.1", 0), PDBRequestHandler)
+    server.entries = dict(("%iabc" % i, test_pdb_data) for i in range(8))
+    server.requests = []
+    server.lock = threading.Lock()
+    server.active = server.max_active = 0
+    server.expected_concurrency = 2
+    server.concurrent = threading.Event()
+
+    thread = threading.Thread(target = server.serve_forever, args = (0.05,))
+    thread.daemon = True
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def server_fetcher(server):
+    return PDBFetcher(url_templates = dict(pdb = "http://127.0.0.1:%i/%%s.pdb" % server.server_address[1]))
+
+def test_keep_alive_client_reuses_connection(pdb_server):
+    pdb_server.concurrent.set()
+    client = KeepAliveClient(timeout = 5)
+    try:
+        for pdb_id in ("0abc", "1abc", "2abc"):
+            assert client.get("http://127.0.0.1:%i/%s.pdb" % (pdb_server.server_address[1], pdb_id)).read() == test_pdb_data
+    finally:
+        client.close()
+
+    assert len(pdb_server.requests) == 3
+    assert len(set(address for _, address in pdb_server.requests)) == 1
+
+def test_read_many_concurrent_keep_alive(pdb_server):
+    pdb_ids = ["%iabc" % i for i in range(8)]
+    results = server_fetcher(pdb_server).read_many(iter(pdb_ids), lambda f: f.read(), connections = 2)
+
+    assert [r["pdb_id"] for r in results] == pdb_ids
+    assert all(r["error"] is None and r["result"] == test_pdb_data for r in results)
+
+    assert pdb_server.max_active == 2
+    # Connections are reused by each of the two worker threads
+    assert len(set(address for _, address in pdb_server.requests)) == 2
+
+def test_read_many_reports_errors_per_entry(pdb_server):
+    pdb_server.concurrent.set()
+
+    def read(entry):
+        data = entry.read()
+        if not data.strip():
+            raise ValueError("Empty entry.")
+        return len(data)
+
+    pdb_server.entries["3abc"] = ""
+    results = server_fetcher(pdb_server).read_many(["0abc", "missing", "3abc", "1abc"], read, connections = 2)
+
+    assert [r["result"] for r in results] == [len(test_pdb_data), None, None, len(test_pdb_data)]
+    assert results[0]["error"] is None and results[3]["error"] is None
+    assert results[1]["error"].startswith("FetchError: HTTP 404")
+    assert results[2]["error"] == "ValueError: Empty entry."
+
+def test_pdb_grid_display(pdb_server):
+    pdb_server.concurrent.set()
+    grid = pdb_grid_display((i for i in ("0abc", "missing")), fetcher = server_fetcher(pdb_server), connections = 2)
+
+    assert isinstance(grid.embeds[0], PDBEmbed)
+    assert grid.embeds[0].atom_table.size
+    assert grid.errors.keys() == ["missing"]
@@ -0,0 +1,74 @@
+import logging
+
+from ipython_glmol.pdb_reader import cif_atom_site_records
+from ipython_glmol.atom_table import atom_table_from_lines
+
+cif_header = """data_TEST
+#
+loop_
+_atom_site.group_PDB
+_atom_site.id
+_atom_site.type_symbol
+_atom_site.label_atom_id
+_atom_site.label_comp_id
+_atom_site.auth_asym_id
+_atom_site.auth_seq_id
+_atom_site.Cartn_x
+_atom_site.Cartn_y
+_atom_site.Cartn_z
+_atom_site.pdbx_PDB_model_num
+"""
+
+def read_atoms(cif_string):
+    return atom_table_from_lines(list(cif_atom_site_records(cif_string.splitlines(True))))
+
+def test_single_line_rows():
+    atoms = read_atoms(cif_header + """ATOM 1 N N GLY A 1 1.0 2.0 3.0 1
+ATOM 2 C CA GLY A 1 2.0 2.0 3.0 1
+HETATM 3 O O HOH A 2 5.0 5.0 5.0 1
+#
+""")
+    assert atoms["serial"].tolist() == [1, 2, 3]
+    assert atoms["name"].tolist() == ["N", "CA", "O"]
+    assert atoms["hetflag"].tolist() == [False, False, True]
+
+def test_rows_spanning_lines():
+    atoms = read_atoms(cif_header + """ATOM 1 N N GLY A
+1 1.0 2.0 3.0 1
+ATOM 2 C CA
+GLY A 1 2.0
+  2.0 3.0 1 ATOM 3 C "C" GLY A 1 3.0 2.0 3.0 1
+
+ATOM 4 O O GLY A 1
+
+4.0 2.0 1.0 1
+#
+""")
+    assert atoms["serial"].tolist() == [1, 2, 3, 4]
+    assert atoms["name"].tolist() == ["N", "CA", "C", "O"]
+    assert atoms["xyz"][3].tolist() == [4.0, 2.0, 1.0]
+
+    atoms = read_atoms(cif_header.replace("_atom_site.pdbx_PDB_model_num\n", "_atom_site.pdbx_PDB_model_num\n_atom_site.details\n") + """ATOM 1 N N GLY A 1 1.0 2.0 3.0 1
+;multi-line
+details
+;
+ATOM 2 C CA GLY A 1 2.0 2.0 3.0 1 .
+#
+""")
+    assert atoms["serial"].tolist() == [1, 2]
+    assert atoms["xyz"][1].tolist() == [2.0, 2.0, 3.0]
+
+def test_incomplete_row_warns(caplog):
+    with caplog.at_level(logging.WARNING, logger = "ipython_glmol.pdb_reader"):
+        atoms = read_atoms(cif_header + """ATOM 1 N N GLY A 1 1.0 2.0 3.0 1
+ATOM 2 C CA GLY A 1
+#
+""")
+    assert atoms["serial"].tolist() == [1]
+    assert "incomplete _atom_site row" in caplog.text
+
+def test_first_model_only():
+    atoms = read_atoms(cif_header + """ATOM 1 N N GLY A 1 1.0 2.0 3.0 1
+ATOM 2 N N GLY A 1 1.0 2.0 3.0 2
+""")
+    assert atoms["serial"].tolist() == [1]
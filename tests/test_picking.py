@@ -0,0 +1,109 @@
+import numpy
+
+from ipython_glmol import PDBEmbed, live, picking
+from ipython_glmol.atom_table import atom_dtype
+from ipython_glmol.picking import AtomLookup, pick_response
+from ipython_glmol.lod import residue_centroids, chain_spheres
+from ipython_glmol.test_data import test_pdb_data
+
+def atoms_with_serials(serials):
+    atoms = numpy.zeros(len(serials), dtype=atom_dtype)
+    atoms["serial"] = serials
+    return atoms
+
+def test_atom_lookup_rows():
+    lookup = AtomLookup(atoms_with_serials([10, 3, 7, 3, 25]))
+
+    numpy.testing.assert_array_equal(lookup.rows([3, 7, 25, 10]), [1, 2, 4, 0])
+    # Unknown serials, below, between and above the known serials
+    numpy.testing.assert_array_equal(lookup.rows([1, 5, 30]), [-1, -1, -1])
+    assert len(lookup.rows([])) == 0
+
+def test_atom_lookup_duplicate_serials_return_first_atom():
+    lookup = AtomLookup(atoms_with_serials([5, 2, 5, 2, 5]))
+    numpy.testing.assert_array_equal(lookup.rows([5, 2]), [0, 1])
+
+def test_atom_lookup_empty_table():
+    lookup = AtomLookup(atoms_with_serials([]))
+    numpy.testing.assert_array_equal(lookup.rows([1, 2]), [-1, -1])
+    assert len(lookup.rows([])) == 0
+
+def test_pick_response_answers_last_hover():
+    embed = PDBEmbed(test_pdb_data)
+    serials = embed.atom_table["serial"][:4].tolist()
+
+    responses = pick_response(embed, [
+        dict(id = 0, kind = "hover", serial = serials[0]),
+        dict(id = 1, kind = "click", serial = serials[1]),
+        dict(id = 2, kind = "hover", serial = serials[2]),
+        dict(id = 3, kind = "click", serial = 10 ** 6),
+        ])
+
+    assert [(r["id"], r["kind"]) for r in responses] == [(1, "click"), (3, "click"), (2, "hover")]
+    assert responses[0]["info"]["serial"] == serials[1]
+    assert responses[1]["info"] is None
+    assert responses[2]["info"]["serial"] == serials[2]
+
+def test_pick_response_batch_cap(monkeypatch):
+    monkeypatch.setattr(picking, "max_batch_requests", 3)
+    embed = PDBEmbed(test_pdb_data)
+    serial = int(embed.atom_table["serial"][0])
+
+    requests = [dict(id = i, kind = "click", serial = serial) for i in range(5)] + [dict(id = 5, kind = "hover", serial = serial)]
+    responses = pick_response(embed, requests)
+
+    assert [r["id"] for r in responses] == [3, 4, 5]
+
+def test_pick_response_on_coarse_levels():
+    embed = PDBEmbed(test_pdb_data, residue_properties = dict(score = numpy.arange(11) * 0.5))
+    embed.atom_properties["b_norm"] = numpy.linspace(0, 1, len(embed.atom_table))
+    atoms = embed.atom_table
+
+    # Pseudo-atoms keep the serial of their first source atom
+    centroids = residue_centroids(atoms)
+    residue, = numpy.nonzero(centroids["residue_number"] == 3)[0]
+    source = atoms[atoms["residue_number"] == 3][0]
+    assert centroids["serial"][residue] == source["serial"]
+
+    response, = pick_response(embed, [dict(id = 0, kind = "click", serial = int(centroids["serial"][residue]), level = "centroid")])
+    info = response["info"]
+    assert response["level"] == "centroid"
+    assert (info["chain"], info["resn"], info["resi"], info["residue_number"]) == (source["chain"], source["resn"], source["resi"], 3)
+    assert info["residue_properties"] == dict(score = 1.5)
+    assert info["atom_properties"] == {} and not "name" in info
+
+    chains = chain_spheres(atoms)
+    response, = pick_response(embed, [dict(id = 1, kind = "hover", serial = int(chains["serial"][-1]), level = "chain")])
+    assert response["info"]["chain"] == atoms["chain"][-1]
+    assert response["info"]["residue_properties"] == {} and not "resn" in response["info"]
+
+    # Full detail picks are unchanged
+    row = numpy.nonzero(atoms["serial"] == source["serial"])[0][0]
+    response, = pick_response(embed, [dict(id = 2, kind = "click", serial = int(source["serial"]))])
+    assert response["level"] is None
+    assert response["info"]["name"] == source["name"]
+    assert response["info"]["atom_properties"] == dict(b_norm = embed.atom_properties["b_norm"][row])
+
+class ClosingComm(object):
+    closed = False
+    handler = None
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def on_msg(self, handler):
+        self.handler = handler
+
+    def close(self):
+        self.closed = True
+
+def test_frontend_comm_for_unknown_embed_is_closed():
+    comm = ClosingComm()
+    live.handle_frontend_comm(comm, dict(content = dict(data = dict(type = "open", embed_id = "glmol_unknown"))))
+
+    assert comm.closed
+    assert comm.handler is None
+    assert [(m["type"], m["embed_id"], m["request"]) for m in comm.sent] == [("error", "glmol_unknown", "open")]
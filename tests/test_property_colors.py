@@ -0,0 +1,100 @@
+import base64
+
+import numpy
+import pytest
+
+from ipython_glmol import PDBEmbed
+from ipython_glmol.glmol_repr import PropertyColor, ClearPropertyColor
+from ipython_glmol.glmol_selectors import ResidueNumber
+from ipython_glmol.property_colors import code_dtype, quantize_property, colormap_table, resolve_colormap, pack_property_colors
+from ipython_glmol.test_data import test_pdb_data
+
+def decode(data, dtype):
+    return numpy.frombuffer(base64.b64decode(data), dtype=numpy.dtype(dtype).newbyteorder("<"))
+
+def test_code_dtype():
+    assert code_dtype(254) == numpy.uint8
+    assert code_dtype(255) == numpy.uint16
+    assert code_dtype(2 ** 16 - 2) == numpy.uint16
+    with pytest.raises(ValueError):
+        code_dtype(2 ** 16 - 1)
+
+def test_quantize_property():
+    values = [0.0, 0.1, 0.5, 0.99, 1.0, numpy.nan, numpy.inf, -numpy.inf]
+
+    numpy.testing.assert_array_equal(quantize_property(values, 4), [0, 0, 2, 3, 3, 4, 4, 4])
+    numpy.testing.assert_array_equal(quantize_property(values, 1), [0, 0, 0, 0, 0, 1, 1, 1])
+    # Values outside thresholds are clipped to the end bins
+    numpy.testing.assert_array_equal(quantize_property(values, 2, 0.4, 0.6), [0, 0, 1, 1, 1, 2, 2, 2])
+
+    # Constant and invalid only values
+    numpy.testing.assert_array_equal(quantize_property([2.0, 2.0], 8), [0, 0])
+    numpy.testing.assert_array_equal(quantize_property([numpy.nan, numpy.nan], 8), [8, 8])
+
+    assert quantize_property(values, 254).dtype == numpy.uint8
+    assert quantize_property(values, 1000).dtype == numpy.uint16
+
+def test_colormap_table():
+    table = colormap_table(resolve_colormap(["#ff0000", "#0000ff"]), 2)
+    assert table.dtype == numpy.uint32 and len(table) == 3
+    assert table[0] & 0xff0000 > table[1] & 0xff0000
+    assert table[0] & 0x0000ff < table[1] & 0x0000ff
+
+def test_property_color_codes():
+    score = [0.0, 0.0, 1.0, numpy.nan, 1.0, 0.0, 0.5, 0.5, 0.5, 0.5, 0.5]
+    embed = PDBEmbed(test_pdb_data, residue_properties = dict(score = score))
+    atoms = embed.atom_table
+
+    embed += PropertyColor("score", ["#ff0000", "#0000ff"], n_colors = 2)
+    property_colors = embed.property_colors
+    assert property_colors["property"] == "score"
+    assert len(property_colors["table"]) == 3
+
+    # Residue codes indexed by atom residue number, NaN residues coded n_colors
+    expected = numpy.array([0, 0, 1, 2, 1, 0, 1, 1, 1, 1, 1])[atoms["residue_number"]]
+    numpy.testing.assert_array_equal(property_colors["codes"], expected)
+
+    # Unselected atoms are coded n_colors + 1, past the table
+    embed += PropertyColor("score", n_colors = 2, selector = ResidueNumber[0:1])
+    codes = embed.property_colors["codes"]
+    selected = atoms["residue_number"] <= 1
+    numpy.testing.assert_array_equal(codes[selected], 0)
+    numpy.testing.assert_array_equal(codes[~selected], 3)
+
+    # Atom properties and thresholds
+    values = numpy.linspace(0, 1, len(atoms))
+    valid = numpy.arange(len(atoms)) != 5
+    embed.atom_properties["b_norm"] = numpy.where(valid, values, numpy.nan)
+    embed += PropertyColor("b_norm", n_colors = 4, thresholds = (0.25, 0.75))
+    codes = embed.property_colors["codes"]
+    numpy.testing.assert_array_equal(codes[valid & (values < 0.25)], 0)
+    numpy.testing.assert_array_equal(codes[valid & (values >= 0.75)], 3)
+    numpy.testing.assert_array_equal(codes[valid & (values >= 0.5) & (values < 0.625)], 2)
+    assert codes[5] == 4
+
+    embed += ClearPropertyColor()
+    assert embed.property_colors is None
+
+def test_property_color_invalid_property():
+    embed = PDBEmbed(test_pdb_data, residue_properties = dict(score = [0.0]))
+    with pytest.raises(ValueError):
+        embed += PropertyColor("missing")
+    with pytest.raises(ValueError):
+        embed += PropertyColor("score")
+
+def test_pack_property_colors_serial():
+    atoms = PDBEmbed(test_pdb_data).atom_table[::3].copy()
+    atoms["serial"] += 1000
+    embed = PDBEmbed.from_atom_table(atoms)
+    embed += PropertyColor("occupancy", n_colors = 300)
+
+    packed = pack_property_colors(embed.property_colors, embed.atom_table)
+    assert packed["property"] == "occupancy"
+    assert packed["code_type"] == "uint16"
+    numpy.testing.assert_array_equal(decode(packed["serial"], "int32"), atoms["serial"])
+    numpy.testing.assert_array_equal(decode(packed["codes"], "uint16"), embed.property_colors["codes"])
+    numpy.testing.assert_array_equal(decode(packed["table"], "uint32"), embed.property_colors["table"])
+
+    # Serial numbers are sent once, later updates reuse them
+    assert not "serial" in pack_property_colors(embed.property_colors, embed.atom_table, include_serial = False)
+    assert pack_property_colors(None, embed.atom_table) is None
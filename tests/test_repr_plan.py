@@ -0,0 +1,52 @@
+import numpy
+
+import pytest
+
+from ipython_glmol import PDBEmbed
+from ipython_glmol.benchmarks import synthetic_structure
+from ipython_glmol.display_hooks import ss_repr_entries
+from ipython_glmol.glmol_repr import Ribbon, Stick, Line, Sphere, Color, BackgroundColor, Clear, ResidueSpectrum
+from ipython_glmol.glmol_selectors import Chain, Heavyatom, ResidueNumber, Within
+from ipython_glmol.repr_plan import ReprPlan, repr_plan
+
+def structure_embed(n_atoms, seed = 0):
+    pdb_string, ss_sequence = synthetic_structure(n_atoms)
+    score = numpy.random.RandomState(seed).normal(size = len(ss_sequence))
+    return PDBEmbed(pdb_string, dict(score = score)), ss_sequence
+
+def stacks(ss_sequence):
+    return [
+        [Ribbon(), Stick(Chain["A"] + Heavyatom()), Color("#ff0000", ResidueNumber[2:5]), BackgroundColor("#ffffff")] +
+            ss_repr_entries(ss_sequence),
+        [Ribbon(), ResidueSpectrum("score"), Clear(), Stick(Within(4.0, ResidueNumber[3])), Sphere(), Line(None), Line()],
+        [ResidueSpectrum("score", n_colors = 3), Ribbon(ResidueNumber[0:10]), Clear(), Sphere(Chain["A"])],
+        ]
+
+def repr_lines(embed):
+    return sorted(embed.repr_string.split("\n"))
+
+@pytest.mark.parametrize("stack_index", range(3))
+@pytest.mark.parametrize("prior", [None, Line(), Ribbon(ResidueNumber[1])])
+def test_plan_matches_direct_application(stack_index, prior):
+    embed, ss_sequence = structure_embed(800)
+    if prior is not None:
+        embed += prior
+    stack = stacks(ss_sequence)[stack_index]
+
+    direct = embed + stack
+    planned = embed + ReprPlan(stack)
+
+    assert repr_lines(planned) == repr_lines(direct)
+    assert dict((k, list(v)) for k, v in planned.repr_entries.items() if v) == \
+        dict((k, list(v)) for k, v in direct.repr_entries.items() if v)
+
+def test_cached_plan_applies_to_other_structures():
+    embed, ss_sequence = structure_embed(800)
+    other, _ = structure_embed(1600, seed = 1)
+    stack = stacks(ss_sequence)[1]
+
+    plan = repr_plan(stack)
+    assert repr_plan(stack) is plan
+
+    for e in (embed, other):
+        assert repr_lines(e + plan) == repr_lines(e + stack)
@@ -0,0 +1,123 @@
+import numpy
+
+from ipython_glmol import rosetta_pose
+from ipython_glmol.atom_table import parse_pdb_atoms
+from ipython_glmol.display_hooks import pose_display
+from ipython_glmol.test_data import test_pdb_data
+
+class Vector(object):
+    def __init__(self, xyz):
+        self.x, self.y, self.z = xyz
+
+class AtomType(object):
+    def __init__(self, elem):
+        self.elem = elem
+
+    def element(self):
+        return self.elem
+
+class Residue(object):
+    def __init__(self, atoms):
+        self.atoms = atoms
+
+    def natoms(self):
+        return len(self.atoms)
+
+    def xyz(self, j):
+        return Vector(self.atoms["xyz"][j - 1])
+
+    def atom_name(self, j):
+        return self.atoms["name"][j - 1]
+
+    def atom_type(self, j):
+        return AtomType(self.atoms["elem"][j - 1])
+
+    def name3(self):
+        return self.atoms["resn"][0]
+
+    def is_polymer(self):
+        return not self.atoms["hetflag"][0]
+
+class PDBInfo(object):
+    def __init__(self, residues):
+        self.residues = residues
+
+    def chain(self, i):
+        return self.residues[i - 1].atoms["chain"][0]
+
+    def number(self, i):
+        return int(self.residues[i - 1].atoms["resi"][0])
+
+    def icode(self, i):
+        return self.residues[i - 1].atoms["icode"][0]
+
+class Energies(object):
+    def energies_updated(self):
+        return False
+
+class Pose(object):
+    """Minimal stand-in for rosetta.core.pose.Pose backed by an atom table."""
+
+    def __init__(self, atoms, secstruct):
+        starts = numpy.flatnonzero(numpy.diff(atoms["residue_number"])) + 1
+        self.residues = [Residue(a) for a in numpy.split(atoms.copy(), starts)]
+        self.ss_string = secstruct
+
+    def n_residue(self):
+        return len(self.residues)
+
+    def residue(self, i):
+        return self.residues[i - 1]
+
+    def chain(self, i):
+        return int(self.residues[i - 1].atoms["chain_number"][0]) + 1
+
+    def pdb_info(self):
+        return PDBInfo(self.residues)
+
+    def sequence(self):
+        return "A" * len(self.residues)
+
+    def secstruct(self):
+        return self.ss_string
+
+    def energies(self):
+        return Energies()
+
+def make_pose():
+    atoms = parse_pdb_atoms(test_pdb_data)
+    atoms = atoms[atoms["residue_number"] < 10]
+    return atoms, Pose(atoms, "LHHHHLEEEL")
+
+def test_pose_atom_table():
+    atoms, pose = make_pose()
+
+    pose_atoms = rosetta_pose.pose_atom_table(pose)
+    for field in ("name", "elem", "resn", "chain", "resi", "icode", "residue_number", "chain_number", "xyz"):
+        numpy.testing.assert_array_equal(pose_atoms[field], atoms[field])
+
+def test_pose_fingerprint_covers_all_atoms_and_secstruct():
+    atoms, pose = make_pose()
+    fingerprint = rosetta_pose.pose_fingerprint(pose)
+    assert rosetta_pose.pose_fingerprint(pose) == fingerprint
+
+    # Side chain atom, not the first atom of its residue
+    pose.residue(3).atoms["xyz"][-1] += 0.25
+    moved = rosetta_pose.pose_fingerprint(pose)
+    assert moved != fingerprint
+
+    pose.ss_string = "LLLLLLLLLL"
+    assert rosetta_pose.pose_fingerprint(pose) != moved
+
+def test_pose_display_uses_moved_conformation():
+    atoms, pose = make_pose()
+    first = pose_display(pose)
+
+    pose.residue(3).atoms["xyz"][-1] += 0.25
+    second = pose_display(pose)
+
+    assert second.transport == "binary"
+    assert not "pdb_string" in second._structure
+    assert not numpy.array_equal(first.atom_table["xyz"], second.atom_table["xyz"])
+    second.structure_payload()
+    assert not "pdb_string" in second._structure
@@ -0,0 +1,107 @@
+import itertools
+
+import numpy
+
+import pytest
+
+from ipython_glmol.atom_table import parse_pdb_atoms
+from ipython_glmol.benchmarks import synthetic_structure
+from ipython_glmol.selection_engine import SelectionEngine, type_selector_columns, backbone_atom_names
+from ipython_glmol.glmol_selectors import (
+    All, Chain, ChainNumber, Residue, ResidueNumber, Atom, Carbon, Heavyatom, Backbone)
+
+def selection_ranges(selection):
+    """Inclusive (low, high) ranges of a type selector selection."""
+    if isinstance(selection, slice):
+        return [(selection.start, selection.stop)]
+    elif isinstance(selection, (tuple, list)):
+        return [r for s in selection for r in selection_ranges(s)]
+    else:
+        return [(selection, selection)]
+
+def brute_force_mask(atoms, selector):
+    """Per-atom evaluation of type selector and its subselections."""
+    if isinstance(selector, All):
+        ranges = None
+    else:
+        column = type_selector_columns[selector.selector_name]
+        ranges = selection_ranges(selector.selection)
+
+    subselectors = {
+        "elem C" : lambda a: a["elem"] == "C",
+        "heavy" : lambda a: a["elem"] != "H",
+        "bb" : lambda a: a["name"] in backbone_atom_names,
+    }
+
+    mask = numpy.zeros(len(atoms), dtype=bool)
+    for i, a in enumerate(atoms):
+        selected = ranges is None or any(low <= a[column] <= high for low, high in ranges)
+        mask[i] = selected and all(subselectors[s.selector](a) for s in selector.subselections)
+
+    return mask
+
+@pytest.fixture(scope="module", params=["sorted", "shuffled"])
+def atoms(request):
+    atoms = parse_pdb_atoms(synthetic_structure(3000)[0])
+    # Second chain and hydrogens exercise the chain and heavy atom selectors
+    atoms["chain"][len(atoms) // 2:] = "B"
+    atoms["chain_number"][len(atoms) // 2:] = 1
+    atoms["elem"][::7] = "H"
+    if request.param == "shuffled":
+        atoms = atoms[numpy.random.RandomState(0).permutation(len(atoms))]
+    return atoms
+
+type_selectors = [
+    All(),
+    Chain["A"],
+    Chain[["B", "A"]],
+    Chain["Z"],
+    ChainNumber[1],
+    Residue[5],
+    Residue[[1, slice(10, 20), 47]],
+    Residue[-3:2],
+    ResidueNumber[0],
+    ResidueNumber[[slice(3, 8), slice(6, 12), 90]],
+    ResidueNumber[200:100],
+    Atom[[1, slice(50, 120), 2999, 5000]],
+]
+
+subselections = [(), (Carbon(),), (Heavyatom(),), (Backbone(),), (Backbone(), Heavyatom())]
+
+@pytest.mark.parametrize("selector, subselection", list(itertools.product(type_selectors, subselections)))
+def test_mask_matches_brute_force(atoms, selector, subselection):
+    for s in subselection:
+        selector = selector + s
+
+    engine = SelectionEngine(atoms)
+    expected = brute_force_mask(atoms, selector)
+
+    numpy.testing.assert_array_equal(engine.mask(selector), expected)
+    numpy.testing.assert_array_equal(engine.mask(selector.glmol_selection_string), expected)
+    assert engine.count(selector) == expected.sum()
+
+def test_ranges_cover_mask(atoms):
+    engine = SelectionEngine(atoms)
+    selector = ResidueNumber[[slice(3, 8), 90]] + Backbone()
+
+    covered = numpy.zeros(len(atoms), dtype=bool)
+    for start, stop in engine.ranges(selector):
+        assert not covered[start:stop].any()
+        covered[start:stop] = True
+
+    numpy.testing.assert_array_equal(covered, engine.mask(selector))
+
+def test_masks_are_cached_and_read_only(atoms):
+    engine = SelectionEngine(atoms)
+    mask = engine.mask(Chain["A"] + Carbon())
+
+    assert engine.mask("chain A; elem C") is mask
+    with pytest.raises(ValueError):
+        mask[0] = not mask[0]
+
+def test_unknown_selectors(atoms):
+    engine = SelectionEngine(atoms)
+    with pytest.raises(ValueError):
+        engine.mask("unknown 1")
+    with pytest.raises(ValueError):
+        engine.mask("chain A; unknown")
@@ -0,0 +1,67 @@
+import os
+from os import path
+
+from ipython_glmol import setup_js
+
+def write_sources(tmpdir, n):
+    sources = []
+    for i in range(n):
+        source = tmpdir.join("source_%i.js" % i)
+        source.write("var GLmol = %i;\n" % i + " " * 1000)
+        sources.append(str(source))
+    return sources
+
+def test_render_js_cache_evicts_least_recently_used(tmpdir, monkeypatch):
+    cache_dir = tmpdir.mkdir("cache")
+    monkeypatch.setattr(setup_js, "render_cache_max_bytes", 2500)
+    monkeypatch.setattr(setup_js, "_rendered_js", {})
+
+    sources = write_sources(tmpdir, 4)
+    renders = []
+    for i, source in enumerate(sources):
+        rendered = setup_js.render_js([source], cache_dir = str(cache_dir))
+        assert "var GLmol = %i;" % i in rendered
+
+        render_file = path.join(str(cache_dir), "GLmol.render.%s.js" % setup_js.library_digest([source]))
+        assert path.exists(render_file)
+        os.utime(render_file, (i, i))
+        renders.append(render_file)
+
+    assert [path.exists(f) for f in renders] == [False, False, True, True]
+
+def test_render_js_cache_hit_marks_recent(tmpdir, monkeypatch):
+    cache_dir = tmpdir.mkdir("cache")
+    monkeypatch.setattr(setup_js, "render_cache_max_bytes", 2500)
+
+    sources = write_sources(tmpdir, 3)
+    renders = []
+    for i, source in enumerate(sources[:2]):
+        monkeypatch.setattr(setup_js, "_rendered_js", {})
+        setup_js.render_js([source], cache_dir = str(cache_dir))
+        render_file = path.join(str(cache_dir), "GLmol.render.%s.js" % setup_js.library_digest([source]))
+        os.utime(render_file, (i, i))
+        renders.append(render_file)
+
+    # Re-reading the oldest render marks it recently used
+    monkeypatch.setattr(setup_js, "_rendered_js", {})
+    setup_js.render_js([sources[0]], cache_dir = str(cache_dir))
+    setup_js.render_js([sources[2]], cache_dir = str(cache_dir))
+
+    assert [path.exists(f) for f in renders] == [True, False]
+
+def test_install_removes_stale_libraries(tmpdir, monkeypatch):
+    monkeypatch.setattr(setup_js, "render_cache_max_bytes", None)
+    monkeypatch.setattr(setup_js, "_rendered_js", {})
+    monkeypatch.setattr(setup_js, "render_cache_dir", str(tmpdir.mkdir("cache")))
+    profile_dir = tmpdir.mkdir("profile")
+    library_dir = path.join(str(profile_dir), "static", "glmol")
+
+    urls = []
+    for source in write_sources(tmpdir, 2):
+        monkeypatch.setattr(setup_js, "source_libraries", [source])
+        urls.append(setup_js.install_ipython_js(str(profile_dir)))
+
+    assert urls[0] != urls[1]
+    os.mkdir(path.join(library_dir, "other"))
+    open(path.join(library_dir, "GLmol.custom.js"), "w").close()
+    assert sorted(os.listdir(library_dir)) == sorted(["GLmol.custom.js", "other", path.basename(urls[1])])
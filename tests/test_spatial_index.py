@@ -0,0 +1,113 @@
+import numpy
+
+import pytest
+
+from ipython_glmol.atom_table import atom_dtype
+from ipython_glmol.glmol_selectors import Within, Interface, Chain
+from ipython_glmol.selection_engine import SelectionEngine
+from ipython_glmol.spatial_index import CellList
+
+def brute_force_pairs(xyz, query_xyz, distance):
+    d2 = ((query_xyz[:, None, :] - xyz[None, :, :]) ** 2).sum(axis=2)
+    return set(zip(*numpy.nonzero(d2 <= distance ** 2)))
+
+def lattice(n, spacing):
+    """Points on a cubic lattice, placing points on cell boundaries and at exactly the query distance."""
+    steps = numpy.arange(n) * spacing
+    return numpy.stack(numpy.meshgrid(steps, steps, steps, indexing="ij"), axis=-1).reshape((-1, 3))
+
+@pytest.fixture(params = ["lattice", "random"])
+def points(request):
+    if request.param == "lattice":
+        return lattice(6, 2.5)
+    else:
+        random = numpy.random.RandomState(0)
+        xyz = random.uniform(0, 20, (600, 3))
+        # Snap some points to cell boundaries
+        xyz[::5] = numpy.round(xyz[::5] / 5.0) * 5.0
+        return xyz
+
+@pytest.mark.parametrize("distance", [0.0, 2.5, 4.99, 5.0, 7.5, 12.0])
+def test_pairs_match_brute_force(points, distance):
+    index = CellList(points, cell_size = 5.0)
+
+    # Query points at indexed atoms, on boundaries, and outside the index bounds
+    query_xyz = numpy.concatenate([points[::3], lattice(3, 5.0) - 2.5, [[-5.0, -5.0, -5.0], [25.0, 10.0, -0.1]]])
+    index.chunk_size = 7
+
+    query_indices, atom_indices = index.pairs(query_xyz, distance)
+    pairs = zip(query_indices.tolist(), atom_indices.tolist())
+
+    assert len(pairs) == len(set(pairs))
+    assert set(pairs) == brute_force_pairs(points, query_xyz, distance)
+
+def test_within_mask_and_near_cells(points):
+    index = CellList(points, cell_size = 5.0)
+    of_mask = numpy.zeros(len(points), dtype=bool)
+    of_mask[:len(points) // 4] = True
+
+    expected = numpy.zeros(len(points), dtype=bool)
+    expected[[a for _, a in brute_force_pairs(points, points[of_mask], 5.0)]] = True
+
+    numpy.testing.assert_array_equal(index.within_mask(points[of_mask], 5.0), expected)
+    assert not (expected & ~index.near_cells(of_mask, 5.0)).any()
+
+def dilated_cells(index, atom_mask, distance):
+    """Cells within the neighbor offsets of the occupied cells of atom_mask atoms, by cell coordinates."""
+    cells = index.cells(index.xyz)
+    near = set()
+    for cell in set(map(tuple, cells[atom_mask])):
+        near.update(map(tuple, numpy.array(cell) + index.neighbor_offsets(distance)))
+    return numpy.array([tuple(c) in near for c in cells], dtype=bool)
+
+@pytest.mark.parametrize("distance", [0.0, 5.0, 12.0])
+def test_near_cells_match_dilated_cells(points, distance):
+    index = CellList(points, cell_size = 5.0)
+    random = numpy.random.RandomState(1)
+
+    for of_mask in (random.uniform(size = len(points)) < 0.05, numpy.zeros(len(points), dtype=bool)):
+        numpy.testing.assert_array_equal(index.near_cells(of_mask, distance), dilated_cells(index, of_mask, distance))
+
+def test_near_cells_of_distant_clusters():
+    # Cell grid of 2e4 ** 3 cells, near cells are found from the occupied cells only
+    cluster = lattice(3, 1.5)
+    points = numpy.concatenate([cluster, cluster + 1e5, cluster + (1e5, 0, 0)])
+    index = CellList(points, cell_size = 5.0)
+
+    of_mask = numpy.zeros(len(points), dtype=bool)
+    of_mask[0] = True
+    numpy.testing.assert_array_equal(index.near_cells(of_mask, 5.0), numpy.arange(len(points)) < len(cluster))
+
+    expected = numpy.zeros(len(points), dtype=bool)
+    expected[[a for _, a in brute_force_pairs(points, points[of_mask], 3.0)]] = True
+    numpy.testing.assert_array_equal(index.within_mask(points[of_mask], 3.0), expected)
+
+def test_empty_index():
+    index = CellList(numpy.zeros((0, 3)))
+    query_indices, atom_indices = index.pairs(numpy.zeros((2, 3)), 5.0)
+    assert len(query_indices) == len(atom_indices) == 0
+
+def test_spatial_selectors_match_brute_force(points):
+    atoms = numpy.zeros(len(points), dtype=atom_dtype)
+    atoms["xyz"] = points
+    atoms["serial"] = numpy.arange(1, len(points) + 1)
+    atoms["residue_number"] = numpy.arange(len(points))
+    atoms["resi"] = atoms["residue_number"]
+    atoms["chain"] = numpy.where(points[:, 0] < 7.5, "A", "B")
+    atoms["chain_number"] = atoms["chain"] == "B"
+    engine = SelectionEngine(atoms)
+
+    chain_a = atoms["chain"] == "A"
+    chain_b = ~chain_a
+
+    def near(of_mask, target_mask):
+        mask = numpy.zeros(len(points), dtype=bool)
+        mask[[a for _, a in brute_force_pairs(points, points[of_mask], 5.0)]] = True
+        return mask & target_mask
+
+    numpy.testing.assert_array_equal(
+        engine.mask(Within(5.0, Chain["A"], complete_residues = False)),
+        near(chain_a, numpy.ones(len(points), dtype=bool)))
+    numpy.testing.assert_array_equal(
+        engine.mask(Interface("A", "B", 5.0, complete_residues = False)),
+        near(chain_a, chain_b) | near(chain_b, chain_a))
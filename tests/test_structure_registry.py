@@ -0,0 +1,36 @@
+import pytest
+
+from ipython_glmol import PDBEmbed, glmol_embed, structure_registry
+from ipython_glmol.structure_registry import StructureRegistry
+from ipython_glmol.test_data import test_pdb_data
+
+@pytest.fixture(autouse = True)
+def library_url(monkeypatch):
+    monkeypatch.setattr(glmol_embed, "_glmol_source_library", "/static/glmol/GLmol.js")
+
+def test_outputs_are_self_contained_by_default(monkeypatch):
+    monkeypatch.setattr(structure_registry, "default_registry", None)
+    embed = PDBEmbed(test_pdb_data)
+
+    first = embed.notebook_embed_js("glmol_first")
+    second = embed.notebook_embed_js("glmol_second")
+
+    assert "glmol_first_encoded_payload" in first
+    assert "glmol_second_encoded_payload" in second
+    for output_js in (first, second):
+        assert not "cached_structure(" in output_js
+    assert second.replace("glmol_second", "glmol_first") == first
+
+def test_registry_sends_structure_once(monkeypatch):
+    registry = StructureRegistry()
+    monkeypatch.setattr(structure_registry, "default_registry", registry)
+    embed = PDBEmbed(test_pdb_data)
+
+    first = embed.notebook_embed_js("glmol_first")
+    second = embed.notebook_embed_js("glmol_second")
+
+    assert len(registry) == 1
+    assert "store_structure(" in first
+    assert not "store_structure(" in second
+    assert "cached_structure(" in second
+    assert len(second) < len(first)
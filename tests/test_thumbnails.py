@@ -0,0 +1,76 @@
+import io
+import os
+
+import numpy
+import matplotlib.image
+
+from ipython_glmol import PDBEmbed, thumbnails
+from ipython_glmol.thumbnails import render_png, render_thumbnails, thumbnail_key
+from ipython_glmol.glmol_repr import Ribbon, Stick, BackgroundColor, PropertyColor
+from ipython_glmol.glmol_selectors import Chain
+from ipython_glmol.test_data import test_pdb_data
+
+def decode_png(png):
+    """uint8 rgb image (height, width, 3) of PNG data."""
+    assert png.startswith("\x89PNG\r\n\x1a\n")
+    return numpy.round(matplotlib.image.imread(io.BytesIO(png), format = "png") * 255).astype(numpy.uint8)
+
+def test_render_png_dimensions_and_background():
+    for background, rgb in (("#ffffff", (255, 255, 255)), ("#204060", (0x20, 0x40, 0x60))):
+        embed = PDBEmbed(test_pdb_data) + Ribbon() + BackgroundColor(background)
+        image = decode_png(render_png(embed, width = 64, height = 48))
+
+        assert image.shape == (48, 64, 3)
+        for corner in (image[0, 0], image[0, -1], image[-1, 0], image[-1, -1]):
+            assert tuple(corner) == rgb
+
+        # Structure is centered and scaled to fit the image
+        rows, columns = numpy.nonzero((image != rgb).any(axis = -1))
+        assert rows.min() > 0 and rows.max() < 47 and columns.min() > 0 and columns.max() < 63
+        assert max((rows.max() - rows.min()) / 48.0, (columns.max() - columns.min()) / 64.0) > 0.8
+        assert abs((rows.min() + rows.max()) / 2.0 - 24) < 6 and abs((columns.min() + columns.max()) / 2.0 - 32) < 6
+
+    # GLmol default black background
+    image = decode_png(render_png(PDBEmbed(test_pdb_data) + Ribbon(), width = 32, height = 32))
+    assert tuple(image[0, 0]) == (0, 0, 0)
+
+def test_empty_repr_renders_background():
+    image = decode_png(render_png(PDBEmbed(test_pdb_data) + BackgroundColor("#ffffff"), width = 16, height = 8))
+    assert image.shape == (8, 16, 3) and (image == 255).all()
+
+def test_thumbnail_key():
+    view = dict(width = 64, height = 64)
+    key = thumbnail_key(PDBEmbed(test_pdb_data) + Ribbon(), view)
+
+    # Deterministic across embeds of the same structure and modifiers
+    assert thumbnail_key(PDBEmbed(test_pdb_data) + Ribbon(), dict(view)) == key
+    assert thumbnail_key(PDBEmbed(test_pdb_data) + Ribbon(), dict(view, rotation = [0, 0, 0], zoom = 1.0)) == key
+
+    # Changed by the modifier stack, property colors and view
+    changed = [
+        thumbnail_key(PDBEmbed(test_pdb_data) + Ribbon() + Stick(Chain["A"]), view),
+        thumbnail_key(PDBEmbed(test_pdb_data) + Ribbon() + BackgroundColor("#ffffff"), view),
+        thumbnail_key(PDBEmbed(test_pdb_data) + Ribbon() + PropertyColor("b"), view),
+        thumbnail_key(PDBEmbed(test_pdb_data) + Ribbon(), dict(view, width = 32)),
+        thumbnail_key(PDBEmbed(test_pdb_data) + Ribbon(), dict(view, rotation = (90, 0, 0))),
+    ]
+    assert len(set(changed + [key])) == len(changed) + 1
+
+def test_render_thumbnails_cache_hit(tmpdir, monkeypatch):
+    cache_dir = str(tmpdir.join("cache"))
+    embed = PDBEmbed(test_pdb_data) + Ribbon()
+
+    first = render_thumbnails([("first", embed)], str(tmpdir.join("out")), processes = 0, cache_dir = cache_dir, width = 48, height = 48)
+    assert (first["thumbnails"], first["cached"]) == (1, 0)
+    assert os.listdir(cache_dir) == ["%s.png" % thumbnail_key(embed, dict(width = 48, height = 48))]
+
+    def render_png(embed, **view):
+        raise AssertionError("Cached thumbnail rendered again.")
+    monkeypatch.setattr(thumbnails, "render_png", render_png)
+
+    repeat = render_thumbnails([("repeat", PDBEmbed(test_pdb_data) + Ribbon())], str(tmpdir.join("out")),
+        processes = 0, cache_dir = cache_dir, width = 48, height = 48)
+    assert (repeat["thumbnails"], repeat["cached"]) == (1, 1)
+    assert repeat["bytes"] == first["bytes"]
+    assert tmpdir.join("out", "repeat.png").read("rb") == tmpdir.join("out", "first.png").read("rb")
+    assert decode_png(tmpdir.join("out", "repeat.png").read("rb")).shape == (48, 48, 3)
@@ -0,0 +1,59 @@
+import numpy
+
+import pytest
+
+from ipython_glmol import live
+from ipython_glmol.trajectory import TrajectoryEmbed, LiveTrajectory, encode_frame_chunk, parse_pdb_models
+from ipython_glmol.test_data import test_pdb_data
+
+def test_trajectory_without_frames():
+    with pytest.raises(ValueError):
+        TrajectoryEmbed(test_pdb_data, numpy.zeros((0, 0, 3)))
+
+    topology, frames = parse_pdb_models(test_pdb_data)
+    with pytest.raises(ValueError):
+        TrajectoryEmbed(topology, frames[:0])
+
+def test_encode_empty_frame_chunk():
+    frames = numpy.zeros((2, 0, 3), dtype=numpy.float32)
+    assert encode_frame_chunk(frames, frames[0], 0, 2, 1e-2)["encoding"] == "int16"
+
+def test_trajectory_data():
+    topology, frames = parse_pdb_models(test_pdb_data)
+    frames = numpy.concatenate([frames, frames + 0.5, frames + 1e5])
+
+    data = TrajectoryEmbed(topology, frames, chunk_size = 2).trajectory_data()
+    assert data["n_frames"] == 3
+    assert [(c["start"], c["stop"], c["encoding"]) for c in data["chunks"]] == [(0, 2, "int16"), (2, 3, "float32")]
+
+class RecordingComm(object):
+    def __init__(self):
+        self.sent = []
+        self.handler = None
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def on_msg(self, handler):
+        self.handler = handler
+
+    def close(self):
+        pass
+
+def test_frames_requested_over_frontend_comm(monkeypatch):
+    def open_comm(data = None):
+        raise AssertionError("Kernel comm opened before the frontend registered its target.")
+
+    monkeypatch.setattr(live, "open_comm", open_comm)
+
+    topology, frames = parse_pdb_models(test_pdb_data)
+    embed = TrajectoryEmbed(topology, numpy.concatenate([frames, frames + 0.5, frames + 1.0]), chunk_size = 2)
+    handle = LiveTrajectory(embed, "glmol_trajectory")
+    live.displayed_embeds["glmol_trajectory"] = embed
+
+    comm = RecordingComm()
+    live.handle_frontend_comm(comm, dict(content = dict(data = dict(type = "open", embed_id = "glmol_trajectory"))))
+    comm.handler(dict(content = dict(data = dict(type = "frames", embed_id = "glmol_trajectory", start = 2))))
+
+    assert comm.sent == [dict(type = "frames", embed_id = "glmol_trajectory", chunk = embed.frame_chunk(2))]
+    assert handle._comm is None